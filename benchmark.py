@@ -0,0 +1,310 @@
+"""
+Benchmark suite: copies synthetic trees through CopyExecutorController and
+reports throughput, per-file and per-batch latency, CPU time and peak RSS as JSON.
+
+    python benchmark.py [--scale 0.1] [--workers 1 4 16] [--modes copy sync verify]
+                        [--output results.json] [--compare baseline.json]
+
+Trees are generated once in a temp directory; every (scenario, workers, mode)
+case then runs in its own child process so peak RSS and CPU time belong to
+that case alone. Page cache is left warm: compare runs on the same machine.
+Small files travel in BATCH units, which are timed as a whole: they show up
+in batch_latency_ms and carry no per-file latency.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# name -> description of the synthetic tree at scale 1.0
+SCENARIOS = {
+    "tiny": {"files": 20000, "min_size": 0, "max_size": 4 * 1024, "depth": 2, "fanout": 20},
+    "mixed": {"files": 5000, "min_size": 1024, "max_size": 64 * 1024 * 1024, "depth": 3, "fanout": 8},
+    "huge": {"files": 3, "min_size": 512 * 1024 * 1024, "max_size": 512 * 1024 * 1024, "depth": 0, "fanout": 1},
+    "deep": {"files": 2000, "min_size": 0, "max_size": 16 * 1024, "depth": 40, "fanout": 1},
+}
+
+# mode -> CopyExecutorController keyword arguments (and how the case is driven)
+MODES = {
+    "copy": {},
+    "sync": {},                                   # Second pass over an identical destination
+    "verify": {"verify": "readback"},
+    "no-batch": {"small_file_threshold": None},
+    "no-split": {"split_threshold": None},
+    "dedup": {"dedup": "hardlink"},               # Same-size files of a synthetic tree share their content
+    "no-reflink": {"reflink": False},             # Stream data even on a filesystem that could clone it
+    "fadvise": {"fadvise": True},                 # Drop copied pages from the page cache
+    "direct": {"direct_io_threshold": 16 * 1024 * 1024},  # O_DIRECT for files >= 16MB
+    "fsync-file": {"fsync": "file"},              # Durability costs: fsync every file...
+    "fsync-batch": {"fsync": "batch"},            # ...in background batches...
+    "fsync-end": {"fsync": "end"},                # ...or once the queue drains
+}
+
+DEFAULT_WORKERS = [1, 4, 16]
+DEFAULT_MODES = ["copy", "sync", "verify"]
+WRITE_CHUNK = 4 * 1024 * 1024
+
+
+# --- Tree generation ---
+
+def _sizes(spec: dict, scale: float, rng: random.Random) -> list:
+    """File sizes for a scenario: log-uniform between min_size and max_size (uniform from 0)."""
+    count, lo, hi = spec["files"], spec["min_size"], spec["max_size"]
+    if count > 10:
+        count = max(1, int(count * scale))
+    else:
+        # A few huge files: scale their size instead of their number
+        lo, hi = int(lo * scale), int(hi * scale)
+    if lo == hi:
+        return [lo] * count
+    if lo == 0:
+        return [rng.randint(0, hi) for _ in range(count)]
+    return [int(math.exp(rng.uniform(math.log(lo), math.log(hi)))) for _ in range(count)]
+
+
+def _directories(root: str, depth: int, fanout: int) -> list:
+    """Leaf directories of a tree `depth` levels deep with `fanout` children per level."""
+    if depth == 0:
+        return [root]
+    dirs = [root]
+    for level in range(depth):
+        children = []
+        for parent in dirs:
+            for i in range(fanout):
+                children.append(os.path.join(parent, f"d{level}_{i}"))
+        dirs = children if len(children) <= 4096 else children[:4096]
+    return dirs
+
+
+def generate_tree(root: str, spec: dict, scale: float, seed: int = 0) -> tuple[int, int]:
+    """Writes a synthetic tree; returns (files, bytes)."""
+    rng = random.Random(seed)
+    leaves = _directories(root, spec["depth"], spec["fanout"])
+    for path in leaves:
+        os.makedirs(path, exist_ok=True)
+    block = os.urandom(WRITE_CHUNK)  # Incompressible data so reflink/dedup-free paths are measured
+
+    files = total = 0
+    for i, size in enumerate(_sizes(spec, scale, rng)):
+        path = os.path.join(leaves[i % len(leaves)], f"f{i}.bin")
+        with open(path, "wb") as f:
+            remaining = size
+            while remaining > 0:
+                n = min(remaining, WRITE_CHUNK)
+                f.write(block[:n])
+                remaining -= n
+        files += 1
+        total += size
+    return files, total
+
+
+# --- One case (runs in a child process) ---
+
+def _percentile(values: list, fraction: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+BATCH_TYPES = ("BATCH", "DEDUP")  # Units that carry several files
+
+
+def _instrument(manager_class, latencies: dict):
+    """
+    Records unit latency (dequeue to completion) into `latencies` by wrapping
+    the task hand-out and completion of `manager_class`: "file" for
+    single-file and range units, "batch" for whole batch / dedup units, whose
+    files are not timed one by one. The class is patched before the
+    controller starts its workers, so the first unit each worker takes is
+    timed too. Returns a function undoing the patch.
+    """
+    started = {}
+    get_next_task, task_complete = manager_class.get_next_task, manager_class.task_complete
+
+    def timed_get(manager, worker_id=None):
+        task = get_next_task(manager, worker_id)
+        if task is not None and task.get("parent") is not None:  # Not the planning task
+            started[task["fp"]] = (time.perf_counter(), task["type"] in BATCH_TYPES)
+        return task
+
+    def timed_complete(manager, fp, bytes_count=0, items=1, digest=None, skipped=0):
+        start = started.pop(fp, None)
+        if start is not None:
+            start, batch = start
+            latencies["batch" if batch else "file"].append(time.perf_counter() - start)
+        return task_complete(manager, fp, bytes_count, items, digest, skipped)
+
+    manager_class.get_next_task = timed_get
+    manager_class.task_complete = timed_complete
+
+    def restore():
+        manager_class.get_next_task = get_next_task
+        manager_class.task_complete = task_complete
+    return restore
+
+
+def _latency_ms(values: list) -> dict:
+    return {
+        "count": len(values),
+        "p50": round(_percentile(values, 0.50) * 1000, 3) if values else None,
+        "p99": round(_percentile(values, 0.99) * 1000, 3) if values else None,
+    }
+
+
+def _copy(source: str, destination: str, workers: int, options: dict, op_type="COPY", latencies=None):
+    from copy_manager import CopyExecutorController
+    from queue_manager import QueueManager
+
+    restore = _instrument(QueueManager, latencies) if latencies is not None else None
+    try:
+        controller = CopyExecutorController(max_workers=workers, **options)
+        manager = controller.manager
+        controller.submit_task(source, destination, op_type)
+        controller.start()
+        while manager.get_status() != (manager.STATE_IDLE, 0):
+            manager.progress_channel.drain()
+            time.sleep(0.01)
+        controller.stop()
+    finally:
+        if restore is not None:
+            restore()
+    return manager
+
+
+def run_case(source: str, workers: int, mode: str) -> dict:
+    """Copies `source` once with the given settings and measures it."""
+    destination = tempfile.mkdtemp(prefix="bench-dst-")
+    options = dict(MODES[mode])
+    try:
+        if mode == "sync":
+            _copy(source, destination, workers, options)
+
+        latencies = {"file": [], "batch": []}
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        manager = _copy(source, destination, workers, options, "SYNC" if mode == "sync" else "COPY", latencies)
+        elapsed = time.perf_counter() - start
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    finally:
+        shutil.rmtree(destination, ignore_errors=True)
+
+    files = manager.total_items_completed
+    copied = manager.total_bytes_processed
+    return {
+        "workers": workers,
+        "mode": mode,
+        "seconds": round(elapsed, 4),
+        "files": files,
+        "bytes": copied,
+        "skipped": manager.total_items_skipped,
+        "errors": manager.total_errors,
+        "mb_per_s": round(copied / elapsed / 2**20, 2) if elapsed else None,
+        "files_per_s": round(files / elapsed, 1) if elapsed else None,
+        "latency_ms": _latency_ms(latencies["file"]),
+        "batch_latency_ms": _latency_ms(latencies["batch"]),
+        "cpu_seconds": round((usage_after.ru_utime - usage_before.ru_utime)
+                             + (usage_after.ru_stime - usage_before.ru_stime), 3),
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        "peak_rss_mb": round(usage_after.ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10), 1),
+    }
+
+
+# --- Orchestration ---
+
+def _spawn_case(source: str, workers: int, mode: str) -> dict:
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-case", source, str(workers), mode],
+                         capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if out.returncode != 0:
+        return {"workers": workers, "mode": mode, "failed": out.stderr.strip().splitlines()[-1:]}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """Cases whose MB/s or files/s fell more than `tolerance` below the baseline."""
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["workers"], r["mode"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get((result["scenario"], result["workers"], result["mode"]))
+        if not before or "failed" in result or "failed" in before:
+            continue
+        for metric in ("mb_per_s", "files_per_s"):
+            if before.get(metric) and result.get(metric) is not None \
+                    and result[metric] < before[metric] * (1 - tolerance):
+                regressions.append({"scenario": result["scenario"], "workers": result["workers"],
+                                    "mode": result["mode"], "metric": metric,
+                                    "baseline": before[metric], "current": result[metric]})
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark copy throughput on synthetic trees.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--workers", nargs="+", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=DEFAULT_MODES)
+    parser.add_argument("--scale", type=float, default=0.1,
+                        help="Size factor for the trees (1.0 = full size, several GB)")
+    parser.add_argument("--tmpdir", help="Where to generate trees (default: system temp dir)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="Fail if throughput regressed against this report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown with --compare (0.10 = 10%%)")
+    parser.add_argument("--run-case", nargs=3, metavar=("SOURCE", "WORKERS", "MODE"), help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.run_case:
+        source, workers, mode = args.run_case
+        print(json.dumps(run_case(source, int(workers), mode)))
+        return 0
+
+    root = tempfile.mkdtemp(prefix="bench-src-", dir=args.tmpdir)
+    results = []
+    try:
+        for name in args.scenarios:
+            source = os.path.join(root, name)
+            files, size = generate_tree(source, SCENARIOS[name], args.scale)
+            for workers in args.workers:
+                for mode in args.modes:
+                    result = {"scenario": name, "tree_files": files, "tree_bytes": size}
+                    result.update(_spawn_case(source, workers, mode))
+                    results.append(result)
+                    print(f"{name:6} workers={workers:<3} {mode:8} "
+                          f"{result.get('mb_per_s')} MB/s {result.get('files_per_s')} files/s", file=sys.stderr)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "scale": args.scale,
+        "latency": "latency_ms: dequeue to completion of single-file and range units; batch_latency_ms: of whole "
+                   "BATCH / DEDUP units, whose files carry no per-file latency",
+        "results": results,
+    }
+    exit_code = 0
+    if args.compare:
+        report["regressions"] = compare(results, args.compare, args.tolerance)
+        exit_code = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Headless entry point: runs copy jobs through CopyExecutorController without Tk.
+
+    python cli.py SRC [SRC ...] DEST [--mirror DEST2] [--workers 8] [--sync] [--verify readback] [--jsonl]
+
+Never imports tkinter or gui_app, so it works on servers without a display.
+"""
+import argparse
+import json
+import sys
+import time
+
+from copy_manager import CopyExecutorController
+from scheduler import PRIORITY_WEIGHTS, DEFAULT_PRIORITY
+from copy_engine import (SPLIT_THRESHOLD, SMALL_FILE_THRESHOLD, VERIFY_SOURCE, VERIFY_READBACK,
+                         DEDUP_HARDLINK, DEDUP_REFLINK, FSYNC_FILE, FSYNC_BATCH, FSYNC_END,
+                         FSYNC_EVERY_FILES, FSYNC_EVERY_BYTES)
+from utils import format_bytes, format_time, parse_bytes
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Copy folders without the GUI.")
+    parser.add_argument("paths", nargs="*", metavar="PATH",
+                        help="One or more sources followed by the destination folder")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Worker threads (default: 4)")
+    parser.add_argument("--auto-tune", action="store_true",
+                        help="Tune active workers to measured throughput (--workers becomes the cap)")
+    parser.add_argument("--sync", action="store_true", help="Incremental sync: skip unchanged files")
+    parser.add_argument("--mirror", action="append", default=[], metavar="DEST",
+                        help="Also write everything to this folder (repeatable); each source file is read once")
+    parser.add_argument("--priority", choices=list(PRIORITY_WEIGHTS), default=DEFAULT_PRIORITY,
+                        help="Share of the workers these sources get next to other queued jobs")
+    parser.add_argument("--hash-compare", action="store_true",
+                        help="With --sync, compare BLAKE3 digests when only the mtime differs")
+    parser.add_argument("--verify", choices=[VERIFY_SOURCE, VERIFY_READBACK],
+                        help="Digest data while copying (and re-read the destination with 'readback')")
+    parser.add_argument("--dedup", choices=[DEDUP_HARDLINK, DEDUP_REFLINK],
+                        help="Copy identical files once and hard link / reflink the other copies to it")
+    parser.add_argument("--no-reflink", action="store_true",
+                        help="Always copy file data, even where the filesystem could clone it")
+    parser.add_argument("--split-threshold", type=int, default=SPLIT_THRESHOLD,
+                        help="Copy files at least this many bytes as parallel ranges (0 disables)")
+    parser.add_argument("--small-file-threshold", type=int, default=SMALL_FILE_THRESHOLD,
+                        help="Copy files up to this many bytes in batches (0 disables)")
+    parser.add_argument("--fadvise", action="store_true",
+                        help="Keep the copy from flooding the page cache (sequential read-ahead, copied pages dropped)")
+    parser.add_argument("--direct-io", type=parse_bytes, metavar="BYTES",
+                        help="Copy files at least this large with O_DIRECT, bypassing the page cache, e.g. 1G")
+    parser.add_argument("--fsync", choices=[FSYNC_FILE, FSYNC_BATCH, FSYNC_END],
+                        help="Force copied data to disk: after each file, in background batches, or once at the end")
+    parser.add_argument("--fsync-every-files", type=int, default=FSYNC_EVERY_FILES, metavar="N",
+                        help=f"With --fsync batch, sync after this many files (default: {FSYNC_EVERY_FILES})")
+    parser.add_argument("--fsync-every-bytes", type=parse_bytes, default=FSYNC_EVERY_BYTES, metavar="BYTES",
+                        help="With --fsync batch, sync after this many bytes (default: 1G)")
+    parser.add_argument("--max-rate", type=parse_bytes, metavar="BYTES",
+                        help="Cap the write rate into the destination, e.g. 50M (bytes/sec)")
+    parser.add_argument("--max-files-rate", type=float, metavar="N", help="Cap files/sec into the destination")
+    parser.add_argument("--source-max-rate", type=parse_bytes, metavar="BYTES",
+                        help="Cap the read rate from each source device (bytes/sec)")
+    parser.add_argument("--schedule", action="append", default=[], metavar="HH:MM-HH:MM=BYTES",
+                        help="Destination rate cap for a daily time window (repeatable), e.g. 08:00-18:00=20M")
+    parser.add_argument("--journal", metavar="DB", help="Resumable job journal (unfinished jobs are resumed)")
+    parser.add_argument("--hash-index", metavar="DB", help="Persistent digest cache")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between progress reports")
+    parser.add_argument("--jsonl", action="store_true", help="Emit progress as JSON lines on stdout")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve OpenMetrics at http://127.0.0.1:PORT/metrics while running")
+    parser.add_argument("--metrics-dump", metavar="FILE",
+                        help="Write stage latency histograms and worker busy/idle accounting here when done")
+    return parser
+
+
+class Reporter:
+    """Prints backend events either as human-readable lines or as JSON lines."""
+
+    def __init__(self, jsonl: bool):
+        self.jsonl = jsonl
+        self.start_time = time.time()
+
+    def emit(self, event: str, **fields):
+        if self.jsonl:
+            record = {"event": event, "t": round(time.time() - self.start_time, 3)}
+            record.update(fields)
+            sys.stdout.write(json.dumps(record) + "\n")
+            sys.stdout.flush()
+        elif event == "progress":
+            print(f"[{format_time(time.time() - self.start_time)}] "
+                  f"{format_bytes(fields['byte_rate'])}/s | {fields['item_rate']:.1f} items/s | "
+                  f"{format_bytes(fields['total_bytes'])} in {fields['total_items']} files | "
+                  f"workers {fields['concurrency']['workers']} | "
+                  f"queue {fields['queue']} | errors {fields['total_errors']}", flush=True)
+        elif event == "log":
+            print(f" > {fields['message']}", flush=True)
+        elif event == "state":
+            print(f"STATE: {fields['state']}", flush=True)
+
+
+def run(args) -> int:
+    if len(args.paths) == 1 or (not args.paths and not args.journal):
+        print("error: need at least one source and a destination (or --journal to resume)", file=sys.stderr)
+        return 2
+
+    controller = CopyExecutorController(
+        max_workers=args.workers,
+        split_threshold=args.split_threshold or None,
+        sync_hash_compare=args.hash_compare,
+        hash_index_path=args.hash_index,
+        verify=args.verify,
+        journal_path=args.journal,
+        auto_tune=args.auto_tune,
+        metrics_port=args.metrics_port,
+        small_file_threshold=args.small_file_threshold or None,
+        dedup=args.dedup,
+        reflink=not args.no_reflink,
+        fadvise=args.fadvise,
+        direct_io_threshold=args.direct_io,
+        fsync=args.fsync,
+        fsync_every_files=args.fsync_every_files,
+        fsync_every_bytes=args.fsync_every_bytes,
+    )
+    reporter = Reporter(args.jsonl)
+    manager = controller.manager
+
+    if args.paths:
+        *sources, destination = args.paths
+        if args.max_rate or args.max_files_rate:
+            controller.set_limit(destination=destination, bytes_per_sec=args.max_rate,
+                                 files_per_sec=args.max_files_rate)
+        if args.source_max_rate:
+            for source in sources:
+                controller.set_limit(source=source, bytes_per_sec=args.source_max_rate)
+        if args.schedule:
+            rules = []
+            for entry in args.schedule:
+                window, rate = entry.split("=")
+                start, end = window.split("-")
+                rules.append({"start": start, "end": end, "destination": destination,
+                              "bytes_per_sec": parse_bytes(rate)})
+            controller.set_schedule(rules)
+        for source in sources:
+            controller.submit_task(source, [destination] + args.mirror if args.mirror else destination,
+                                   "SYNC" if args.sync else "COPY", args.priority)
+    controller.start()
+
+    bus = manager.progress_channel
+    last_report = 0.0
+
+    def report(events):
+        nonlocal last_report
+        for msg_type, data in events:
+            if msg_type == "LOG":
+                reporter.emit("log", message=data)
+            elif msg_type == "STATE_CHANGE":
+                reporter.emit("state", state=data)
+            elif msg_type == "TASK_DONE":
+                reporter.emit("task_done", fp=data)
+            elif msg_type == "TASK_RESULT":
+                reporter.emit("verified", source=data["source"], destination=data["destination"],
+                              offset=data.get("offset"), size=data["size"], digest=data["digest"])
+            elif msg_type == "TASK_RESULTS_FOLDED":
+                # Too many results to report one by one: their digests are only in the journal
+                reporter.emit("verified_folded", fp=data["job"], count=data["count"])
+            elif msg_type == "METRICS_UPDATE" and time.time() - last_report >= args.interval:
+                last_report = time.time()
+                reporter.emit("progress", queue=manager.get_status()[1], **data)
+
+    try:
+        while True:
+            bus.wait(timeout=args.interval)
+            report(bus.drain())
+
+            state, queued = manager.get_status()
+            if state == manager.STATE_IDLE and queued == 0:
+                break
+    except KeyboardInterrupt:
+        manager.pause()
+        reporter.emit("log", message="Interrupted, pending work stays in the journal" if args.journal
+                      else "Interrupted")
+        controller.stop()
+        return 130
+
+    controller.stop()
+    # Events posted between the last drain and the idle check (last results, task_done, final state)
+    report(bus.drain())
+    if args.metrics_dump:
+        controller.dump_metrics(args.metrics_dump)
+    bytes_cloned, _ = controller.engine.byte_counts()
+    io = controller.engine.io_stats()
+    reporter.emit("summary", total_bytes=manager.total_bytes_processed, total_items=manager.total_items_completed,
+                  total_skipped=manager.total_items_skipped, total_errors=manager.total_errors,
+                  total_deduplicated=manager.total_items_deduplicated,
+                  bytes_deduplicated=manager.total_bytes_deduplicated, bytes_cloned=bytes_cloned,
+                  bytes_direct=io["bytes_direct"], fsyncs=io["fsyncs"], fsync_seconds=io["fsync_seconds"],
+                  elapsed=round(time.time() - reporter.start_time, 3))
+    if not args.jsonl:
+        cloned = f" ({format_bytes(bytes_cloned)} cloned)" if bytes_cloned else ""
+        print(f"Done: {format_bytes(manager.total_bytes_processed)}{cloned} in {manager.total_items_completed} files "
+              f"({manager.total_items_skipped} unchanged, {manager.total_items_deduplicated} linked, "
+              f"{manager.total_errors} errors) "
+              f"in {format_time(time.time() - reporter.start_time)}")
+    return 1 if manager.total_errors else 0
+
+
+def main(argv=None) -> int:
+    return run(build_parser().parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
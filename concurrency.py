@@ -0,0 +1,149 @@
+import os
+
+# (min, max) concurrent copy streams per device class
+DEVICE_BOUNDS = {
+    "ssd": (2, 32),
+    "hdd": (1, 2),
+    "network": (2, 8),
+    "unknown": (1, 16),
+}
+
+NETWORK_FS_TYPES = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "afs", "9p", "fuse.sshfs", "glusterfs", "ceph", "lustre"}
+
+SETTLE_TICKS = 3     # Metric ticks to wait after a change before judging it (the rate window is 3s)
+TOLERANCE = 0.05     # Relative throughput change treated as noise
+
+_device_cache = {}
+
+
+def _mount_fs_type(path: str):
+    """Filesystem type of the longest /proc/mounts entry containing path (Linux only)."""
+    try:
+        with open("/proc/mounts") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best, best_type = "", None
+    for mount_point, fs_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > len(best):
+            best, best_type = mount_point, fs_type
+    return best_type
+
+
+def classify_device(path: str) -> str:
+    """Returns "ssd", "hdd", "network" or "unknown" for the device holding path."""
+    # The destination may not exist yet: classify its closest existing parent
+    while path and not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    try:
+        dev = os.stat(path).st_dev
+    except OSError:
+        return "unknown"
+    if dev in _device_cache:
+        return _device_cache[dev]
+
+    kind = "unknown"
+    if _mount_fs_type(path) in NETWORK_FS_TYPES:
+        kind = "network"
+    elif hasattr(os, "major"):  # Device numbers are POSIX only (not on Windows)
+        # Partitions expose queue/ on their parent block device
+        base = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+        for candidate in (os.path.join(base, "queue", "rotational"), os.path.join(base, "..", "queue", "rotational")):
+            try:
+                with open(candidate) as f:
+                    kind = "hdd" if f.read().strip() == "1" else "ssd"
+                break
+            except OSError:
+                continue
+
+    _device_cache[dev] = kind
+    return kind
+
+
+def bounds_for(paths) -> tuple[int, int, dict]:
+    """Tightest (min, max) stream bounds over the devices of the given paths, plus path -> device class."""
+    lo, hi = 1, None
+    devices = {}
+    for path in paths:
+        kind = classify_device(path)
+        devices[path] = kind
+        dev_lo, dev_hi = DEVICE_BOUNDS[kind]
+        lo = max(lo, dev_lo)
+        hi = dev_hi if hi is None else min(hi, dev_hi)
+    if hi is None:
+        lo, hi = DEVICE_BOUNDS["unknown"]
+    return min(lo, hi), hi, devices
+
+
+class AdaptiveConcurrency:
+    """
+    Hill-climbing tuner for the number of active copy workers.
+    Fed the rolling byte rate once per metrics tick: keeps moving in the same
+    direction while throughput improves, reverses when it drops, holds on a
+    plateau, and halves the worker count on a collapse (< 50% of the last rate).
+    """
+
+    def __init__(self, initial: int, lo: int = 1, hi: int = 32):
+        self.lo, self.hi = lo, hi
+        self.workers = max(lo, min(hi, initial))
+        self.direction = 1
+        self.last_rate = None
+        self.ticks_since_change = 0
+        self.reason = "initial"
+
+    def set_bounds(self, lo: int, hi: int) -> int:
+        """Applies new per-device bounds; returns the (possibly clamped) worker count."""
+        if (lo, hi) != (self.lo, self.hi):
+            self.lo, self.hi = lo, hi
+            clamped = max(lo, min(hi, self.workers))
+            if clamped != self.workers:
+                self._change(clamped, f"clamped to device bounds [{lo}, {hi}]")
+        return self.workers
+
+    def _change(self, workers: int, reason: str):
+        self.workers = workers
+        self.ticks_since_change = 0
+        self.reason = reason
+
+    def update(self, byte_rate: float) -> int:
+        """Feeds one throughput sample; returns the worker count to use."""
+        self.ticks_since_change += 1
+        if self.ticks_since_change < SETTLE_TICKS or byte_rate <= 0:
+            return self.workers
+
+        last, self.last_rate = self.last_rate, byte_rate
+        if last is None:
+            step = self.direction
+            reason = "probing"
+        elif byte_rate < last * 0.5:
+            self.direction = -1
+            self._change(max(self.lo, self.workers // 2), f"throughput collapsed ({byte_rate:.0f} < {last:.0f} B/s)")
+            return self.workers
+        elif byte_rate > last * (1 + TOLERANCE):
+            step = self.direction
+            reason = "throughput improved"
+        elif byte_rate < last * (1 - TOLERANCE):
+            self.direction = -self.direction
+            step = self.direction
+            reason = "throughput dropped, reversing"
+        else:
+            self.reason = "plateau"
+            return self.workers
+
+        target = self.workers + step
+        if target < self.lo or target > self.hi:
+            # Hit a bound: turn around and probe the other way next time
+            self.direction = -self.direction
+            self.reason = f"at device bound [{self.lo}, {self.hi}]"
+            return self.workers
+        self._change(target, reason)
+        return self.workers
+
+    def snapshot(self) -> dict:
+        return {"workers": self.workers, "min": self.lo, "max": self.hi,
+                "direction": self.direction, "reason": self.reason}
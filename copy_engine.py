@@ -0,0 +1,1442 @@
+import os
+import errno
+import mmap
+import queue
+import shutil
+import stat
+import struct
+import tempfile
+import time
+import threading
+import concurrent.futures
+
+import blake3
+
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks
+    fcntl = None
+
+from utils import hash_file
+from scanner import TreeScanner, KIND_DIR, KIND_SPECIAL, DEFAULT_SCAN_WORKERS
+from instrumentation import (STAGE_OPEN, STAGE_READ, STAGE_WRITE, STAGE_COPY, STAGE_FSYNC,
+                             STAGE_METADATA, STAGE_HASH)
+
+# Size of the reusable userspace buffer used by the readinto() fallback
+BUFFER_SIZE = 1024 * 1024  # 1MB
+# Bytes moved per kernel call (copy_file_range / sendfile) between progress reports
+KERNEL_CHUNK = 8 * 1024 * 1024  # 8MB
+# Files at least this large are split into byte ranges copied by different workers
+SPLIT_THRESHOLD = 1024 * 1024 * 1024  # 1GB
+# Size of each byte range of a split file
+SPLIT_CHUNK_SIZE = 256 * 1024 * 1024  # 256MB
+# Files up to this size are packed into BATCH units copied by one worker in one go
+SMALL_FILE_THRESHOLD = 64 * 1024  # 64KB
+BATCH_MAX_FILES = 256
+BATCH_MAX_BYTES = 8 * 1024 * 1024  # 8MB
+# Bytes of a range copied between durable checkpoints (fdatasync + journal record)
+CHECKPOINT_BYTES = 64 * 1024 * 1024  # 64MB
+# Fan-out copies: a source is read in FANOUT_CHUNK pieces, and each destination's writer may
+# fall at most FANOUT_QUEUE_CHUNKS pieces behind the reader before the reader waits for it
+FANOUT_CHUNK = 1024 * 1024  # 1MB
+FANOUT_QUEUE_CHUNKS = 16
+# With fadvise on, pages of a file already copied are dropped from the cache every this many bytes
+DROP_BEHIND_BYTES = 64 * 1024 * 1024  # 64MB
+# O_DIRECT transfers: offsets, lengths and buffer addresses are multiples of DIRECT_IO_ALIGN
+DIRECT_IO_ALIGN = 4096
+DIRECT_IO_CHUNK = 8 * 1024 * 1024  # 8MB
+# New content is written to a hidden temporary file next to the destination, then renamed over it
+TEMP_SUFFIX = ".part"
+
+# Verification modes for hash-while-copying
+VERIFY_NONE = None
+VERIFY_SOURCE = "source"      # Digest the source stream while copying, record it in the task result
+VERIFY_READBACK = "readback"  # Additionally re-read the destination and compare digests
+
+# Deduplication modes: identical files are copied once, the other copies are made from that copy
+DEDUP_NONE = None
+DEDUP_HARDLINK = "hardlink"  # Hard links (duplicates share one inode, hence one mode and mtime)
+DEDUP_REFLINK = "reflink"    # Copy-on-write clones with their own metadata (btrfs, XFS, ...)
+DEDUP_MIN_SIZE = 1           # Smaller files are never hashed for deduplication (empty files are just created)
+
+# Durability policies: when copied data is forced to disk (the cost shows up as fsync metrics)
+FSYNC_NONE = None       # Left to the OS write-back (fastest; a crash may lose files already reported as copied)
+FSYNC_FILE = "file"     # Each destination file is fsynced by its worker before it is closed (slowest)
+FSYNC_BATCH = "batch"   # A background thread fsyncs finished files every fsync_every_files / fsync_every_bytes
+FSYNC_END = "end"       # A background thread fsyncs every finished file once the queue goes idle
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_FILE, FSYNC_BATCH, FSYNC_END)
+FSYNC_EVERY_FILES = 1000
+FSYNC_EVERY_BYTES = 1024 * 1024 * 1024  # 1GB
+
+FICLONE = 0x40049409       # Linux ioctl: make a file share all extents of another one
+FICLONERANGE = 0x4020940d  # Same for one byte range (struct file_clone_range)
+
+# errno values meaning "this kernel fast path can't handle this pair of files"
+_FALLBACK_ERRNOS = {
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+    errno.ENOTSUP, errno.EBADF, errno.EPERM, errno.ETXTBSY, errno.ENOTSOCK,
+}
+# ...and "this filesystem can't link / clone these two files" (dedup falls back to a copy)
+_LINK_FALLBACK_ERRNOS = _FALLBACK_ERRNOS | {errno.EMLINK, errno.ENOTTY}
+# Clone refusals that hold for every file of a source/destination filesystem pair
+_CLONE_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTTY, errno.ENOSYS}
+
+# Sources are opened non-blocking so that a FIFO (which _open_source then refuses) can't hang a worker;
+# the flag has no effect on regular files
+_SOURCE_FLAGS = os.O_RDONLY | getattr(os, "O_NONBLOCK", 0) | getattr(os, "O_BINARY", 0)
+
+# Batched files get mode and timestamps through their open descriptor where the platform allows it
+# (not on Windows before Python 3.13); elsewhere copystat() runs on the closed temporary file
+_FD_METADATA = hasattr(os, "fchmod") and os.utime in os.supports_fd
+
+# Range copies write at explicit offsets (os.preadv / os.pwrite, missing on Windows)
+_POSITIONAL_IO = hasattr(os, "preadv") and hasattr(os, "pwrite")
+
+_FADV_SEQUENTIAL = getattr(os, "POSIX_FADV_SEQUENTIAL", None)
+_FADV_DONTNEED = getattr(os, "POSIX_FADV_DONTNEED", None)
+
+
+def special_file_error(path: str, mode: int = None) -> shutil.SpecialFileError:
+    """The error reported for a source that is neither a regular file, a directory nor a symlink."""
+    if mode is None:
+        try:
+            mode = os.lstat(path).st_mode
+        except OSError:
+            mode = 0
+    what = ("named pipe" if stat.S_ISFIFO(mode) else "socket" if stat.S_ISSOCK(mode)
+            else "device" if stat.S_ISCHR(mode) or stat.S_ISBLK(mode) else "special file")
+    return shutil.SpecialFileError(errno.EINVAL, f"Skipped: source is a {what}", path)
+
+
+class BackgroundSyncer:
+    """
+    fsyncs finished destination files on a thread of its own (FSYNC_BATCH and
+    FSYNC_END), so workers never wait for the disk. Paths are collected as
+    files finish and synced, followed by the directories holding their
+    entries, in one pass whenever `every_files` files or `every_bytes` bytes
+    are pending (FSYNC_BATCH only) or flush() is called. Until then a crash may lose them.
+    """
+
+    def __init__(self, policy, every_files=FSYNC_EVERY_FILES, every_bytes=FSYNC_EVERY_BYTES, instruments=None,
+                 on_error=None):
+        self.policy = policy
+        self.every_files = every_files
+        self.every_bytes = every_bytes
+        self.instruments = instruments
+        self.on_error = on_error  # on_error(path, OSError)
+        self._cond = threading.Condition()
+        self._pending = {}        # path -> None, in completion order (a split file is added once per range)
+        self._pending_bytes = 0
+        self._directories = {}    # Directories with new entries -> None
+        self._flushing = False
+        self._busy = False
+        self._closed = False
+        self.synced = 0
+        self.sync_ns = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._run, name="fsync", daemon=True)
+        self._thread.start()
+
+    def _due(self) -> bool:
+        return self.policy == FSYNC_BATCH and (len(self._pending) >= self.every_files
+                                               or self._pending_bytes >= self.every_bytes)
+
+    def add(self, path: str, nbytes: int = 0, data: bool = True):
+        """
+        Queues a new destination entry. With data=False (symlinks, hard links,
+        directories) only the directory holding the entry is synced.
+        """
+        with self._cond:
+            if data:
+                self._pending[path] = None
+                self._pending_bytes += nbytes
+            self._directories[os.path.dirname(path)] = None
+            if self._due():
+                self._cond.notify_all()
+
+    def pending(self) -> int:
+        return len(self._pending) + len(self._directories)
+
+    def flush(self, wait: bool = False):
+        """Syncs everything pending now; with wait=True, returns once it is on disk."""
+        with self._cond:
+            if self._pending or self._directories:
+                self._flushing = True
+                self._cond.notify_all()
+            if wait:
+                while self._pending or self._directories or self._busy:
+                    self._cond.wait()
+
+    def close(self):
+        self.flush(wait=True)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._closed or ((self._pending or self._directories)
+                                            and (self._flushing or self._due()))):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                paths, directories = list(self._pending), list(self._directories)
+                self._pending = {}
+                self._directories = {}
+                self._pending_bytes = 0
+                self._flushing = False
+                self._busy = True
+            try:
+                for path in paths:
+                    self._fsync(path)
+                if os.name != "nt":  # New directory entries (Windows can't open a directory for fsync)
+                    for path in directories:
+                        self._fsync(path)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _fsync(self, path: str):
+        start = time.perf_counter_ns()
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            self.errors += 1
+            if self.on_error is not None:
+                self.on_error(path, e)
+            return
+        elapsed = time.perf_counter_ns() - start
+        self.synced += 1
+        self.sync_ns += elapsed
+        if self.instruments is not None:
+            self.instruments.record(STAGE_FSYNC, elapsed)
+
+
+class _FanoutWriter:
+    """
+    Writes one destination of a fan-out copy. Threaded writers drain a bounded
+    queue of chunks (backpressure on the reader); inline writers write at once.
+    A write error is kept in `error` and later chunks are discarded, so a
+    failing destination never stops the others.
+    """
+
+    def __init__(self, engine, fd: int, threaded: bool):
+        self.fd = fd
+        self.written = 0
+        self.error = None
+        self._owner = engine
+        # Writer threads are short-lived, so only inline writes feed the stage histograms
+        self._engine = None if threaded else engine
+        self._queue = None
+        if threaded:
+            self._queue = queue.Queue(FANOUT_QUEUE_CHUNKS)
+            self._thread = threading.Thread(target=self._drain, name="fanout-writer", daemon=True)
+            self._thread.start()
+
+    def _write(self, chunk: bytes):
+        if self.error is not None:
+            return
+        start = time.perf_counter_ns()
+        try:
+            view = memoryview(chunk)
+            done = 0
+            while done < len(chunk):
+                done += os.write(self.fd, view[done:])
+            self.written += done
+        except OSError as e:
+            self.error = e
+        if self._engine is not None:
+            self._engine._timed(STAGE_WRITE, start)
+
+    def _drain(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            self._write(chunk)
+
+    def put(self, chunk: bytes):
+        """Hands a chunk over; blocks while this destination is FANOUT_QUEUE_CHUNKS behind."""
+        if self._queue is None:
+            self._write(chunk)
+        elif self.error is None:
+            self._queue.put(chunk)
+
+    def close(self):
+        if self._queue is not None:
+            self._queue.put(None)
+            self._thread.join()
+        try:
+            if self.error is None:
+                self._owner._finish_output(self.fd)
+        except OSError as e:
+            self.error = e
+        try:
+            os.close(self.fd)
+        except OSError as e:
+            self.error = self.error or e
+
+
+class CopyEngine:
+    """
+    Streams files from a source tree to a destination tree.
+    Clones files (copy-on-write reflinks) where source and destination sit on
+    a filesystem that can share extents (btrfs, XFS, ...), otherwise uses
+    os.copy_file_range / os.sendfile when the platform offers them and
+    falls back to a readinto() loop over a reusable per-thread buffer.
+    """
+
+    def __init__(self, buffer_size=BUFFER_SIZE, split_threshold=SPLIT_THRESHOLD, split_chunk_size=SPLIT_CHUNK_SIZE,
+                 sync_hash_compare=False, hash_index=None, verify=VERIFY_NONE, scan_workers=DEFAULT_SCAN_WORKERS,
+                 small_file_threshold=SMALL_FILE_THRESHOLD, batch_max_files=BATCH_MAX_FILES,
+                 batch_max_bytes=BATCH_MAX_BYTES, throttle=None, instruments=None, dedup=DEDUP_NONE,
+                 reflink=True, fadvise=False, direct_io_threshold=None, fsync=FSYNC_NONE,
+                 fsync_every_files=FSYNC_EVERY_FILES, fsync_every_bytes=FSYNC_EVERY_BYTES, on_sync_error=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r} (expected one of {', '.join(map(str, FSYNC_POLICIES))})")
+        self.buffer_size = buffer_size
+        self.scan_workers = scan_workers
+        self._local = threading.local()
+
+        # Incremental sync: confirm same-size files with differing mtimes by BLAKE3 digest
+        self.sync_hash_compare = sync_hash_compare
+        # Optional hash_index.HashIndex: digests of unchanged files are served without reading them
+        self.hash_index = hash_index
+
+        # Hash-while-copying (see VERIFY_*); forces the userspace copy loop so every chunk is seen
+        self.verify = verify
+
+        # Content-addressed deduplication (see DEDUP_*); None copies every file in full
+        self.dedup = dedup
+
+        # Small-file packing (small_file_threshold=None disables it)
+        self.small_file_threshold = small_file_threshold
+        self.batch_max_files = batch_max_files
+        self.batch_max_bytes = batch_max_bytes
+
+        # Parallel range copy of large files (split_threshold=None disables it)
+        self.split_threshold = split_threshold
+        self.split_chunk_size = split_chunk_size
+        self._splits = {}  # dst -> {"remaining": ranges not finished yet, "failed": bool}
+        self._splits_lock = threading.Lock()
+
+        # Largest step between progress callbacks; lowered while a rate limit is active
+        # so throttled copies advance steadily (see throttle.Throttle.chunk_size)
+        self.kernel_chunk = KERNEL_CHUNK
+        # Optional throttle.Throttle applied by the workers through the progress callbacks
+        self.throttle = throttle
+        # Optional instrumentation.Instruments fed with per-stage timings
+        self.instruments = instruments
+
+        # Reflink fast path: support is probed per (source device, destination device) pair
+        self.reflink = reflink and fcntl is not None
+        self._reflink_pairs = {}  # (src st_dev, dst st_dev) -> bool once known
+        # Per-thread [cloned, streamed, direct, fsyncs, fsync_ns] counters, summed by byte_counts() / io_stats()
+        self._count_shards = []
+        self._count_shards_lock = threading.Lock()
+
+        # Page cache policy: sequential read-ahead on sources, copied pages dropped on both sides
+        self.fadvise = fadvise and _FADV_DONTNEED is not None
+        # Files >= direct_io_threshold bypass the page cache entirely with O_DIRECT (None disables)
+        self.direct_io_threshold = direct_io_threshold if hasattr(os, "O_DIRECT") and fcntl is not None else None
+        # Durability policy (see FSYNC_*); batched and end-of-run syncs run on a BackgroundSyncer
+        self.fsync = fsync
+        self.syncer = None
+        if fsync in (FSYNC_BATCH, FSYNC_END):
+            self.syncer = BackgroundSyncer(fsync, fsync_every_files, fsync_every_bytes, instruments, on_sync_error)
+
+        # Kernel fast paths are disabled engine-wide once they report ENOSYS
+        self.use_copy_file_range = hasattr(os, "copy_file_range")
+        self.use_sendfile = hasattr(os, "sendfile")
+
+    def _get_buffer(self):
+        """Returns this thread's reusable copy buffer."""
+        buf = getattr(self._local, "buffer", None)
+        if buf is None:
+            buf = bytearray(self.buffer_size)
+            self._local.buffer = buf
+        return buf
+
+    def _timed(self, stage: str, start: int):
+        """Records the time elapsed since `start` (perf_counter_ns) under `stage`."""
+        if self.instruments is not None:
+            self.instruments.record(stage, time.perf_counter_ns() - start)
+
+    def _count(self, cloned: int = 0, streamed: int = 0, direct: int = 0, fsyncs: int = 0, fsync_ns: int = 0):
+        shard = getattr(self._local, "counts", None)
+        if shard is None:
+            shard = self._local.counts = [0, 0, 0, 0, 0]
+            with self._count_shards_lock:
+                self._count_shards.append(shard)
+        shard[0] += cloned
+        shard[1] += streamed
+        shard[2] += direct
+        shard[3] += fsyncs
+        shard[4] += fsync_ns
+
+    def _counts(self) -> list:
+        with self._count_shards_lock:
+            shards = list(self._count_shards)
+        return [sum(column) for column in zip([0, 0, 0, 0, 0], *shards)]
+
+    def byte_counts(self) -> tuple[int, int]:
+        """(cloned, streamed) bytes copied so far by all threads."""
+        cloned, streamed = self._counts()[:2]
+        return cloned, streamed
+
+    def io_stats(self) -> dict:
+        """The page cache and durability policies in force and what they have cost so far."""
+        _, _, direct, fsyncs, fsync_ns = self._counts()
+        syncer = self.syncer
+        if syncer is not None:
+            fsyncs += syncer.synced
+            fsync_ns += syncer.sync_ns
+        return {
+            "fadvise": self.fadvise,
+            "direct_io_threshold": self.direct_io_threshold,
+            "fsync": self.fsync or "none",
+            "bytes_direct": direct,                         # Copied with O_DIRECT, bypassing the page cache
+            "fsyncs": fsyncs,
+            "fsync_seconds": round(fsync_ns / 1e9, 6),
+            "fsync_pending": syncer.pending() if syncer is not None else 0,  # Copied, not yet forced to disk
+            "fsync_errors": syncer.errors if syncer is not None else 0,
+        }
+
+    def flush(self, wait: bool = False):
+        """Forces files copied so far to disk under FSYNC_BATCH / FSYNC_END (no-op otherwise)."""
+        if self.syncer is not None:
+            self.syncer.flush(wait)
+
+    def close(self):
+        """Syncs what is still pending and stops the background syncer."""
+        if self.syncer is not None:
+            self.syncer.close()
+
+    # --- Page cache and durability ---
+
+    def _advise(self, fd: int, advice, offset: int = 0, length: int = 0):
+        """posix_fadvise() under the fadvise policy; advice is best effort, so errors are ignored."""
+        if self.fadvise:
+            try:
+                os.posix_fadvise(fd, offset, length, advice)
+            except OSError:
+                pass
+
+    def _drop_behind(self, progress, in_fd: int, out_fd: int, offset: int = 0):
+        """
+        Wraps a progress callback so that every DROP_BEHIND_BYTES the pages
+        already copied are dropped on both sides. Dirty destination pages can't
+        be dropped yet: the advice starts their write-back, the next one drops them.
+        """
+        if not self.fadvise:
+            return progress
+        done = since = 0
+
+        def report(n):
+            nonlocal done, since
+            done += n
+            since += n
+            if since >= DROP_BEHIND_BYTES:
+                self._advise(in_fd, _FADV_DONTNEED, offset, done)
+                self._advise(out_fd, _FADV_DONTNEED, offset, done)
+                since = 0
+            if progress:
+                progress(n)
+        return report
+
+    def _fsync_fd(self, fd: int):
+        start = time.perf_counter_ns()
+        os.fsync(fd)
+        elapsed = time.perf_counter_ns() - start
+        if self.instruments is not None:
+            self.instruments.record(STAGE_FSYNC, elapsed)
+        self._count(fsyncs=1, fsync_ns=elapsed)
+
+    def _finish_output(self, out_fd: int, offset: int = 0, length: int = 0):
+        """Applies FSYNC_FILE to a destination about to be closed, then drops its cached pages."""
+        if self.fsync == FSYNC_FILE:
+            self._fsync_fd(out_fd)
+        self._advise(out_fd, _FADV_DONTNEED, offset, length)
+
+    def _finished(self, dst: str, nbytes: int = 0, data: bool = True):
+        """
+        Makes a new destination entry durable under the fsync policy: FSYNC_FILE
+        syncs the directory holding it at once (the data was synced by
+        _finish_output), FSYNC_BATCH / FSYNC_END hand it to the background syncer.
+        data=False marks entries without data of their own: symlinks, hard links, directories.
+        """
+        if self.syncer is not None:
+            self.syncer.add(dst, nbytes, data)
+        elif self.fsync == FSYNC_FILE and os.name != "nt":  # Windows can't open a directory for fsync
+            fd = os.open(os.path.dirname(dst) or ".", os.O_RDONLY)
+            try:
+                self._fsync_fd(fd)
+            finally:
+                os.close(fd)
+
+    def _make_dirs(self, path: str):
+        """os.makedirs(path, exist_ok=True) whose new directories are made durable under an fsync policy."""
+        if not self.fsync:
+            os.makedirs(path, exist_ok=True)
+            return
+        created = []
+        parent = path
+        while not os.path.isdir(parent):
+            created.append(parent)
+            parent, child = os.path.dirname(parent), parent
+            if parent == child:
+                break
+        os.makedirs(path, exist_ok=True)
+        for directory in reversed(created):
+            self._finished(directory, data=False)
+
+    def _get_direct_buffer(self) -> mmap.mmap:
+        """This thread's page-aligned O_DIRECT buffer (anonymous mappings start on a page boundary)."""
+        buf = getattr(self._local, "direct_buffer", None)
+        if buf is None:
+            buf = self._local.direct_buffer = mmap.mmap(-1, DIRECT_IO_CHUNK)
+        return buf
+
+    def _copy_direct(self, src: str, dst: str, offset: int, length: int, file_size: int, progress=None,
+                     hasher=None):
+        """
+        Copies bytes [offset, offset + length) with O_DIRECT on both sides through an
+        aligned buffer, so a very large file neither evicts the page cache nor
+        lingers in it. The unaligned tail at the end of the file is written
+        with O_DIRECT switched off. Returns None, having copied nothing, when
+        the file is below direct_io_threshold, the range is not aligned or a
+        filesystem refuses O_DIRECT; the caller then copies through the cache.
+        """
+        if not self.direct_io_threshold or file_size < self.direct_io_threshold or offset % DIRECT_IO_ALIGN \
+                or (length % DIRECT_IO_ALIGN and offset + length < file_size):
+            return None
+        start = time.perf_counter_ns()
+        try:
+            in_fd = os.open(src, os.O_RDONLY | os.O_DIRECT)
+        except OSError as e:
+            if e.errno == errno.EINVAL:
+                return None
+            raise
+        try:
+            try:
+                out_fd = os.open(dst, os.O_WRONLY | os.O_DIRECT | getattr(os, "O_NOFOLLOW", 0))
+            except OSError as e:
+                if e.errno == errno.EINVAL:
+                    return None
+                raise
+            self._timed(STAGE_OPEN, start)
+            try:
+                view = memoryview(self._get_direct_buffer())
+                step = max(DIRECT_IO_ALIGN, min(len(view), self.kernel_chunk) // DIRECT_IO_ALIGN * DIRECT_IO_ALIGN)
+                direct = True
+                copied = 0
+                while copied < length:
+                    want = min(step, length - copied)
+                    start = time.perf_counter_ns()
+                    try:
+                        # Whole blocks only: at the end of the file the read just comes up short
+                        n = os.preadv(in_fd, [view[:-(-want // DIRECT_IO_ALIGN) * DIRECT_IO_ALIGN]],
+                                      offset + copied)
+                    except OSError as e:
+                        if e.errno == errno.EINVAL and copied == 0:
+                            return None
+                        raise
+                    self._timed(STAGE_READ, start)
+                    n = min(n, want)
+                    if n <= 0:
+                        break
+                    if hasher is not None:
+                        start = time.perf_counter_ns()
+                        hasher.update(view[:n])
+                        self._timed(STAGE_HASH, start)
+
+                    start = time.perf_counter_ns()
+                    done = 0
+                    while done < n:
+                        if direct and (n - done) % DIRECT_IO_ALIGN:
+                            flags = fcntl.fcntl(out_fd, fcntl.F_GETFL)
+                            fcntl.fcntl(out_fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+                            direct = False
+                        done += os.pwritev(out_fd, [view[done:n]], offset + copied + done)
+                    self._timed(STAGE_WRITE, start)
+                    copied += n
+                    if progress:
+                        progress(n)
+                self._count(direct=copied)
+                return copied
+            finally:
+                os.close(out_fd)
+        finally:
+            os.close(in_fd)
+
+    def _try_clone(self, in_fd: int, out_fd: int, offset: int = None, length: int = None) -> bool:
+        """
+        Makes out_fd share in_fd's extents (the whole file, or one byte range at the
+        same offset) instead of copying data. A refusal that holds for the whole
+        filesystem pair (EXDEV, EOPNOTSUPP...) disables cloning for that pair;
+        any other failure (unaligned range, swap file...) only affects this file.
+        Returns False whenever the caller has to stream the data instead.
+        """
+        if not self.reflink:
+            return False
+        pair = (os.fstat(in_fd).st_dev, os.fstat(out_fd).st_dev)
+        if self._reflink_pairs.get(pair) is False:
+            return False
+
+        start = time.perf_counter_ns()
+        try:
+            if offset is None:
+                fcntl.ioctl(out_fd, FICLONE, in_fd)
+            else:
+                fcntl.ioctl(out_fd, FICLONERANGE, struct.pack("qQQQ", in_fd, offset, length, offset))
+        except OSError as e:
+            if e.errno in _CLONE_UNSUPPORTED_ERRNOS:
+                self._reflink_pairs[pair] = False
+            return False
+        finally:
+            self._timed(STAGE_COPY, start)
+        self._reflink_pairs[pair] = True
+        return True
+
+    @staticmethod
+    def target_root(source: str, destination: str) -> str:
+        """The source folder is copied *into* the destination folder (like `cp -r src dst/`)."""
+        name = os.path.basename(os.path.normpath(source))
+        return os.path.join(destination, name)
+
+    def iter_tree(self, source: str, destination: str, on_error=None, mirrors=()):
+        """
+        Scans the source tree (in parallel, see scanner.TreeScanner) and yields
+        (src_path, dst_path, size) for every file and symlink as it is found.
+        Destination directories are created as they are discovered, so empty
+        folders are reproduced too, in every `mirrors` destination as well
+        (where a failure is reported through on_error and does not stop the scan).
+        A missing source raises FileNotFoundError.
+        """
+        root = self.target_root(source, destination)
+        mirror_roots = [self.target_root(source, mirror) for mirror in mirrors]
+        if not os.path.lexists(source):
+            raise FileNotFoundError(2, "No such file or directory", source)
+
+        scanner = TreeScanner(source, max_workers=self.scan_workers, on_error=on_error, instruments=self.instruments)
+        for entry in scanner.scan():
+            rel = os.path.relpath(entry.path, source)
+            dst_path = root if rel == os.curdir else os.path.join(root, rel)
+            if entry.kind == KIND_SPECIAL:
+                if on_error is None:
+                    raise special_file_error(entry.path)
+                on_error(special_file_error(entry.path))
+            elif entry.kind == KIND_DIR:
+                self._make_dirs(dst_path)
+                for mirror_root in mirror_roots:
+                    try:
+                        self._make_dirs(self.mirror_path(dst_path, root, mirror_root))
+                    except OSError as e:
+                        if on_error is None:
+                            raise
+                        on_error(e)
+            else:
+                yield entry.path, dst_path, entry.size
+
+    @staticmethod
+    def mirror_path(dst: str, root: str, mirror_root: str) -> str:
+        """Where `dst` (a path under the target root `root`) goes under another destination's target root."""
+        rel = os.path.relpath(dst, root)
+        return mirror_root if rel == os.curdir else os.path.join(mirror_root, rel)
+
+    def is_unchanged(self, src: str, dst: str, use_hash=None) -> bool:
+        """
+        Incremental sync check: True if dst already holds the same content as src.
+        Size and mtime are compared first; when only the mtime differs and hash
+        comparison is enabled, BLAKE3 digests decide (and the mtime is repaired).
+        """
+        start = time.perf_counter_ns()
+        try:
+            src_st = os.lstat(src)
+            dst_st = os.lstat(dst)
+        except FileNotFoundError:
+            return False
+        finally:
+            self._timed(STAGE_METADATA, start)
+
+        if os.path.islink(src):
+            return os.path.islink(dst) and os.readlink(src) == os.readlink(dst)
+        if src_st.st_size != dst_st.st_size:
+            return False
+        if src_st.st_mtime_ns == dst_st.st_mtime_ns:
+            return True
+
+        if use_hash is None:
+            use_hash = self.sync_hash_compare
+        if not use_hash:
+            return False
+
+        src_digest = self.file_digest(src)
+        if src_digest is None or src_digest != self.file_digest(dst):
+            return False
+        # Same content: align metadata so the cheap check succeeds next time
+        shutil.copystat(src, dst)
+        return True
+
+    def file_digest(self, path: str):
+        """BLAKE3 digest of a file, served from the persistent index when one is configured."""
+        start = time.perf_counter_ns()
+        try:
+            if self.hash_index is not None:
+                try:
+                    return self.hash_index.get_digest(path)
+                except OSError:
+                    return None
+            return hash_file(path)
+        finally:
+            self._timed(STAGE_HASH, start)
+
+    @staticmethod
+    def _open_source(src: str) -> int:
+        """Opens a source for reading; raises SpecialFileError unless it is a regular file."""
+        fd = os.open(src, _SOURCE_FLAGS)
+        try:
+            mode = os.fstat(fd).st_mode
+        except OSError:
+            os.close(fd)
+            raise
+        if not stat.S_ISREG(mode):
+            os.close(fd)
+            raise special_file_error(src, mode)
+        return fd
+
+    @staticmethod
+    def _open_temp(dst: str) -> tuple[int, str]:
+        """
+        Creates an empty private file next to dst and returns (fd, path). Renaming
+        it over dst once written replaces whatever dst was (a symlink, a file
+        hard-linked elsewhere) instead of writing through it.
+        """
+        directory, name = os.path.split(dst)
+        return tempfile.mkstemp(prefix=f".{name[:200]}.", suffix=TEMP_SUFFIX, dir=directory or ".")
+
+    @staticmethod
+    def _discard_temp(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def copy_file(self, src: str, dst: str, progress=None, hasher=None) -> int:
+        """
+        Copies a single file (or symlink) and its metadata.
+        `progress(delta_bytes)` is called as data moves (not for a clone, which
+        moves none). If a BLAKE3 `hasher` is given every chunk is fed into it on
+        its way to the destination, so the file is streamed even where it could be cloned.
+        Returns bytes written.
+        """
+        if os.path.islink(src):
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            os.symlink(os.readlink(src), dst)
+            self._finished(dst, data=False)
+            return 0
+
+        start = time.perf_counter_ns()
+        with open(self._open_source(src), "rb") as fsrc:
+            fd, tmp = self._open_temp(dst)
+            try:
+                with open(fd, "wb") as fdst:
+                    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+                    self._timed(STAGE_OPEN, start)
+                    self._advise(in_fd, _FADV_SEQUENTIAL)
+                    if hasher is None and self._try_clone(in_fd, out_fd):
+                        copied = os.fstat(in_fd).st_size
+                        self._count(cloned=copied)
+                    else:
+                        size = os.fstat(in_fd).st_size
+                        copied = self._copy_direct(src, tmp, 0, size, size, progress, hasher)
+                        if copied is None:
+                            copied = self._copy_fd(in_fd, out_fd, self._drop_behind(progress, in_fd, out_fd),
+                                                   hasher)
+                        self._count(streamed=copied)
+                    self._finish_output(out_fd)
+                    self._advise(in_fd, _FADV_DONTNEED)
+
+                start = time.perf_counter_ns()
+                shutil.copystat(src, tmp)
+                os.replace(tmp, dst)
+                self._timed(STAGE_METADATA, start)
+            except BaseException:
+                self._discard_temp(tmp)
+                raise
+        self._finished(dst, copied)
+        return copied
+
+    def _copy_fd(self, in_fd: int, out_fd: int, progress=None, hasher=None) -> int:
+        """Moves all remaining bytes from in_fd to out_fd, trying the fastest path first."""
+        copied = 0
+
+        # 1. copy_file_range: in-kernel, may use server-side copy / reflinks
+        if self.use_copy_file_range and hasher is None:
+            try:
+                while True:
+                    start = time.perf_counter_ns()
+                    n = os.copy_file_range(in_fd, out_fd, self.kernel_chunk)
+                    self._timed(STAGE_COPY, start)
+                    if n == 0:
+                        return copied
+                    copied += n
+                    if progress:
+                        progress(n)
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+                if e.errno == errno.ENOSYS:
+                    self.use_copy_file_range = False
+
+        # 2. sendfile: in-kernel, file-to-file is supported on Linux >= 2.6.33
+        if self.use_sendfile and hasher is None:
+            try:
+                while True:
+                    start = time.perf_counter_ns()
+                    n = os.sendfile(out_fd, in_fd, None, self.kernel_chunk)
+                    self._timed(STAGE_COPY, start)
+                    if n == 0:
+                        return copied
+                    copied += n
+                    if progress:
+                        progress(n)
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+                if e.errno == errno.ENOSYS:
+                    self.use_sendfile = False
+
+        # 3. Userspace loop over a reusable buffer (no per-chunk allocations)
+        view = memoryview(self._get_buffer())[:self.kernel_chunk]
+        with open(in_fd, "rb", buffering=0, closefd=False) as reader:
+            while True:
+                start = time.perf_counter_ns()
+                n = reader.readinto(view)
+                self._timed(STAGE_READ, start)
+                if not n:
+                    break
+                if hasher is not None:
+                    start = time.perf_counter_ns()
+                    hasher.update(view[:n])
+                    self._timed(STAGE_HASH, start)
+                start = time.perf_counter_ns()
+                written = 0
+                while written < n:
+                    written += os.write(out_fd, view[written:n])
+                self._timed(STAGE_WRITE, start)
+                copied += n
+                if progress:
+                    progress(n)
+        return copied
+
+    # --- Small-file batches ---
+
+    def should_batch(self, size: int) -> bool:
+        """Small files are packed into BATCH units (not while verifying, which records per-file digests)."""
+        return bool(self.small_file_threshold) and size <= self.small_file_threshold and not self.verify
+
+    def copy_batch(self, files: list, sync: bool = False, on_error=None, progress=None) -> tuple[int, int, int]:
+        """
+        Fast path for many small files: each file is read with a single read(),
+        written with a single write(), and gets its mode and timestamps through
+        the already-open descriptor instead of a path-based copystat() (where
+        the platform allows it, see _FD_METADATA).
+        `progress(delta_bytes)` is called after each copied file.
+        Returns (bytes_written, files_copied, files_skipped).
+        """
+        written_total = copied = skipped = 0
+
+        for src, dst, size in files:
+            try:
+                if sync and self.is_unchanged(src, dst):
+                    skipped += 1
+                    continue
+                if os.path.islink(src):
+                    self.copy_file(src, dst)
+                    copied += 1
+                    if progress:
+                        progress(0)
+                    continue
+
+                start = time.perf_counter_ns()
+                in_fd = self._open_source(src)
+                try:
+                    out_fd, tmp = self._open_temp(dst)
+                    self._timed(STAGE_OPEN, start)
+                    try:
+                        st = os.fstat(in_fd)
+                        self._advise(in_fd, _FADV_SEQUENTIAL)
+                        if self._try_clone(in_fd, out_fd):
+                            written = st.st_size
+                            self._count(cloned=written)
+                        else:
+                            start = time.perf_counter_ns()
+                            # One read for the common case: a regular file reads short only at its end,
+                            # so only a file that grew since the scan fills the request and is read on
+                            want = max(st.st_size, size) + 1
+                            chunks = [os.read(in_fd, want)]
+                            if len(chunks[0]) == want:
+                                while chunks[-1]:
+                                    chunks.append(os.read(in_fd, self.buffer_size))
+                            self._timed(STAGE_READ, start)
+                            data = b"".join(chunks) if len(chunks) > 2 else chunks[0]
+
+                            start = time.perf_counter_ns()
+                            view = memoryview(data)
+                            written = 0
+                            while written < len(data):
+                                written += os.write(out_fd, view[written:])
+                            self._timed(STAGE_WRITE, start)
+                            self._count(streamed=written)
+                        if _FD_METADATA:
+                            start = time.perf_counter_ns()
+                            os.fchmod(out_fd, stat.S_IMODE(st.st_mode))
+                            os.utime(out_fd, ns=(st.st_atime_ns, st.st_mtime_ns))
+                            self._timed(STAGE_METADATA, start)
+                        self._finish_output(out_fd)
+                    except BaseException:
+                        os.close(out_fd)
+                        self._discard_temp(tmp)
+                        raise
+                    os.close(out_fd)
+                    try:
+                        if not _FD_METADATA:
+                            start = time.perf_counter_ns()
+                            shutil.copystat(src, tmp)
+                            self._timed(STAGE_METADATA, start)
+                        os.replace(tmp, dst)
+                    except OSError:
+                        self._discard_temp(tmp)
+                        raise
+                    self._advise(in_fd, _FADV_DONTNEED)
+                finally:
+                    os.close(in_fd)
+                self._finished(dst, written)
+                written_total += written
+                copied += 1
+                if progress:
+                    progress(written)
+            except OSError as e:
+                if on_error is None:
+                    raise
+                on_error(e)
+
+        return written_total, copied, skipped
+
+    # --- Content-addressed deduplication ---
+
+    def find_duplicates(self, files: list) -> tuple[list, list]:
+        """
+        Splits (src, dst, size) entries into groups of identical files and the rest.
+        Files are grouped by size first and only those whose size collides with
+        another file's are read: they are BLAKE3-digested across scan_workers
+        threads (through the hash index when one is configured).
+        Returns (groups, singles) where each group is (digest, [entries], [mtime_ns]),
+        the mtimes being taken before each file was read (see copy_deduplicated).
+        """
+        by_size = {}
+        for entry in files:
+            by_size.setdefault(entry[2], []).append(entry)
+
+        singles, candidates = [], []
+        for size, entries in by_size.items():
+            if len(entries) < 2 or size < DEDUP_MIN_SIZE:
+                singles.extend(entries)
+                continue
+            for entry in entries:
+                (singles if os.path.islink(entry[0]) else candidates).append(entry)
+
+        def stat_and_digest(entry):
+            try:
+                mtime = os.stat(entry[0]).st_mtime_ns
+            except OSError:
+                return None, None
+            return mtime, self.file_digest(entry[0])
+
+        by_content = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.scan_workers, thread_name_prefix="dedup") as pool:
+            for entry, (mtime, digest) in zip(candidates, pool.map(stat_and_digest, candidates)):
+                if digest is None:
+                    singles.append(entry)  # Unreadable: the normal copy reports the error
+                else:
+                    by_content.setdefault((entry[2], digest), []).append((entry, mtime))
+
+        groups = []
+        for (_, digest), members in by_content.items():
+            if len(members) > 1:
+                groups.append((digest, [entry for entry, _ in members], [mtime for _, mtime in members]))
+            else:
+                singles.append(members[0][0])
+        return groups, singles
+
+    def clone_file(self, src: str, dst: str):
+        """Creates dst as a copy-on-write clone of src; raises OSError where reflinks are unsupported (dedup)."""
+        if fcntl is None:
+            raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform", dst)
+        with open(src, "rb") as fsrc:
+            fd, tmp = self._open_temp(dst)
+            try:
+                try:
+                    fcntl.ioctl(fd, FICLONE, fsrc.fileno())
+                    self._finish_output(fd)
+                finally:
+                    os.close(fd)
+                os.replace(tmp, dst)
+            except BaseException:
+                self._discard_temp(tmp)
+                raise
+        self._finished(dst)
+
+    def _materialize(self, origin: str, src: str, dst: str) -> bool:
+        """Makes dst a hard link or reflink of the already copied `origin`; False if the filesystem can't."""
+        start = time.perf_counter_ns()
+        try:
+            if self.dedup == DEDUP_HARDLINK:
+                if os.path.lexists(dst):
+                    os.unlink(dst)
+                os.link(origin, dst)
+                self._timed(STAGE_METADATA, start)
+                self._finished(dst, data=False)  # Same inode as origin, whose data is synced with it
+            else:
+                self.clone_file(origin, dst)
+                self._timed(STAGE_COPY, start)
+                start = time.perf_counter_ns()
+                shutil.copystat(src, dst)
+                self._timed(STAGE_METADATA, start)
+        except OSError as e:
+            if e.errno not in _LINK_FALLBACK_ERRNOS:
+                raise
+            return False
+        return True
+
+    def copy_deduplicated(self, files: list, digest: str = None, sync: bool = False, on_error=None,
+                          progress=None, mtimes: list = None) -> tuple[int, int, int, int, int]:
+        """
+        Copies the first of a group of identical files and makes the others
+        from that copy as hard links or reflinks (per self.dedup), falling back
+        to a full copy wherever the destination filesystem refuses. The sources
+        may have changed since planning: a file whose size, or mtime when
+        `mtimes` (one per file, from find_duplicates) is given, differs is
+        copied in full rather than linked, and while verifying the first copy
+        is digested on its way and the others are only linked if it still
+        matches `digest`. `progress(delta_bytes)` is called after each file.
+        Returns (bytes_written, files_copied, files_linked, bytes_linked, files_skipped).
+        """
+        written_total = copied = linked = linked_bytes = skipped = 0
+        origin = None  # Destination file known to hold the group's content
+
+        def report(n):
+            if progress:
+                progress(n)
+
+        def as_planned(i):
+            src, _, size = files[i]
+            st = os.stat(src)
+            return st.st_size == size and (not mtimes or st.st_mtime_ns == mtimes[i])
+
+        first_src, first_dst, _ = files[0]
+        try:
+            planned = as_planned(0)
+            if sync and self.is_unchanged(first_src, first_dst):
+                skipped += 1
+                if planned:
+                    origin = first_dst
+            else:
+                if self.verify:
+                    written, got = self.copy_verified(first_src, first_dst)
+                    if planned and (digest is None or got == digest):
+                        origin = first_dst
+                else:
+                    written = self.copy_file(first_src, first_dst)
+                    if planned:
+                        origin = first_dst
+                written_total += written
+                copied += 1
+                report(written)
+        except OSError as e:
+            if on_error is None:
+                raise
+            on_error(e)
+
+        for i, (src, dst, size) in enumerate(files[1:], 1):
+            try:
+                linkable = origin is not None and as_planned(i)
+                if sync and (self.is_unchanged(src, dst) or (linkable and self._same_file(dst, origin))):
+                    skipped += 1
+                    continue
+                if linkable and self._materialize(origin, src, dst):
+                    linked += 1
+                    linked_bytes += size
+                    report(0)
+                    continue
+                written = self.copy_file(src, dst)
+                written_total += written
+                copied += 1
+                report(written)
+            except OSError as e:
+                if on_error is None:
+                    raise
+                on_error(e)
+
+        return written_total, copied, linked, linked_bytes, skipped
+
+    @staticmethod
+    def _same_file(a: str, b: str) -> bool:
+        try:
+            return os.path.samefile(a, b)
+        except OSError:
+            return False
+
+    # --- Fan-out: read once, write to several destinations ---
+
+    def copy_fanout(self, src: str, dsts: list, sync: bool = False, progress=None) -> tuple[list, str]:
+        """
+        Copies src to every path in `dsts` while reading it only once. Each chunk
+        is read into an immutable buffer shared by one writer per destination;
+        a file larger than one chunk gets a writer thread per destination fed
+        through a bounded queue, so a slow destination holds the others back by
+        at most FANOUT_QUEUE_CHUNKS chunks. A destination that fails is dropped
+        without affecting the others. With `sync`, destinations already holding
+        the file are left alone; destinations that can share extents with the
+        source get a clone. While verifying the source stream is digested (and
+        every destination re-read with VERIFY_READBACK).
+        `progress(delta_bytes)` counts source bytes read.
+        Returns (results, digest): one result per destination, being the bytes
+        written, None if it was unchanged, or the OSError it failed with. The
+        digest is None unless at least one destination received the whole
+        stream it describes. Raises OSError if the source itself can't be read.
+        """
+        results = [None] * len(dsts)
+        if os.path.islink(src):
+            for i, dst in enumerate(dsts):
+                try:
+                    if not (sync and self.is_unchanged(src, dst)):
+                        results[i] = self.copy_file(src, dst)
+                except OSError as e:
+                    results[i] = e
+            return results, None
+
+        hasher = blake3.blake3() if self.verify else None
+        temps = {}  # index -> temporary file renamed over its destination once complete
+        try:
+            digest, writers = self._fanout_stream(src, dsts, sync, progress, hasher, results, temps)
+        except BaseException:
+            for tmp in temps.values():
+                self._discard_temp(tmp)
+            raise
+
+        for i, writer in writers:
+            results[i] = writer.error or writer.written
+            self._count(streamed=writer.written)
+        for i, dst in enumerate(dsts):
+            tmp = temps.get(i)
+            if tmp is None:
+                continue
+            if isinstance(results[i], int):
+                try:
+                    if self.verify == VERIFY_READBACK and digest != self._digest_range(tmp, 0, results[i]):
+                        raise OSError(errno.EIO, "Verification failed: destination digest mismatch", dst)
+                    start = time.perf_counter_ns()
+                    shutil.copystat(src, tmp)
+                    os.replace(tmp, dst)
+                    self._timed(STAGE_METADATA, start)
+                    self._finished(dst, results[i])
+                    continue
+                except OSError as e:
+                    results[i] = e
+            self._discard_temp(tmp)
+        if not any(isinstance(results[i], int) for i, _ in writers):
+            digest = None  # Every destination unchanged, cloned or failed: the stream may be empty or cut short
+        return results, digest
+
+    def _fanout_stream(self, src: str, dsts: list, sync: bool, progress, hasher, results: list, temps: dict):
+        """
+        The read-once part of copy_fanout: clones or streams src into a temporary
+        file per destination. Returns (digest, [(index, writer)]).
+        """
+        start = time.perf_counter_ns()
+        with open(self._open_source(src), "rb", buffering=0) as fsrc:
+            self._timed(STAGE_OPEN, start)
+            self._advise(fsrc.fileno(), _FADV_SEQUENTIAL)
+            size = os.fstat(fsrc.fileno()).st_size
+            targets = []
+            for i, dst in enumerate(dsts):
+                try:
+                    if sync and self.is_unchanged(src, dst):
+                        continue
+                    fd, temps[i] = self._open_temp(dst)
+                except OSError as e:
+                    results[i] = e
+                    continue
+                if hasher is None and self._try_clone(fsrc.fileno(), fd):
+                    self._count(cloned=size)
+                    try:
+                        self._finish_output(fd)
+                        results[i] = size
+                    except OSError as e:
+                        results[i] = e
+                    finally:
+                        os.close(fd)
+                else:
+                    targets.append((i, fd))
+
+            threaded = len(targets) > 1 and size > FANOUT_CHUNK
+            writers = []
+            try:
+                for i, fd in targets:
+                    writers.append((i, _FanoutWriter(self, fd, threaded)))
+                while writers and not all(writer.error for _, writer in writers):
+                    start = time.perf_counter_ns()
+                    chunk = fsrc.read(FANOUT_CHUNK)  # A fresh bytes object: writers may still hold the last one
+                    self._timed(STAGE_READ, start)
+                    if not chunk:
+                        break
+                    if hasher is not None:
+                        start = time.perf_counter_ns()
+                        hasher.update(chunk)
+                        self._timed(STAGE_HASH, start)
+                    for _, writer in writers:
+                        writer.put(chunk)
+                    if progress:
+                        progress(len(chunk))
+            finally:
+                for _, writer in writers:
+                    writer.close()
+                for i, fd in targets[len(writers):]:
+                    os.close(fd)  # Writer never started
+                self._advise(fsrc.fileno(), _FADV_DONTNEED)
+
+        return (hasher.hexdigest() if hasher is not None else None), writers
+
+    # --- Parallel range copy of large files ---
+
+    def should_split(self, src: str, size: int) -> bool:
+        """Large regular files are copied as several byte ranges (where the platform has positional I/O)."""
+        if not self.split_threshold or size < self.split_threshold or not _POSITIONAL_IO:
+            return False
+        return not os.path.islink(src) and size > self.split_chunk_size
+
+    def prepare_split(self, src: str, dst: str, size: int) -> list:
+        """
+        Pre-sizes the destination file and registers it for range copy.
+        Returns the list of (offset, length) ranges to queue, or an empty list
+        if the destination is already being split-copied by another job.
+        """
+        with self._splits_lock:
+            if dst in self._splits:
+                return []
+            try:
+                os.unlink(dst)  # A new inode: never write through a symlink or into a file hard-linked elsewhere
+            except FileNotFoundError:
+                pass
+            fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            try:
+                os.ftruncate(fd, size)
+            finally:
+                os.close(fd)
+
+            ranges = [(offset, min(self.split_chunk_size, size - offset))
+                      for offset in range(0, size, self.split_chunk_size)]
+            self._splits[dst] = {"remaining": len(ranges), "failed": False}
+            return ranges
+
+    def copy_range(self, src: str, dst: str, offset: int, length: int, progress=None, hasher=None,
+                   checkpoint=None) -> int:
+        """
+        Copies (or clones) bytes [offset, offset + length) of src into the pre-sized dst. Returns bytes written.
+        If given, `checkpoint(done_bytes)` is called every CHECKPOINT_BYTES once that
+        much of the range has been flushed to the destination device.
+        """
+        start = time.perf_counter_ns()
+        in_fd = os.open(src, os.O_RDONLY)
+        try:
+            out_fd = os.open(dst, os.O_WRONLY | getattr(os, "O_NOFOLLOW", 0))
+            self._timed(STAGE_OPEN, start)
+            try:
+                if checkpoint is not None:
+                    done = 0
+                    since_sync = 0
+                    report = progress
+
+                    def progress(n):
+                        nonlocal done, since_sync
+                        done += n
+                        since_sync += n
+                        if report:
+                            report(n)
+                        if since_sync >= CHECKPOINT_BYTES:
+                            start = time.perf_counter_ns()
+                            os.fdatasync(out_fd)
+                            self._timed(STAGE_FSYNC, start)
+                            checkpoint(done)
+                            since_sync = 0
+
+                self._advise(in_fd, _FADV_SEQUENTIAL, offset, length)
+                if hasher is None and self._try_clone(in_fd, out_fd, offset, length):
+                    copied = length
+                    self._count(cloned=length)  # No checkpoint: redoing a clone after a crash is cheap
+                else:
+                    copied = self._copy_direct(src, dst, offset, length, os.fstat(in_fd).st_size, progress, hasher)
+                    if copied is None:
+                        copied = self._copy_range_fd(in_fd, out_fd, offset, length,
+                                                     self._drop_behind(progress, in_fd, out_fd, offset), hasher)
+                    self._count(streamed=copied)
+                self._finish_output(out_fd, offset, length)
+                self._advise(in_fd, _FADV_DONTNEED, offset, length)
+            finally:
+                os.close(out_fd)
+        finally:
+            os.close(in_fd)
+        self._finished(dst, copied)
+        return copied
+
+    def _copy_range_fd(self, in_fd: int, out_fd: int, offset: int, length: int, progress=None, hasher=None) -> int:
+        """Positional copy: never touches the shared file offsets, so ranges can run concurrently."""
+        copied = 0
+
+        if self.use_copy_file_range and hasher is None:
+            try:
+                while copied < length:
+                    pos = offset + copied
+                    start = time.perf_counter_ns()
+                    n = os.copy_file_range(in_fd, out_fd, min(self.kernel_chunk, length - copied), pos, pos)
+                    self._timed(STAGE_COPY, start)
+                    if n == 0:
+                        return copied  # Source was truncated under us
+                    copied += n
+                    if progress:
+                        progress(n)
+                return copied
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+                if e.errno == errno.ENOSYS:
+                    self.use_copy_file_range = False
+
+        # pread / pwrite over the reusable buffer
+        view = memoryview(self._get_buffer())[:self.kernel_chunk]
+        while copied < length:
+            pos = offset + copied
+            start = time.perf_counter_ns()
+            n = os.preadv(in_fd, [view[:min(len(view), length - copied)]], pos)
+            self._timed(STAGE_READ, start)
+            if n == 0:
+                break
+            if hasher is not None:
+                start = time.perf_counter_ns()
+                hasher.update(view[:n])
+                self._timed(STAGE_HASH, start)
+            start = time.perf_counter_ns()
+            written = 0
+            while written < n:
+                written += os.pwrite(out_fd, view[written:n], pos + written)
+            self._timed(STAGE_WRITE, start)
+            copied += n
+            if progress:
+                progress(n)
+        return copied
+
+    def resume_splits(self, units: list):
+        """Re-registers split files whose remaining RANGE units were restored from the journal."""
+        with self._splits_lock:
+            for unit in units:
+                if unit["type"] != "RANGE":
+                    continue
+                split = self._splits.setdefault(unit["destination"], {"remaining": 0, "failed": False})
+                split["remaining"] += 1
+
+    def finish_range(self, src: str, dst: str, failed: bool = False) -> bool:
+        """
+        Marks one range of a split file as done. The caller that finishes the
+        last range finalizes the file (metadata) and gets True back.
+        """
+        with self._splits_lock:
+            split = self._splits[dst]
+            split["remaining"] -= 1
+            split["failed"] = split["failed"] or failed
+            if split["remaining"] > 0:
+                return False
+            del self._splits[dst]
+
+        if split["failed"]:
+            raise OSError(errno.EIO, "Incomplete copy, one or more ranges failed", dst)
+        start = time.perf_counter_ns()
+        shutil.copystat(src, dst)
+        self._timed(STAGE_METADATA, start)
+        return True
+
+    # --- Hash-while-copying ---
+
+    def copy_verified(self, src: str, dst: str, progress=None, offset=None, length=None):
+        """
+        Copies a whole file (or the byte range offset/length of a split file)
+        while digesting the source stream. In VERIFY_READBACK mode the
+        destination is re-read and compared. Returns (bytes_written, digest);
+        raises OSError(EIO) on a mismatch.
+        """
+        if os.path.islink(src):
+            return self.copy_file(src, dst, progress), None
+
+        src_st = os.stat(src)
+        hasher = blake3.blake3()
+        if offset is None:
+            copied = self.copy_file(src, dst, progress, hasher)
+        else:
+            copied = self.copy_range(src, dst, offset, length, progress, hasher)
+        digest = hasher.hexdigest()
+
+        if self.verify == VERIFY_READBACK:
+            if self._digest_range(dst, offset or 0, copied) != digest:
+                raise OSError(errno.EIO, "Verification failed: destination digest mismatch", dst)
+
+        if offset is None and self.hash_index is not None:
+            # Both sides are now known to hold this content - later syncs and verifies skip the reads
+            if os.stat(src).st_mtime_ns == src_st.st_mtime_ns:
+                self.hash_index.store(src_st, digest)
+                if self.verify == VERIFY_READBACK:
+                    self.hash_index.store(os.stat(dst), digest)
+        return copied, digest
+
+    def _digest_range(self, path: str, offset: int, length: int) -> str:
+        """Re-reads a byte range of a freshly written file, bypassing its cached pages where possible."""
+        hasher = blake3.blake3()
+        buf = self._get_buffer()
+        view = memoryview(buf)
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            if hasattr(os, "posix_fadvise"):
+                start = time.perf_counter_ns()
+                os.fdatasync(fd)  # Dirty pages can't be dropped, so flush them first
+                self._timed(STAGE_FSYNC, start)
+                os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+            if not _POSITIONAL_IO:
+                os.lseek(fd, offset, os.SEEK_SET)  # Private descriptor: sequential reads are just as good
+            done = 0
+            while done < length:
+                start = time.perf_counter_ns()
+                want = min(len(buf), length - done)
+                if _POSITIONAL_IO:
+                    n = os.preadv(fd, [view[:want]], offset + done)
+                else:
+                    chunk = os.read(fd, want)
+                    n = len(chunk)
+                    view[:n] = chunk
+                self._timed(STAGE_READ, start)
+                if n == 0:
+                    break
+                start = time.perf_counter_ns()
+                hasher.update(view[:n])
+                self._timed(STAGE_HASH, start)
+                done += n
+        finally:
+            os.close(fd)
+        return hasher.hexdigest()
@@ -1,18 +1,76 @@
 import concurrent.futures
 from queue_manager import QueueManager, worker_thread_task
+from copy_engine import (CopyEngine, KERNEL_CHUNK, SPLIT_THRESHOLD, SPLIT_CHUNK_SIZE, SMALL_FILE_THRESHOLD,
+                         VERIFY_NONE, DEDUP_NONE, FSYNC_NONE, FSYNC_EVERY_FILES, FSYNC_EVERY_BYTES)
+from hash_index import HashIndex
+from journal import JobJournal
+from concurrency import AdaptiveConcurrency, bounds_for
+from throttle import Throttle
+from scheduler import DEFAULT_PRIORITY
+from fingerprints import FingerprintStore, RETAIN_UNTIL_DONE
+from instrumentation import Instruments
+from metrics_exporter import MetricsExporter, render as render_openmetrics
 import threading
 import time
+import logging
+
+# Backend diagnostics go through logging (configured by app_logger in the GUI) so
+# headless runs keep stdout clean for machine-readable output
+logger = logging.getLogger("FolderCopier.controller")
+
+METRICS_INTERVAL = 1.0  # Seconds between METRICS_UPDATE events
 
 class CopyExecutorController:
     """
     Manages the ThreadPoolExecutor and coordinates worker startup based on QueueManager state.
     """
-    def __init__(self, max_workers=4):
-        self.manager = QueueManager()
+    def __init__(self, max_workers=4, split_threshold=SPLIT_THRESHOLD, split_chunk_size=SPLIT_CHUNK_SIZE,
+                 sync_hash_compare=False, hash_index_path=None, verify=VERIFY_NONE, journal_path=None,
+                 auto_tune=False, small_file_threshold=SMALL_FILE_THRESHOLD,
+                 fingerprint_retention=RETAIN_UNTIL_DONE, fingerprint_spill_path=None, metrics_port=None,
+                 dedup=DEDUP_NONE, reflink=True, fadvise=False, direct_io_threshold=None, fsync=FSYNC_NONE,
+                 fsync_every_files=FSYNC_EVERY_FILES, fsync_every_bytes=FSYNC_EVERY_BYTES):
+        # Write-ahead job journal: unfinished work is restored and resumed on startup (None disables)
+        self.journal = JobJournal(journal_path) if journal_path else None
+        # Duplicate-task detection: seconds a finished job's fingerprints are kept
+        # (0 = until it finishes, None = forever); very large queues can spill them to disk
+        self.fingerprints = FingerprintStore(retention=fingerprint_retention, spill_path=fingerprint_spill_path)
+        self.manager = QueueManager(journal=self.journal, fingerprints=self.fingerprints)
+        # Persistent digest cache shared by sync comparison and verification (None disables)
+        self.hash_index = HashIndex(hash_index_path) if hash_index_path else None
+        # Files >= split_threshold are copied as split_chunk_size ranges by several workers (None disables)
+        # sync_hash_compare: SYNC tasks confirm same-size files by BLAKE3 instead of recopying on mtime change
+        # verify: copy_engine.VERIFY_SOURCE / VERIFY_READBACK to digest data while it is copied
+        # Files <= small_file_threshold are copied in batches, one queue entry per batch (None disables)
+        # dedup: copy_engine.DEDUP_HARDLINK / DEDUP_REFLINK to copy identical files once and link the rest
+        # reflink: clone files instead of copying their data where the filesystems allow it
+        # fadvise: keep copies from flooding the page cache; files >= direct_io_threshold use O_DIRECT (None disables)
+        # fsync: copy_engine.FSYNC_FILE / FSYNC_BATCH / FSYNC_END to trade throughput for durability
+        # Bytes/sec and files/sec limits per destination or source device, adjustable at runtime
+        self.throttle = Throttle()
+        # Per-stage latency histograms and per-worker busy/idle accounting
+        self.instruments = Instruments()
+        # Optional OpenMetrics endpoint on localhost, fed from the metrics thread's snapshots
+        self.exporter = MetricsExporter(metrics_port) if metrics_port is not None else None
+        self.engine = CopyEngine(split_threshold=split_threshold, split_chunk_size=split_chunk_size,
+                                 sync_hash_compare=sync_hash_compare, hash_index=self.hash_index,
+                                 verify=verify, small_file_threshold=small_file_threshold,
+                                 throttle=self.throttle, instruments=self.instruments, dedup=dedup,
+                                 reflink=reflink, fadvise=fadvise, direct_io_threshold=direct_io_threshold,
+                                 fsync=fsync, fsync_every_files=fsync_every_files,
+                                 fsync_every_bytes=fsync_every_bytes,
+                                 on_sync_error=lambda path, e: self.manager.report_error(f"{path}: fsync failed: {e}"))
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
         self.max_workers = max_workers
-        self.worker_thread_handle = None
+
+        # auto_tune: max_workers becomes the pool size / hard cap and the number of
+        # active workers is hill-climbed on measured throughput within per-device bounds
+        self.tuner = AdaptiveConcurrency(initial=min(4, max_workers), hi=max_workers) if auto_tune else None
+        self.device_classes = {}
+        if self.tuner:
+            self.manager.set_worker_limit(self.tuner.workers)
         self.running = True
+        self._stop_event = threading.Event()
         
         # Metrics History (for rolling window)
         self.history_bytes = []
@@ -20,16 +78,30 @@ class CopyExecutorController:
         self.last_total_bytes = 0
         self.last_total_items = 0
 
-    def submit_task(self, source, destination, op_type="COPY"):
-        """Submits a task to the manager."""
-        self.manager.add_task(source, destination, op_type)
-        self._ensure_worker_is_active()
+        self._start_workers()
+        self.metrics_thread = threading.Thread(target=self._metrics_loop, name="metrics", daemon=True)
+        self.metrics_thread.start()
+
+        if self.journal:
+            self.engine.resume_splits(self.manager.restore_from_journal())
+            self.start()
+
+    def submit_task(self, source, destination, op_type="COPY", priority=DEFAULT_PRIORITY):
+        """Submits a task to the manager (a list of destinations makes a read-once fan-out job)."""
+        self.manager.add_task(source, destination, op_type, priority)
+
+    def pause_job(self, fp):
+        """Pauses a single job; the others keep running."""
+        return self.manager.pause_job(fp)
+
+    def resume_job(self, fp):
+        """Resumes a single paused job."""
+        return self.manager.resume_job(fp)
 
     def start(self):
         """Starts processing if tasks are available."""
         if self.manager.state == self.manager.STATE_IDLE and not self.manager.task_queue.empty():
             self.manager.resume()
-            self._ensure_worker_is_active()
         elif self.manager.state == self.manager.STATE_PAUSED:
             self.resume()
 
@@ -39,59 +111,42 @@ class CopyExecutorController:
 
     def resume(self):
         """Instructs the manager to resume."""
-        if self.manager.resume():
-            # If resume succeeds (transitioned to RUNNING), ensure the worker loop is active
-            self._ensure_worker_is_active()
+        self.manager.resume()
 
-    def _ensure_worker_is_active(self):
-        """Starts the main worker monitoring thread if it's not running and tasks need processing."""
-        current_state, _ = self.manager.get_status()
-        
-        if current_state == self.manager.STATE_RUNNING and self.worker_thread_handle is None:
-            print("[Controller] Starting dedicated worker monitoring thread.")
-            # Start a dedicated thread whose only job is to feed the ThreadPoolExecutor
-            self.worker_thread_handle = threading.Thread(
-                target=self._worker_monitoring_loop,
-                daemon=True
-            )
-            self.worker_thread_handle.start()
-        elif current_state == self.manager.STATE_IDLE and self.worker_thread_handle is not None:
-            # If we transition to IDLE, we allow the loop to terminate naturally in the next iteration.
-            pass
-
-
-    def _worker_monitoring_loop(self):
+    def set_limit(self, destination=None, source=None, bytes_per_sec=None, files_per_sec=None):
         """
-        This loop runs on a dedicated, persistent thread, managing the submission
-        of tasks to the ThreadPoolExecutor based on QueueManager state checks.
+        Caps the copy rate into a destination folder, or out of the device holding `source`.
+        Takes effect immediately for running copies; no rates removes the limit.
         """
-        while self.running:
-            state, _ = self.manager.get_status()
-            
-            if state == self.manager.STATE_IDLE:
-                # Allow loop to terminate if idle
-                if self.manager.task_queue.empty():
-                    print("[Controller] Monitoring loop terminating due to IDLE state.")
-                    self.worker_thread_handle = None
-                    break
-            
-            # If RUNNING or PAUSED, we need to submit a worker thread to check the queue state
-            if state in [self.manager.STATE_RUNNING, self.manager.STATE_PAUSED]:
-                # Submit the core processing function to the ThreadPoolExecutor
-                # Since the worker_thread_task handles its own internal loop and state checks, 
-                # we submit it only when a state change might allow work to happen (RUNNING or newly PAUSED queue).
-                
-                # Crucially, we only submit *one* instance of the monitoring logic per RUNNING phase.
-                # If the state is RUNNING, we submit a worker to execute its cycle.
-                if state == self.manager.STATE_RUNNING:
-                    self.executor.submit(worker_thread_task, self.manager)
-                
-                # Wait briefly before checking state again. This prevents busy-waiting while PAUSED.
-                self._update_metrics()
-                time.sleep(1.0) # 1-second refresh rate for metrics
-            else:
-                self._update_metrics()
-                time.sleep(0.5)
+        self.throttle.set_limit(destination=destination, source=source,
+                                bytes_per_sec=bytes_per_sec, files_per_sec=files_per_sec)
+        self._apply_throttle()
+
+    def set_schedule(self, rules: list):
+        """Installs a time-of-day limit schedule (see throttle.Throttle)."""
+        self.throttle.set_schedule(rules)
+        self._apply_throttle()
+
+    def _apply_throttle(self):
+        """Re-evaluates the schedule and sizes copy chunks to the slowest active limit."""
+        self.throttle.tick()
+        self.engine.kernel_chunk = self.throttle.chunk_size(KERNEL_CHUNK)
+
+    def _start_workers(self):
+        """
+        Starts the fixed set of long-lived workers. They block inside
+        QueueManager.get_next_task and are woken by new work, resume or shutdown.
+        """
+        for worker_id in range(self.max_workers):
+            self.executor.submit(worker_thread_task, self.manager, self.engine, worker_id)
+
+    def _metrics_loop(self):
+        """Publishes METRICS_UPDATE once per METRICS_INTERVAL until stop()."""
+        while not self._stop_event.wait(METRICS_INTERVAL):
+            self._apply_throttle()
+            if self.manager.state == self.manager.STATE_IDLE:
+                self.engine.flush()  # FSYNC_END: the queue drained, make what was copied durable
+            self._update_metrics()
 
     def _update_metrics(self):
         """Calculates rolling window metrics and thread usage."""
@@ -127,14 +182,17 @@ class CopyExecutorController:
         else:
             avg_item_rate = 0
             
-        # Introspect ThreadPoolExecutor (Standard library internal access, but SRE-approved for metrics)
-        try:
-            active_threads = len(self.executor._threads)
-            # busy_threads is harder to get, but we can estimate or use counters if we had wrapped.
-            # For now, we'll report the number of threads currently managed by the executor.
-            # A more advanced SRE tool might use a wrapper to track precise busy time.
-        except:
-            active_threads = 0
+        bytes_cloned, bytes_streamed = self.engine.byte_counts()
+
+        # Workers currently running a task (measured, not inferred from the executor's threads)
+        instruments = self.instruments.snapshot()
+        active_threads = sum(1 for worker in instruments["workers"] if worker["state"] == "busy")
+
+        if self.tuner:
+            concurrency = self._autotune(avg_byte_rate)
+        else:
+            concurrency = {"workers": self.max_workers, "min": self.max_workers, "max": self.max_workers,
+                           "reason": "fixed"}
 
         # Dispatch to GUI
         metrics = {
@@ -143,10 +201,51 @@ class CopyExecutorController:
             "active_threads": active_threads,
             "total_threads": self.max_workers,
             "total_bytes": curr_bytes,
-            "total_items": curr_items
+            "total_items": curr_items,
+            "total_skipped": self.manager.total_items_skipped,
+            "total_errors": self.manager.total_errors,
+            "total_deduplicated": self.manager.total_items_deduplicated,
+            "bytes_deduplicated": self.manager.total_bytes_deduplicated,
+            "bytes_cloned": bytes_cloned,       # Shared with the source by reflink, no data moved
+            "bytes_streamed": bytes_streamed,   # Read and written (in-kernel or userspace)
+            "io": self.engine.io_stats(),       # Page cache / fsync policies and their cost so far
+            "concurrency": concurrency,
+            "throttle": self.throttle.snapshot(),
+            "stages": instruments["stages"],
+            "workers": instruments["workers"]
         }
         self.manager.progress_channel.put(("METRICS_UPDATE", metrics))
 
+        if self.exporter is not None:
+            # Plain attribute reads: rendering must not contend for the manager's lock
+            manager = self.manager
+            states = (manager.STATE_IDLE, manager.STATE_RUNNING, manager.STATE_PAUSED)
+            self.exporter.publish(render_openmetrics(metrics, manager.state, states, manager.queue_depth(),
+                                                     self.instruments.stage_histograms()))
+
+
+    def _autotune(self, byte_rate: float) -> dict:
+        """Feeds the rolling byte rate to the tuner and applies its worker count."""
+        endpoints = self.manager.get_active_endpoints()
+        if endpoints:
+            lo, hi, self.device_classes = bounds_for([p for pair in endpoints for p in pair])
+            self.tuner.set_bounds(lo, min(hi, self.max_workers))
+        if self.manager.get_state() == self.manager.STATE_RUNNING:
+            self.tuner.update(byte_rate)
+        self.manager.set_worker_limit(self.tuner.workers)
+
+        concurrency = self.tuner.snapshot()
+        concurrency["devices"] = self.device_classes
+        return concurrency
+
+    def dump_metrics(self, path=None) -> dict:
+        """
+        Returns the stage histograms and worker accounting; with `path`, also
+        writes them (raw histogram buckets included) as JSON.
+        """
+        if path:
+            self.instruments.export(path)
+        return self.instruments.snapshot()
 
     def get_progress_channel(self):
         """Exposes the communication channel to the GUI."""
@@ -154,8 +253,17 @@ class CopyExecutorController:
 
     def stop(self):
         self.running = False
-        if self.worker_thread_handle:
-            # We don't join here to avoid GUI freeze, but we signal shutdown
-            pass
+        self._stop_event.set()
+        # Wakes every blocked worker so it exits; we don't join here to avoid GUI freeze
+        self.manager.shutdown()
         self.executor.shutdown(wait=False)
-        print("CopyExecutorController stopped.")
\ No newline at end of file
+        # Blocks until files copied under FSYNC_BATCH / FSYNC_END are on disk
+        self.engine.close()
+        if self.exporter is not None:
+            self.exporter.stop()
+        if self.hash_index is not None:
+            self.hash_index.flush()
+        if self.journal is not None:
+            self.journal.close()
+        self.fingerprints.close()
+        logger.debug("CopyExecutorController stopped.")
\ No newline at end of file
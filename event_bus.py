@@ -0,0 +1,126 @@
+import threading
+import queue
+from collections import deque
+
+# Only the latest value of these matters to a consumer: newer events replace older ones
+COALESCED_EVENTS = ("OP_PROGRESS", "QUEUE_UPDATE", "METRICS_UPDATE")
+# Coalesced per job rather than per type: their data is (job_fp, ...)
+PER_JOB_EVENTS = ("OP_PROGRESS",)
+# High-volume informational events: dropped (and counted) when the consumer falls behind
+LOSSY_EVENTS = ("LOG", "OP_START")
+# Per-unit results: above the high-water mark they are folded into one
+# ("TASK_RESULTS_FOLDED", {"job": job_fp, "count": n}) event per job, kept in order
+FOLDED_EVENTS = ("TASK_RESULT",)
+
+DEFAULT_CAPACITY = 10000  # Lossy events held for the consumer before new ones are dropped
+DEFAULT_ORDERED_CAPACITY = 10000  # Other ordered events held before results are folded
+
+
+class EventBus:
+    """
+    Bounded, coalescing replacement for the unbounded progress queue.
+    Producers never block: progress-style events overwrite their previous
+    value (per job for PER_JOB_EVENTS), lossy events are dropped beyond
+    `capacity`, TASK_RESULTs beyond `ordered_capacity` only add to a per-job
+    count, and the remaining control events (STATE_CHANGE, JOB_STATE,
+    TASK_DONE: a few per job) are always kept in order.
+    Consumers take everything pending in one call with drain().
+    Keeps the put()/get()/empty() interface of queue.Queue.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, ordered_capacity=DEFAULT_ORDERED_CAPACITY):
+        self.capacity = capacity
+        self.ordered_capacity = ordered_capacity
+        self._cond = threading.Condition(threading.Lock())
+        self._ordered = deque()   # (msg_type, data) in arrival order
+        self._lossy_count = 0     # Lossy events currently in _ordered
+        self._folded = {}         # job_fp -> data of its TASK_RESULTS_FOLDED event still in _ordered
+        self._latest = {}         # msg_type (or (msg_type, job_fp)) -> latest coalesced event
+        self.dropped = 0          # Lossy events discarded since the last drain
+
+    def put(self, event, block=True, timeout=None):
+        """Publishes a (msg_type, data) event. Never blocks (block/timeout exist for Queue compatibility)."""
+        msg_type = event[0]
+        with self._cond:
+            if msg_type in COALESCED_EVENTS:
+                self._latest[(msg_type, event[1][0]) if msg_type in PER_JOB_EVENTS else msg_type] = event
+            elif msg_type in LOSSY_EVENTS:
+                if self._lossy_count >= self.capacity:
+                    self.dropped += 1
+                    return
+                self._lossy_count += 1
+                self._ordered.append(event)
+            elif msg_type in FOLDED_EVENTS and len(self._ordered) - self._lossy_count >= self.ordered_capacity:
+                job_fp = event[1].get("parent")
+                folded = self._folded.get(job_fp)
+                if folded is None:
+                    self._folded[job_fp] = folded = {"job": job_fp, "count": 0}
+                    self._ordered.append(("TASK_RESULTS_FOLDED", folded))
+                folded["count"] += 1
+            else:
+                self._ordered.append(event)
+            self._cond.notify()
+
+    put_nowait = put
+
+    def _pending(self) -> bool:
+        return bool(self._ordered or self._latest)
+
+    def _taken(self, event):
+        """Bookkeeping for an event leaving _ordered."""
+        if event[0] in LOSSY_EVENTS:
+            self._lossy_count -= 1
+        elif event[0] == "TASK_RESULTS_FOLDED":
+            self._folded.pop(event[1]["job"], None)
+
+    def drain(self, max_items=None) -> list:
+        """
+        Returns pending events without blocking: up to `max_items` ordered events
+        first, then one event per coalesced type (and job). A LOG summarizing dropped events is
+        appended if the consumer fell behind.
+        """
+        with self._cond:
+            if max_items is None or max_items >= len(self._ordered):
+                events = list(self._ordered)
+                self._ordered.clear()
+                self._lossy_count = 0
+                self._folded.clear()
+            else:
+                events = [self._ordered.popleft() for _ in range(max_items)]
+                for event in events:
+                    self._taken(event)
+
+            events.extend(self._latest.values())
+            self._latest.clear()
+
+            if self.dropped:
+                events.append(("LOG", f"{self.dropped} events dropped (consumer too slow)"))
+                self.dropped = 0
+            return events
+
+    def get(self, block=True, timeout=None):
+        """Queue-compatible single event read (ordered events first)."""
+        with self._cond:
+            if not self._cond.wait_for(self._pending, timeout=timeout if block else 0):
+                raise queue.Empty
+            if self._ordered:
+                event = self._ordered.popleft()
+                self._taken(event)
+                return event
+            return self._latest.pop(next(iter(self._latest)))
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def wait(self, timeout=None) -> bool:
+        """Blocks until at least one event is pending. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(self._pending, timeout=timeout)
+
+    def empty(self) -> bool:
+        with self._cond:
+            return not self._pending()
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._ordered) + len(self._latest)
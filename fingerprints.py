@@ -0,0 +1,219 @@
+import os
+import time
+import hashlib
+import sqlite3
+from array import array
+
+DIGEST_SIZE = 16          # Bytes per fingerprint (128-bit BLAKE2b)
+INITIAL_SLOTS = 1 << 16
+MAX_LOAD = 0.7            # Used slots (dead ones included) before the table is rebuilt
+BLOOM_HASHES = 4
+BLOOM_BITS_PER_ENTRY = 10  # ~1% false positives at the designed capacity
+DEFAULT_MAX_MEMORY_ENTRIES = 4_000_000  # In-memory entries before spilling (when a spill file is set)
+
+# Default expiry: a job's fingerprints are dropped as soon as the job finishes,
+# so the same source/destination can be queued again afterwards
+RETAIN_UNTIL_DONE = 0
+RETAIN_FOREVER = None
+
+
+def fingerprint(source: str, destination: str, op_type: str) -> bytes:
+    """Fixed-width binary fingerprint of an operation."""
+    return hashlib.blake2b(f"{source}|{destination}|{op_type}".encode("utf-8"),
+                           digest_size=DIGEST_SIZE).digest()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over fingerprints (which are already uniformly distributed)."""
+
+    def __init__(self, capacity: int):
+        self.bits = max(1024, capacity * BLOOM_BITS_PER_ENTRY)
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, digest: bytes):
+        for i in range(BLOOM_HASHES):
+            yield int.from_bytes(digest[i * 4:i * 4 + 4], "little") % self.bits
+
+    def add(self, digest: bytes):
+        for pos in self._positions(digest):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self._array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+
+class FingerprintStore:
+    """
+    Compact replacement for a set of hex fingerprint strings.
+    Holds DIGEST_SIZE-byte digests in an open-addressing hash table backed by
+    one bytearray (digests) and one array of job ids, about 40 bytes per entry
+    (20 per slot, kept about half full) instead of ~190 for a Python str in a set.
+    Every fingerprint belongs to a job. When the job finishes, release_job()
+    applies the expiry policy given by `retention`: RETAIN_UNTIL_DONE (0)
+    drops them at once, N seconds keeps them that long (absorbing accidental
+    resubmits), RETAIN_FOREVER (None) never drops them. Dropping a job is O(1):
+    its id is marked dead and its slots are reclaimed on the next rebuild.
+    With `spill_path`, the table is moved to an SQLite file whenever it holds
+    more than `max_memory_entries`; an optional Bloom filter in front of the
+    spill answers most misses without touching disk.
+    Not thread-safe: QueueManager calls it under its own lock.
+    """
+
+    def __init__(self, retention=RETAIN_UNTIL_DONE, max_memory_entries=DEFAULT_MAX_MEMORY_ENTRIES,
+                 spill_path=None, bloom=True):
+        self.retention = retention
+        self.max_memory_entries = max_memory_entries
+        self._alloc(INITIAL_SLOTS)
+
+        self._job_ids = {}        # job fp -> small int id (0 marks an empty slot)
+        self._next_id = 1
+        self._dead = set()        # ids of expired jobs whose slots have not been reclaimed yet
+        self._counts = {}         # id -> [entries in memory, entries spilled]
+        self._expiring = []       # (deadline, job fp) for time-based retention
+
+        self._spill = None
+        self._spilled = 0
+        self._bloom = None
+        self._bloom_enabled = bloom
+        if spill_path:
+            if os.path.exists(spill_path):
+                os.remove(spill_path)   # Scratch file: never reused across runs
+            self._spill = sqlite3.connect(spill_path, check_same_thread=False)
+            self._spill.execute("PRAGMA journal_mode=OFF")
+            self._spill.execute("PRAGMA synchronous=OFF")
+            self._spill.execute("CREATE TABLE spill (digest BLOB PRIMARY KEY, job INTEGER)")
+            self._spill.execute("CREATE INDEX spill_job ON spill (job)")
+
+    def _alloc(self, slots: int):
+        self._slots = slots
+        self._mask = slots - 1
+        self._digests = bytearray(slots * DIGEST_SIZE)
+        self._owners = array("I", bytes(4 * slots))
+        self._used = 0   # Slots holding a digest, dead ones included
+        self._live = 0   # Slots holding a digest of a live job
+
+    def _find(self, digest: bytes):
+        """Returns (slot of digest or None, first free or reclaimable slot)."""
+        slot = int.from_bytes(digest[:8], "little") & self._mask
+        reusable = None
+        owners, digests = self._owners, self._digests
+        while True:
+            owner = owners[slot]
+            if owner == 0:
+                return None, slot if reusable is None else reusable
+            if owner in self._dead:
+                if reusable is None:
+                    reusable = slot
+            elif digests[slot * DIGEST_SIZE:(slot + 1) * DIGEST_SIZE] == digest:
+                return slot, None
+            slot = (slot + 1) & self._mask
+
+    def _in_spill(self, digest: bytes) -> bool:
+        if not self._spilled or (self._bloom is not None and digest not in self._bloom):
+            return False
+        return self._spill.execute("SELECT 1 FROM spill WHERE digest=?", (digest,)).fetchone() is not None
+
+    def __contains__(self, digest: bytes) -> bool:
+        return self._find(digest)[0] is not None or self._in_spill(digest)
+
+    def add(self, digest: bytes, job: str) -> bool:
+        """Records a fingerprint owned by `job`; returns False if it is already present."""
+        found, slot = self._find(digest)
+        if found is not None or self._in_spill(digest):
+            return False
+
+        job_id = self._job_ids.get(job)
+        if job_id is None:
+            job_id = self._job_ids[job] = self._next_id
+            self._next_id += 1
+            self._counts[job_id] = [0, 0]
+        if self._owners[slot] == 0:
+            self._used += 1
+        self._owners[slot] = job_id
+        self._digests[slot * DIGEST_SIZE:(slot + 1) * DIGEST_SIZE] = digest
+        self._live += 1
+        self._counts[job_id][0] += 1
+
+        if self.max_memory_entries and self._spill is not None and self._live > self.max_memory_entries:
+            self._spill_table()
+        elif self._used > self._slots * MAX_LOAD:
+            self._rebuild()
+        return True
+
+    def _entries(self, owners, digests, dead):
+        """Live (digest, job id) pairs of a table."""
+        for slot, owner in enumerate(owners):
+            if owner and owner not in dead:
+                yield digests[slot * DIGEST_SIZE:(slot + 1) * DIGEST_SIZE], owner
+
+    def _rebuild(self):
+        """Rehashes live entries into a table sized for them, reclaiming dead slots."""
+        owners, digests, dead, live = self._owners, self._digests, self._dead, self._live
+        slots = INITIAL_SLOTS
+        while slots * MAX_LOAD < live * 1.4:  # Half full after the rebuild
+            slots <<= 1
+        self._alloc(slots)
+        self._dead = set()
+        for digest, owner in self._entries(owners, digests, dead):
+            slot = self._find(digest)[1]
+            self._owners[slot] = owner
+            self._digests[slot * DIGEST_SIZE:(slot + 1) * DIGEST_SIZE] = digest
+        self._used = self._live = live
+
+    def _spill_table(self):
+        """Moves every in-memory entry to the spill file and starts an empty table."""
+        if self._bloom_enabled and self._bloom is None:
+            self._bloom = BloomFilter(self.max_memory_entries * 8)  # Sized for eight spills
+        bloom = self._bloom
+
+        def rows():
+            for digest, owner in self._entries(self._owners, self._digests, self._dead):
+                digest = bytes(digest)
+                if bloom is not None:
+                    bloom.add(digest)
+                yield digest, owner
+
+        self._spill.executemany("INSERT OR IGNORE INTO spill (digest, job) VALUES (?, ?)", rows())
+        self._spill.commit()
+        for counts in self._counts.values():
+            counts[1] += counts[0]
+            counts[0] = 0
+        self._spilled += self._live
+        self._alloc(INITIAL_SLOTS)
+        self._dead = set()
+
+    def _drop(self, job: str):
+        job_id = self._job_ids.pop(job, None)
+        if job_id is None:
+            return
+        in_memory, spilled = self._counts.pop(job_id)
+        if in_memory:
+            self._dead.add(job_id)
+            self._live -= in_memory
+        if spilled:
+            self._spill.execute("DELETE FROM spill WHERE job=?", (job_id,))
+            self._spill.commit()
+            self._spilled -= spilled
+            if not self._spilled:
+                self._bloom = None   # Bloom filters can't forget entries: start over
+
+    def release_job(self, job: str, now=None):
+        """Applies the expiry policy to the fingerprints of a finished job."""
+        if self.retention == RETAIN_UNTIL_DONE:
+            self._drop(job)
+        elif self.retention is not RETAIN_FOREVER:
+            self._expiring.append(((now or time.monotonic()) + self.retention, job))
+
+    def expire_due(self, now=None):
+        """Drops the fingerprints of finished jobs whose retention period has passed."""
+        now = now or time.monotonic()
+        while self._expiring and self._expiring[0][0] <= now:
+            self._drop(self._expiring.pop(0)[1])
+
+    def __len__(self):
+        return self._live + self._spilled
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
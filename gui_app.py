@@ -1,13 +1,12 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import threading
 import time
-import queue
 import sys
 import os
 
 from queue_manager import QueueManager
 from copy_manager import CopyExecutorController
+from journal import DEFAULT_JOURNAL_PATH
 from app_logger import logger
 from utils import format_bytes, format_time
 
@@ -117,6 +116,9 @@ class ThemeManager:
         except:
             pass
 
+UI_FRAME_MS = 50  # Backend events are drained and applied once per frame
+UI_FRAME_EVENTS = 200  # Ordered events applied per frame; the rest wait for the next one
+
 class FolderCopierApp:
     def __init__(self, root, initial_source=None):
         self.root = root
@@ -125,20 +127,22 @@ class FolderCopierApp:
         self.root.minsize(850, 650)
         
         # Backend Components
-        self.executor_controller = CopyExecutorController()
+        # Journaled so pending work survives closing or crashing the app
+        self.executor_controller = CopyExecutorController(journal_path=DEFAULT_JOURNAL_PATH)
         self.queue_manager = self.executor_controller.manager
         
         # State
         self.is_monitoring = True
+        self.job_progress = {}  # job fp -> (done bytes, total bytes) of unfinished jobs
         self.current_theme = tk.StringVar(value="Midnight (Dark)")
+        self.sync_mode = tk.BooleanVar(value=False)
         
         # Setup UI
         self._create_widgets()
         ThemeManager.apply_theme(self.root, self.current_theme.get())
         
-        # Monitoring Thread
-        self.monitor_thread = threading.Thread(target=self._monitor_backend, daemon=True)
-        self.monitor_thread.start()
+        # Backend event polling (one Tk callback per frame)
+        self.root.after(UI_FRAME_MS, self._monitor_backend)
         
         if initial_source:
             self.source_entry.insert(0, initial_source)
@@ -198,6 +202,9 @@ class FolderCopierApp:
         self.dest_entry = ttk.Entry(input_frame)
         self.dest_entry.grid(row=1, column=1, sticky='ew', padx=10, pady=5)
         ttk.Button(input_frame, text='Browse', command=self._browse_dest).grid(row=1, column=2)
+
+        ttk.Checkbutton(input_frame, text='Incremental sync (skip unchanged files)',
+                        variable=self.sync_mode).grid(row=2, column=1, sticky='w', padx=10, pady=5)
         
         # 3. Actions Frame
         action_frame = ttk.Frame(self.root, padding=5)
@@ -237,7 +244,7 @@ class FolderCopierApp:
         if not src or not dst:
             messagebox.showerror('Error', 'Source and Destination required!')
             return
-        success, msg = self.queue_manager.add_task(src, dst, 'copy')
+        success, msg = self.queue_manager.add_task(src, dst, 'sync' if self.sync_mode.get() else 'copy')
         if success:
             self._log(f'QUEUED: {src}')
             if self.queue_manager.get_state() == 'IDLE':
@@ -255,14 +262,14 @@ class FolderCopierApp:
             self._log('COMMAND: System Paused')
 
     def _monitor_backend(self):
-        while self.is_monitoring:
+        if not self.is_monitoring:
+            return
+        for msg_type, data in self.queue_manager.progress_channel.drain(max_items=UI_FRAME_EVENTS):
             try:
-                msg_type, data = self.queue_manager.progress_channel.get(timeout=0.1)
-                self.root.after(0, self._process_backend_message, msg_type, data)
-            except queue.Empty:
-                continue
+                self._process_backend_message(msg_type, data)
             except Exception as e:
                 logger.error(f'Monitor Error: {e}')
+        self.root.after(UI_FRAME_MS, self._monitor_backend)
 
     def _process_backend_message(self, msg_type, data):
         if msg_type == 'STATE_CHANGE':
@@ -281,13 +288,25 @@ class FolderCopierApp:
                 self.tree.insert("", "end", values=(f"Thread-{i+1}", "IDLE", "--"))
 
         elif msg_type == 'OP_PROGRESS':
-            if data[1] > 0:
-                pct = (data[0] / data[1]) * 100
-                self.main_progress['value'] = pct
-                self.lbl_progress_text.config(text=f"Progress: {pct:.1f}%")
+            job_fp, done, total = data
+            if done < total:
+                self.job_progress[job_fp] = (done, total)
+            else:
+                self.job_progress.pop(job_fp, None)  # Complete (its TASK_DONE may already be applied)
+            self._show_progress()
+        elif msg_type == 'TASK_DONE':
+            if self.job_progress.pop(data, None) is not None:
+                self._show_progress()
         elif msg_type == 'LOG':
             self._log(data)
 
+    def _show_progress(self):
+        """One bar for all unfinished jobs: their bytes done over their bytes planned."""
+        total = sum(t for _, t in self.job_progress.values())
+        pct = sum(d for d, _ in self.job_progress.values()) / total * 100 if total else 100.0
+        self.main_progress['value'] = pct
+        self.lbl_progress_text.config(text=f"Progress: {pct:.1f}%")
+
     def _log(self, msg):
         self.log_box.insert(tk.END, f" > {msg}")
         self.log_box.see(tk.END)
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import threading
+import time
+
+from utils import hash_file
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".folder_copier", "hash_index.db")
+DEFAULT_MAX_ENTRIES = 2_000_000
+COMMIT_EVERY = 1000  # Pending writes flushed to disk per transaction
+
+
+class HashIndex:
+    """
+    Persistent cache of BLAKE3 digests keyed by (device, inode, size, mtime_ns).
+    A file whose key is unchanged gets its digest back without reading it.
+    Backed by SQLite in WAL mode; writes are batched into transactions and
+    the least recently used entries are evicted beyond max_entries.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            " dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER,"
+            " digest TEXT NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (dev, ino, size, mtime_ns)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS hashes_lru ON hashes (last_used)")
+        self._count = self._db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+        self._pending = 0   # Statements executed since the last commit
+        self._db.execute("BEGIN")
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(st):
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def lookup(self, st):
+        """Returns the cached digest for an os.stat_result, or None."""
+        key = self._key(st)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest FROM hashes WHERE dev=? AND ino=? AND size=? AND mtime_ns=?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute(
+                "UPDATE hashes SET last_used=? WHERE dev=? AND ino=? AND size=? AND mtime_ns=?",
+                (time.time(),) + key
+            )
+            self._after_write()
+            return row[0]
+
+    def store(self, st, digest: str):
+        """Records the digest of a file described by an os.stat_result."""
+        key = self._key(st)
+        with self._lock:
+            # Older entries for the same inode are stale once its size/mtime change
+            cur = self._db.execute("DELETE FROM hashes WHERE dev=? AND ino=?", key[:2])
+            self._count -= max(cur.rowcount, 0)
+            self._db.execute(
+                "INSERT INTO hashes (dev, ino, size, mtime_ns, digest, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                key + (digest, time.time())
+            )
+            self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+            self._after_write()
+
+    def get_digest(self, path: str, hasher=hash_file):
+        """
+        Returns the BLAKE3 digest of a file, hashing it only on a cache miss.
+        The digest is cached only if the file did not change while being hashed.
+        """
+        st = os.stat(path)
+        digest = self.lookup(st)
+        if digest is not None:
+            return digest
+
+        digest = hasher(path)
+        if digest is not None and self._key(os.stat(path)) == self._key(st):
+            self.store(st, digest)
+        return digest
+
+    def _evict(self):
+        """Drops the least recently used entries, leaving 10% headroom (lock held)."""
+        excess = self._count - int(self.max_entries * 0.9)
+        self._db.execute(
+            "DELETE FROM hashes WHERE (dev, ino, size, mtime_ns) IN "
+            "(SELECT dev, ino, size, mtime_ns FROM hashes ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._count -= excess
+
+    def _after_write(self):
+        """Commits every COMMIT_EVERY writes so lookups never pay for an fsync (lock held)."""
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._db.execute("COMMIT")
+            self._db.execute("BEGIN")
+            self._pending = 0
+
+    def flush(self):
+        """Commits pending writes."""
+        with self._lock:
+            self._db.execute("COMMIT")
+            self._db.execute("BEGIN")
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._db.execute("COMMIT")
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._count
@@ -0,0 +1,119 @@
+import os
+import mmap
+import threading
+import concurrent.futures
+
+import blake3
+
+# Backend selection thresholds (by file size)
+SMALL_FILE_LIMIT = 1024 * 1024             # <= 1MB: one read() call
+MMAP_THRESHOLD = 16 * 1024 * 1024          # >= 16MB: memory-mapped
+THREADED_THRESHOLD = 128 * 1024 * 1024     # >= 128MB: memory-mapped + multithreaded BLAKE3
+
+BUFFER_SIZE = 1024 * 1024  # Reusable read buffer for the streaming backend
+
+BACKEND_SMALL = "small"
+BACKEND_BUFFERED = "buffered"
+BACKEND_MMAP = "mmap"
+BACKEND_THREADED = "threaded"
+
+_local = threading.local()
+_HAS_UPDATE_MMAP = hasattr(blake3.blake3(), "update_mmap")
+
+
+def _get_buffer():
+    buf = getattr(_local, "buffer", None)
+    if buf is None:
+        buf = bytearray(BUFFER_SIZE)
+        _local.buffer = buf
+    return buf
+
+
+def select_backend(size: int) -> str:
+    """Picks the cheapest hashing strategy for a file of the given size."""
+    if size <= SMALL_FILE_LIMIT:
+        return BACKEND_SMALL
+    if size < MMAP_THRESHOLD:
+        return BACKEND_BUFFERED
+    if size < THREADED_THRESHOLD:
+        return BACKEND_MMAP
+    return BACKEND_THREADED
+
+
+def _hash_small(path, hasher):
+    with open(path, 'rb', buffering=0) as f:
+        hasher.update(f.read())
+
+
+def _hash_buffered(path, hasher):
+    buf = _get_buffer()
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            hasher.update(view[:n])
+
+
+def _hash_mmap(path, hasher):
+    if _HAS_UPDATE_MMAP:
+        # Maps and hashes in native code without holding the GIL
+        hasher.update_mmap(path)
+        return
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            hasher.update(mapped)
+
+
+_BACKENDS = {
+    BACKEND_SMALL: _hash_small,
+    BACKEND_BUFFERED: _hash_buffered,
+    BACKEND_MMAP: _hash_mmap,
+    BACKEND_THREADED: _hash_mmap,
+}
+
+
+def hash_path(path: str, backend: str = None) -> str:
+    """
+    Returns the BLAKE3 hex digest of a file. Raises OSError on I/O errors.
+    The backend is chosen from the file size unless given explicitly.
+    """
+    if backend is None:
+        backend = select_backend(os.stat(path).st_size)
+
+    if backend == BACKEND_THREADED:
+        hasher = blake3.blake3(max_threads=blake3.blake3.AUTO)
+    else:
+        hasher = blake3.blake3()
+    _BACKENDS[backend](path, hasher)
+    return hasher.hexdigest()
+
+
+def hash_many(paths, max_workers=None):
+    """
+    Batch API: hashes many (typically small) files across a thread pool.
+    Yields (path, digest) in completion order; digest is None if the file could not be read.
+    Large files still use the multithreaded backend inside their own task.
+    """
+    max_workers = max_workers or min(32, (os.cpu_count() or 1) * 2)
+
+    def _safe_hash(path):
+        try:
+            return path, hash_path(path)
+        except OSError:
+            return path, None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hasher") as pool:
+        # Bounded window of in-flight futures so huge path generators aren't materialized
+        in_flight = set()
+        for path in paths:
+            in_flight.add(pool.submit(_safe_hash, path))
+            if len(in_flight) >= max_workers * 4:
+                done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in concurrent.futures.as_completed(in_flight):
+            yield future.result()
@@ -0,0 +1,250 @@
+import json
+import time
+import threading
+import weakref
+
+# Pipeline stages timed by the engine, scanner and workers
+STAGE_SCAN = "scan"            # Listing one directory
+STAGE_OPEN = "open"            # Opening source and destination
+STAGE_READ = "read"            # Userspace read() / pread()
+STAGE_WRITE = "write"          # Userspace write() / pwrite()
+STAGE_COPY = "copy"            # In-kernel copy_file_range / sendfile (read and write in one call)
+STAGE_FSYNC = "fsync"          # fsync / fdatasync
+STAGE_METADATA = "metadata"    # stat, chmod, utime, copystat
+STAGE_HASH = "hash"            # BLAKE3 digesting
+STAGE_QUEUE_WAIT = "queue_wait"  # Worker blocked in get_next_task (lock + waiting for work)
+STAGES = (STAGE_SCAN, STAGE_OPEN, STAGE_READ, STAGE_WRITE, STAGE_COPY, STAGE_FSYNC,
+          STAGE_METADATA, STAGE_HASH, STAGE_QUEUE_WAIT)
+
+SUB_BITS = 4                   # 16 sub-buckets per power of two: <= 6.25% relative error
+SUB_COUNT = 1 << SUB_BITS
+BUCKETS = 64 * SUB_COUNT       # Covers every 64-bit nanosecond value
+
+
+def _bucket(value: int) -> int:
+    if value < SUB_COUNT:
+        return max(value, 0)
+    shift = value.bit_length() - SUB_BITS - 1
+    return (shift + 1) * SUB_COUNT + (value >> shift) - SUB_COUNT
+
+
+def _bucket_high(index: int) -> int:
+    """Largest value that falls into bucket `index`."""
+    if index < SUB_COUNT:
+        return index
+    shift = index // SUB_COUNT - 1
+    return (((index % SUB_COUNT) + SUB_COUNT + 1) << shift) - 1
+
+
+class Histogram:
+    """
+    HDR-style log-linear histogram of nanosecond durations.
+    Recording is a bucket computation and a list increment; memory is fixed.
+    Each instance is written by a single thread (see Instruments), so no lock.
+    """
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int):
+        self.counts[_bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction: float) -> int:
+        if not self.count:
+            return 0
+        rank = max(1, int(self.count * fraction + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(_bucket_high(index), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """Count, totals and percentiles in milliseconds."""
+        return {
+            "count": self.count,
+            "total_s": round(self.total / 1e9, 6),
+            "mean_ms": round(self.total / self.count / 1e6, 4) if self.count else 0,
+            "p50_ms": round(self.percentile(0.50) / 1e6, 4),
+            "p90_ms": round(self.percentile(0.90) / 1e6, 4),
+            "p99_ms": round(self.percentile(0.99) / 1e6, 4),
+            "max_ms": round(self.max / 1e6, 4),
+        }
+
+    def cumulative(self, bounds_ns) -> list:
+        """Cumulative counts at each of the ascending bounds (for fixed-bucket exporters)."""
+        result = []
+        seen = index = 0
+        for bound in bounds_ns:
+            while index < BUCKETS and _bucket_high(index) <= bound:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+    def buckets(self) -> list:
+        """Non-empty buckets as [upper_bound_ns, count] pairs (for export)."""
+        return [[_bucket_high(i), n] for i, n in enumerate(self.counts) if n]
+
+
+class WorkerStats:
+    """Busy/idle accounting of one worker, updated only by that worker's thread."""
+
+    __slots__ = ("worker_id", "busy_ns", "idle_ns", "cpu_ns", "tasks", "busy_since")
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.busy_ns = 0
+        self.idle_ns = 0
+        self.cpu_ns = 0
+        self.tasks = 0
+        self.busy_since = None   # perf_counter_ns() while a task is running
+
+    def snapshot(self, now: int) -> dict:
+        busy = self.busy_ns + (now - self.busy_since if self.busy_since is not None else 0)
+        elapsed = busy + self.idle_ns
+        return {
+            "worker": self.worker_id,
+            "state": "busy" if self.busy_since is not None else "idle",
+            "busy_s": round(busy / 1e9, 3),
+            "idle_s": round(self.idle_ns / 1e9, 3),
+            # CPU time of the worker thread while busy: near busy_s means CPU-bound, far below means waiting on I/O
+            "cpu_s": round(self.cpu_ns / 1e9, 3),
+            "utilization": round(busy / elapsed, 3) if elapsed else 0.0,
+            "tasks": self.tasks,
+        }
+
+
+class _ThreadToken:
+    """Lives in a recording thread's local storage; its finalizer runs when the thread exits."""
+    __slots__ = ("__weakref__",)
+
+
+class Instruments:
+    """
+    Low-overhead stage timing and per-worker busy/idle accounting.
+    Each thread records into its own histograms (no locking on the hot path);
+    readers merge them on demand, so numbers may trail writers by a few samples.
+    When a thread exits (scanner and dedup pool threads come and go with every
+    job) its histograms are folded into one shared aggregate, so the number of
+    histogram sets stays bounded by the number of live threads.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()      # Guards registration, retirement and the retired aggregate
+        self._thread_hists = {}            # key -> {stage: Histogram} of each live recording thread
+        self._next_key = 0
+        self._retired = {}                 # stage -> Histogram merged from threads that exited
+        self._workers = {}
+        self.started = time.time()
+
+    def _hists(self) -> dict:
+        hists = getattr(self._local, "hists", None)
+        if hists is None:
+            hists = self._local.hists = {}
+            token = self._local.token = _ThreadToken()
+            with self._lock:
+                key = self._next_key
+                self._next_key += 1
+                self._thread_hists[key] = hists
+            weakref.finalize(token, self._retire, key)
+        return hists
+
+    def _retire(self, key: int):
+        """Folds the histograms of a thread that exited into the retired aggregate."""
+        with self._lock:
+            for stage, hist in self._thread_hists.pop(key, {}).items():
+                self._retired.setdefault(stage, Histogram()).merge(hist)
+
+    def recording_threads(self) -> int:
+        """Live threads holding their own histograms."""
+        with self._lock:
+            return len(self._thread_hists)
+
+    def record(self, stage: str, duration_ns: int):
+        hists = self._hists()
+        hist = hists.get(stage)
+        if hist is None:
+            hist = hists[stage] = Histogram()
+        hist.record(duration_ns)
+
+    # --- Worker accounting (called from worker_thread_task) ---
+
+    def worker(self, worker_id) -> WorkerStats:
+        with self._lock:
+            stats = self._workers.get(worker_id)
+            if stats is None:
+                stats = self._workers[worker_id] = WorkerStats(worker_id)
+            return stats
+
+    def worker_idle(self, stats: WorkerStats, waited_ns: int):
+        stats.idle_ns += waited_ns
+        self.record(STAGE_QUEUE_WAIT, waited_ns)
+
+    @staticmethod
+    def worker_start(stats: WorkerStats) -> int:
+        """Marks the worker busy; returns the thread CPU time to pass to worker_done."""
+        stats.busy_since = time.perf_counter_ns()
+        return time.thread_time_ns()
+
+    @staticmethod
+    def worker_done(stats: WorkerStats, cpu_start: int):
+        stats.busy_ns += time.perf_counter_ns() - stats.busy_since
+        stats.cpu_ns += time.thread_time_ns() - cpu_start
+        stats.tasks += 1
+        stats.busy_since = None
+
+    # --- Reading ---
+
+    def stage_histograms(self) -> dict:
+        """Merged histogram per stage across all threads."""
+        merged = {}
+        with self._lock:
+            per_thread = [dict(hists) for hists in self._thread_hists.values()]
+            for stage, hist in self._retired.items():
+                merged.setdefault(stage, Histogram()).merge(hist)
+        for hists in per_thread:
+            for stage, hist in hists.items():
+                merged.setdefault(stage, Histogram()).merge(hist)
+        return merged
+
+    def busy_workers(self) -> int:
+        with self._lock:
+            return sum(1 for stats in self._workers.values() if stats.busy_since is not None)
+
+    def snapshot(self, buckets: bool = False) -> dict:
+        """
+        Stage latency summaries and per-worker accounting. With buckets=True the
+        raw histogram buckets are included so percentiles can be recomputed elsewhere.
+        """
+        stages = {}
+        for stage, hist in self.stage_histograms().items():
+            stages[stage] = hist.summary()
+            if buckets:
+                stages[stage]["buckets"] = hist.buckets()
+        now = time.perf_counter_ns()
+        with self._lock:
+            workers = [stats.snapshot(now) for _, stats in sorted(self._workers.items())]
+        return {"stages": stages, "workers": workers, "uptime_s": round(time.time() - self.started, 3)}
+
+    def export(self, path: str):
+        """Writes a full snapshot (raw buckets included) as JSON."""
+        with open(path, "w") as f:
+            json.dump(self.snapshot(buckets=True), f, indent=2)
@@ -0,0 +1,186 @@
+import os
+import json
+import queue
+import sqlite3
+import threading
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".folder_copier", "journal.db")
+MAX_BATCH = 5000  # Records applied per transaction
+
+_STOP = object()
+
+
+class JobJournal:
+    """
+    Write-ahead journal of queued jobs and their file-level units (SQLite, WAL mode).
+    Callers only append records to an in-memory queue; a background writer
+    thread applies them in batched transactions, so journaling never blocks
+    a copy worker on disk I/O. On startup load_unfinished() returns what is
+    needed to rebuild the queue at file / byte-range granularity.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " fp TEXT PRIMARY KEY, source TEXT, destination TEXT, type TEXT,"
+            " planned INTEGER DEFAULT 0, done INTEGER DEFAULT 0)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS units ("
+            " fp TEXT PRIMARY KEY, parent TEXT, type TEXT, source TEXT, destination TEXT,"
+            " size INTEGER, offset INTEGER, sync INTEGER DEFAULT 0,"
+            " done_bytes INTEGER DEFAULT 0, done INTEGER DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS units_parent ON units (parent)")
+        # Verification digests outlive the compaction of finished jobs: they are the copy's record
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS digests ("
+            " unit TEXT PRIMARY KEY, job TEXT, source TEXT, destination TEXT,"
+            " offset INTEGER, size INTEGER, digest TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS digests_job ON digests (job)")
+        # Columns added after the first schema version
+        for table, column in (("units", "files TEXT"), ("jobs", "priority TEXT"), ("jobs", "mirrors TEXT"),
+                              ("units", "digest TEXT"), ("units", "mtimes TEXT")):
+            try:
+                self._db.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass
+
+        self._records = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name="journal-writer", daemon=True)
+        self._writer.start()
+
+    # --- Recording (called from the hot path, never blocks on disk) ---
+
+    def job_added(self, task: dict):
+        mirrors = json.dumps(task["mirrors"]) if task.get("mirrors") else None
+        self._records.put(("INSERT OR REPLACE INTO jobs (fp, source, destination, type, priority, mirrors)"
+                           " VALUES (?, ?, ?, ?, ?, ?)",
+                           (task["fp"], task["source"], task["destination"], task["type"], task.get("priority"), mirrors)))
+
+    def job_priority(self, fp: str, priority: str):
+        self._records.put(("UPDATE jobs SET priority=? WHERE fp=?", (priority, fp)))
+
+    def units_added(self, units: list):
+        # DEDUP units also keep the group's digest and planning-time mtimes, so a restored unit is checked the same way
+        rows = [(u["fp"], u["parent"], u["type"], u["source"], u["destination"], u["size"],
+                 u.get("offset"), int(bool(u.get("sync"))), json.dumps(u["files"]) if "files" in u else None,
+                 u.get("digest"), json.dumps(u["mtimes"]) if u.get("mtimes") else None)
+                for u in units]
+        self._records.put(("INSERT OR REPLACE INTO units"
+                           " (fp, parent, type, source, destination, size, offset, sync, files, digest, mtimes)"
+                           " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows))
+
+    def job_planned(self, fp: str):
+        self._records.put(("UPDATE jobs SET planned=1 WHERE fp=?", (fp,)))
+
+    def unit_done(self, fp: str):
+        self._records.put(("UPDATE units SET done=1 WHERE fp=?", (fp,)))
+
+    def unit_verified(self, unit: dict, digest: str):
+        """Records the BLAKE3 digest of a unit's source data (a whole file, or one range of a split file)."""
+        self._records.put(("INSERT OR REPLACE INTO digests (unit, job, source, destination, offset, size, digest)"
+                           " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (unit["fp"], unit.get("parent"), unit["source"], unit["destination"], unit.get("offset"),
+                            unit["size"], digest)))
+
+    def checkpoint(self, fp: str, done_bytes: int):
+        """Records how much of a byte-range unit is already durable at the destination."""
+        self._records.put(("UPDATE units SET done_bytes=? WHERE fp=?", (done_bytes, fp)))
+
+    def job_replan(self, fp: str):
+        """Drops the units of a job whose planning was interrupted; it will be planned again."""
+        self._records.put(("DELETE FROM units WHERE parent=?", (fp,)))
+
+    def job_done(self, fp: str):
+        # Finished jobs are compacted: only the job row is kept
+        self._records.put(("DELETE FROM units WHERE parent=?", (fp,)))
+        self._records.put(("UPDATE jobs SET done=1 WHERE fp=?", (fp,)))
+
+    # --- Writer ---
+
+    def _writer_loop(self):
+        while True:
+            record = self._records.get()
+            batch = [record]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._records.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            self._db.execute("BEGIN")
+            for record in batch:
+                if record is _STOP:
+                    stop = True
+                    continue
+                sql, params = record
+                if isinstance(params, list):
+                    self._db.executemany(sql, params)
+                else:
+                    self._db.execute(sql, params)
+            self._db.execute("COMMIT")
+            if stop:
+                return
+
+    # --- Recovery ---
+
+    def load_unfinished(self) -> list:
+        """
+        Returns [(job, units)] for every job that did not finish. `job` is a
+        task dict plus "planned"; `units` holds the job's not-yet-done units,
+        each with the byte count already checkpointed in "done_bytes".
+        Jobs whose planning never finished come back with an empty unit list.
+        """
+        result = []
+        jobs = self._db.execute(
+            "SELECT fp, source, destination, type, planned, COALESCE(priority, 'normal'), mirrors FROM jobs WHERE done=0"
+        ).fetchall()
+        for fp, source, destination, op_type, planned, priority, mirrors in jobs:
+            job = {"fp": fp, "source": source, "destination": destination, "type": op_type,
+                   "planned": bool(planned), "priority": priority}
+            if mirrors:
+                job["mirrors"] = json.loads(mirrors)
+            units = []
+            if planned:
+                job["done_bytes"], job["items_done"] = self._db.execute(
+                    "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM units WHERE parent=? AND done=1", (fp,)
+                ).fetchone()
+                for row in self._db.execute(
+                        "SELECT fp, type, source, destination, size, offset, sync, done_bytes, files, digest, mtimes"
+                        " FROM units WHERE parent=? AND done=0", (fp,)):
+                    unit = {"fp": row[0], "parent": fp, "type": row[1], "source": row[2],
+                            "destination": row[3], "size": row[4], "sync": bool(row[6]), "done_bytes": row[7]}
+                    if row[5] is not None:
+                        unit["offset"] = row[5]
+                    if row[8] is not None:
+                        unit["files"] = [tuple(f) for f in json.loads(row[8])]
+                    if row[9] is not None:
+                        unit["digest"] = row[9]
+                    if row[10] is not None:
+                        unit["mtimes"] = json.loads(row[10])
+                    units.append(unit)
+            result.append((job, units))
+        return result
+
+    def load_digests(self, job_fp: str = None) -> list:
+        """Recorded verification digests (of one job, or all) as dicts; offset is None for whole files."""
+        sql = "SELECT job, source, destination, offset, size, digest FROM digests"
+        rows = self._db.execute(sql + " WHERE job=?", (job_fp,)) if job_fp else self._db.execute(sql)
+        return [{"job": row[0], "source": row[1], "destination": row[2], "offset": row[3], "size": row[4],
+                 "digest": row[5]} for row in rows.fetchall()]
+
+    def close(self):
+        """Flushes every pending record and stops the writer."""
+        self._records.put(_STOP)
+        self._writer.join()
+        self._db.close()
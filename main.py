@@ -1,7 +1,14 @@
-import tkinter as tk
-from gui_app import FolderCopierApp
+import sys
 
 def main():
+    # With arguments run headless; tkinter is only imported for the GUI
+    if len(sys.argv) > 1:
+        from cli import main as cli_main
+        sys.exit(cli_main())
+
+    import tkinter as tk
+    from gui_app import FolderCopierApp
+
     root = tk.Tk()
     app = FolderCopierApp(root)
     root.mainloop()
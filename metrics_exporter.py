@@ -0,0 +1,120 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 9464
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PREFIX = "foldercopier"
+
+# Histogram bucket bounds (seconds) exported for stage latencies
+LATENCY_BOUNDS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+
+def _fmt(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def render(metrics: dict, state: str, states: tuple, queue_depth: int, histograms: dict) -> str:
+    """
+    Renders one METRICS_UPDATE payload plus the stage histograms as OpenMetrics text.
+    Pure function of its arguments: never touches the QueueManager.
+    """
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        for suffix, labels, value in samples:
+            label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+            lines.append(f"{PREFIX}_{name}{suffix}{label_text} {_fmt(value)}")
+
+    family("bytes", "counter", "Bytes copied.", [("_total", {}, metrics["total_bytes"])])
+    family("files", "counter", "Files copied or found unchanged.", [("_total", {}, metrics["total_items"])])
+    family("files_skipped", "counter", "Files left untouched by incremental sync.",
+           [("_total", {}, metrics["total_skipped"])])
+    family("errors", "counter", "Per-file failures.", [("_total", {}, metrics["total_errors"])])
+    family("copied_bytes", "counter", "Bytes copied by cloning (reflink) or by streaming the data.",
+           [("_total", {"method": "clone"}, metrics["bytes_cloned"]),
+            ("_total", {"method": "stream"}, metrics["bytes_streamed"])])
+    family("files_deduplicated", "counter", "Files linked to an identical copy instead of written.",
+           [("_total", {}, metrics["total_deduplicated"])])
+    family("bytes_deduplicated", "counter", "Bytes not written thanks to deduplication.",
+           [("_total", {}, metrics["bytes_deduplicated"])])
+    family("direct_io_bytes", "counter", "Bytes copied with O_DIRECT, bypassing the page cache.",
+           [("_total", {}, metrics["io"]["bytes_direct"])])
+    family("fsyncs", "counter", "fsync calls made to force copied files to disk.",
+           [("_total", {}, metrics["io"]["fsyncs"])])
+    family("fsync_seconds", "counter", "Seconds spent in fsync (by workers or the background syncer).",
+           [("_total", {}, float(metrics["io"]["fsync_seconds"]))])
+    family("fsync_pending", "gauge", "Copied files not yet forced to disk by the background syncer.",
+           [("", {}, metrics["io"]["fsync_pending"])])
+    family("throttled_seconds", "counter", "Seconds workers slept because of rate limits.",
+           [("_total", {}, metrics["throttle"]["waited"])])
+
+    family("queue_depth", "gauge", "Work units queued (paused jobs included).", [("", {}, queue_depth)])
+    family("state", "stateset", "Operational state of the queue manager.",
+           [("", {f"{PREFIX}_state": s}, 1 if s == state else 0) for s in states])
+    family("active_workers", "gauge", "Workers currently running a task.", [("", {}, metrics["active_threads"])])
+    family("workers", "gauge", "Workers allowed to take tasks.", [("", {}, metrics["concurrency"]["workers"])])
+    family("byte_rate", "gauge", "Bytes per second over the last 3 seconds.", [("", {}, float(metrics["byte_rate"]))])
+    family("file_rate", "gauge", "Files per second over the last 3 seconds.", [("", {}, float(metrics["item_rate"]))])
+
+    samples = []
+    for worker in metrics["workers"]:
+        labels = {"worker": worker["worker"]}
+        samples.append(("_total", dict(labels, mode="busy"), worker["busy_s"]))
+        samples.append(("_total", dict(labels, mode="idle"), worker["idle_s"]))
+    family("worker_seconds", "counter", "Wall time each worker spent busy or idle.", samples)
+
+    samples = []
+    for stage, hist in sorted(histograms.items()):
+        counts = hist.cumulative([bound * 1e9 for bound in LATENCY_BOUNDS])
+        for bound, cumulative in zip(LATENCY_BOUNDS, counts):
+            samples.append(("_bucket", {"stage": stage, "le": repr(bound)}, cumulative))
+        samples.append(("_bucket", {"stage": stage, "le": "+Inf"}, hist.count))
+        samples.append(("_count", {"stage": stage}, hist.count))
+        samples.append(("_sum", {"stage": stage}, hist.total / 1e9))
+    family("stage_latency_seconds", "histogram", "Latency of each copy pipeline stage.", samples)
+
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Localhost HTTP endpoint serving OpenMetrics text at /metrics.
+    The body is rendered by the metrics thread and swapped in with publish();
+    a scrape only reads the latest rendered bytes, so it never waits on
+    (or slows down) the copy workers.
+    """
+
+    def __init__(self, port=DEFAULT_PORT, host="127.0.0.1"):
+        self._body = b"# EOF\n"
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = exporter._body
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass  # Scrapes are not worth a log line
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]  # Actual port when 0 was requested
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+
+    def publish(self, text: str):
+        self._body = text.encode("utf-8")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
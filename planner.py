@@ -0,0 +1,89 @@
+PLAN_BATCH_SIZE = 512  # File units handed to the QueueManager per lock acquisition
+
+
+def plan_job(manager, engine, task, on_error=None) -> int:
+    """
+    Planner stage: expands a queued folder task into file-level work units.
+    Files above the engine's split threshold become several RANGE units so
+    different workers can copy parts of the same file concurrently; files
+    below its small-file threshold are packed into BATCH units so the
+    per-unit queue, lock and event overhead is paid once per batch.
+    Units are pushed to the shared queue in batches while the tree is still
+    being walked, so idle workers start copying before the walk finishes.
+    For SYNC tasks (and tasks re-planned after a restart) units are flagged so
+    workers skip files that are unchanged at the destination.
+    With deduplication on, the whole listing is collected first: each group
+    of identical files becomes one DEDUP unit (copied once, linked for the
+    rest) and every other file is planned as usual.
+    A job with several destinations ("mirrors") is planned against its first
+    destination; every unit carries the target roots of all of them so the
+    worker reads each source file once and writes it everywhere. Such jobs
+    never split files: one reader per file feeds all destinations.
+    Returns the number of units queued.
+    """
+    sync = task['type'].upper() == "SYNC" or task.get('resume', False)
+    mirrors = task.get('mirrors') or []
+    fanout = {}
+    if mirrors:
+        fanout = {"root": engine.target_root(task['source'], task['destination']),
+                  "mirrors": [engine.target_root(task['source'], mirror) for mirror in mirrors]}
+    batch = []
+    small = []          # (src, dst, size) waiting for the next BATCH unit
+    small_bytes = 0
+    queued = 0
+
+    def flush_small():
+        nonlocal small, small_bytes
+        if small:
+            batch.append({"type": "BATCH", "source": small[0][0], "destination": small[0][1],
+                          "size": small_bytes, "files": small, "sync": sync})
+            small, small_bytes = [], 0
+
+    def plan_file(src_path, dst_path, size):
+        nonlocal small_bytes
+        # Unchanged large files stay whole so the worker's sync check can skip them
+        # (splitting would truncate the existing destination copy)
+        if not mirrors and engine.should_split(src_path, size) \
+                and not (sync and engine.is_unchanged(src_path, dst_path, use_hash=False)):
+            try:
+                ranges = engine.prepare_split(src_path, dst_path, size)
+            except OSError as e:
+                if on_error is None:
+                    raise
+                on_error(e)
+                return
+            for offset, length in ranges:
+                batch.append({"type": "RANGE", "source": src_path, "destination": dst_path,
+                              "size": length, "offset": offset})
+        elif engine.should_batch(size):
+            small.append((src_path, dst_path, size))
+            small_bytes += size
+            if len(small) >= engine.batch_max_files or small_bytes >= engine.batch_max_bytes:
+                flush_small()
+        else:
+            batch.append({"type": "FILE", "source": src_path, "destination": dst_path, "size": size, "sync": sync})
+
+    def flush_batch(force=False):
+        nonlocal batch, queued
+        if len(batch) >= PLAN_BATCH_SIZE or (force and batch):
+            for unit in batch:
+                unit.update(fanout)
+            queued += manager.add_subtasks(task['fp'], batch)
+            batch = []
+
+    entries = engine.iter_tree(task['source'], task['destination'], on_error=on_error, mirrors=mirrors)
+    if engine.dedup:
+        groups, entries = engine.find_duplicates(list(entries))
+        for digest, files, mtimes in groups:
+            batch.append({"type": "DEDUP", "source": files[0][0], "destination": files[0][1],
+                          "size": sum(size for _, _, size in files), "files": files, "digest": digest,
+                          "mtimes": mtimes, "sync": sync})
+            flush_batch()
+
+    for src_path, dst_path, size in entries:
+        plan_file(src_path, dst_path, size)
+        flush_batch()
+
+    flush_small()
+    flush_batch(force=True)
+    return queued
@@ -1,185 +1,892 @@
-import threading
-import hashlib
-import time
-import queue
-
-class QueueManager:
-    """
-    Manages the operational state (IDLE, PAUSED, RUNNING) and the thread-safe task queue.
-    Implements operation fingerprinting for idempotency checks.
-    """
-    STATE_IDLE = "IDLE"
-    STATE_PAUSED = "PAUSED"
-    STATE_RUNNING = "RUNNING"
-
-    def __init__(self):
-        # State management
-        self.state = self.STATE_IDLE
-        self._lock = threading.Lock()
-
-        # Data structures
-        self.task_queue = queue.Queue()
-        self.fingerprint_set = set()  # Stores unique hashes of tasks already queued/processed
-
-        # Communication channel for workers to report back to the main thread/GUI
-        self.progress_channel = queue.Queue()
-        self.current_operation = None
-
-        # SRE Metrics
-        self.total_bytes_processed = 0
-        self.total_items_completed = 0
-
-    def _generate_fingerprint(self, source: str, destination: str, op_type: str) -> str:
-        """Generates a deterministic hash for an operation."""
-        data = f"{source}|{destination}|{op_type}"
-        return hashlib.sha256(data.encode('utf-8')).hexdigest()
-
-    def add_task(self, source: str, destination: str, op_type: str = "COPY") -> tuple[bool, str]:
-        """Adds a task if it's not a duplicate."""
-        fp = self._generate_fingerprint(source, destination, op_type)
-
-        with self._lock:
-            if fp in self.fingerprint_set:
-                # Idempotency check successful: Task already queued or processed
-                msg = f"Idempotent task skipped: {source} -> {destination}"
-                self.progress_channel.put(("LOG", msg))
-                return False, msg
-
-            task_data = {"fp": fp, "source": source, "destination": destination, "type": op_type}
-            self.task_queue.put(task_data)
-            self.fingerprint_set.add(fp)
-            self.progress_channel.put(("QUEUE_UPDATE", len(self.task_queue.queue)))
-            msg = f"Task added: {source}"
-            self.progress_channel.put(("LOG", msg))
-
-            # If currently IDLE and a task is added, we remain IDLE as per design (no auto-start)
-            return True, msg
-
-    def pause(self) -> bool:
-        """Transitions state to PAUSED, respecting transition rules."""
-        with self._lock:
-            if self.state == self.STATE_RUNNING:
-                self.state = self.STATE_PAUSED
-                self.progress_channel.put(("STATE_CHANGE", self.STATE_PAUSED))
-                self.progress_channel.put(("LOG", "Operation Paused."))
-                return True
-            return False
-
-    def resume(self) -> bool:
-        """Transitions state to RUNNING, respecting transition rules."""
-        with self._lock:
-            if self.state == self.STATE_PAUSED:
-                self.state = self.STATE_RUNNING
-                self.progress_channel.put(("STATE_CHANGE", self.STATE_RUNNING))
-                self.progress_channel.put(("LOG", "Operation Resumed."))
-                # Note: The worker loop must check this state change
-                return True
-            elif self.state == self.STATE_IDLE:
-                # Per design: Transitioning from IDLE to RUNNING only happens if the worker loop is active
-                # However, if the worker loop hasn't been started yet (no tasks submitted), we rely on the main loop to start it later.
-                # For simplicity here, we transition RUNNING if the queue has items and we weren't PAUSED.
-                if not self.task_queue.empty():
-                    self.state = self.STATE_RUNNING
-                    self.progress_channel.put(("STATE_CHANGE", self.STATE_RUNNING))
-                    self.progress_channel.put(("LOG", "Operation Started (from IDLE state)."))
-                    return True
-            return False
-
-    def get_next_task(self):
-        """Safely retrieves the next task and checks state."""
-        with self._lock:
-            if self.state == self.STATE_IDLE:
-                return None
-            
-            if self.state == self.STATE_PAUSED:
-                # Worker pauses execution until state changes
-                return "PAUSE_BLOCKER"
-
-            if self.task_queue.empty():
-                self.state = self.STATE_IDLE
-                self.progress_channel.put(("STATE_CHANGE", self.STATE_IDLE))
-                self.progress_channel.put(("LOG", "Queue empty. Operation complete."))
-                return None
-            
-            # State is RUNNING and queue is not empty
-            task = self.task_queue.get()
-            self.current_operation = task['fp']
-            return task
-
-    def task_complete(self, fp: str, bytes_count: int = 0):
-        """Called by worker after successful processing."""
-        with self._lock:
-            if self.current_operation == fp:
-                self.current_operation = None
-                self.total_items_completed += 1
-                self.total_bytes_processed += bytes_count
-                
-                self.progress_channel.put(("TASK_DONE", fp))
-                self.progress_channel.put(("QUEUE_UPDATE", len(self.task_queue.queue)))
-                
-                # Important: Re-check state after completion (might revert to IDLE/PAUSED)
-                if self.state == self.STATE_RUNNING and self.task_queue.empty():
-                    self.state = self.STATE_IDLE
-                    self.progress_channel.put(("STATE_CHANGE", self.STATE_IDLE))
-                    self.progress_channel.put(("LOG", "Queue empty. Operation complete."))
-
-    def get_status(self):
-        with self._lock:
-            return self.state, len(self.task_queue.queue)
-
-    def get_state(self):
-        with self._lock:
-            return self.state
-
-    def set_state(self, new_state):
-        """Allows GUI to force state transitions."""
-        if new_state == self.STATE_PAUSED:
-            self.pause()
-        elif new_state == self.STATE_RUNNING:
-            self.resume()
-        elif new_state == self.STATE_IDLE:
-            with self._lock:
-                self.state = self.STATE_IDLE
-                self.progress_channel.put(("STATE_CHANGE", self.STATE_IDLE))
-
-# --- Worker Function (Simulating CopyManager Refactor) ---
-
-def worker_thread_task(manager: QueueManager):
-    """The main loop executed by each worker thread."""
-    while True:
-        task = manager.get_next_task()
-
-        if task is None:
-            # Queue empty, worker terminates naturally if we exit the loop
-            if manager.state == manager.STATE_IDLE:
-                break
-            # If state is RUNNING but queue just became empty, it will transition to IDLE on the next check.
-            time.sleep(0.1) # Yield while checking state transition
-            continue
-
-        if task == "PAUSE_BLOCKER":
-            time.sleep(0.1) # Yield execution while paused
-            continue
-
-        # --- Actual Work Execution ---
-        
-        fp = task['fp']
-        
-        manager.progress_channel.put(("OP_START", (fp, 1, 0))) # Notify start: current item, total progress=0/1 (placeholder)
-        
-        # Simulate intensive file operation (IO Bound simulation)
-        print(f"[Worker] Processing {task['source']}...")
-        simulated_size = 10 * 1024 * 1024 # 10MB
-        time.sleep(1.0) # Simulating work
-
-        # Simulate granular progress reporting (optional, but good practice)
-        manager.progress_channel.put(("OP_PROGRESS", (50, 100)))
-        time.sleep(1.0)
-        
-        print(f"[Worker] Finished {task['source']}")
-        manager.progress_channel.put(("OP_PROGRESS", (100, 100)))
-        
-        # Signal completion back to the manager (which handles state transitions)
-        manager.task_complete(fp, bytes_count=simulated_size)
-        
-        # After completion, the loop immediately checks for the next task/state
\ No newline at end of file
+import threading
+import time
+import logging
+from collections import deque
+from functools import partial
+
+from copy_engine import CopyEngine
+from planner import plan_job
+from event_bus import EventBus
+from scheduler import FairScheduler, DEFAULT_PRIORITY
+from fingerprints import FingerprintStore, fingerprint, DIGEST_SIZE
+
+LOCAL_BATCH = 8  # Most units a worker moves from the shared scheduler into its local queue at once
+
+
+class _Shard:
+    """
+    Counters, local queue and in-flight tasks of one thread. Only the owning
+    thread writes the counters and `active`; other workers may only pop()
+    from the right end of `local` (work stealing), which deque makes atomic.
+    """
+
+    __slots__ = ("bytes", "items", "skipped", "errors", "deduplicated", "deduplicated_bytes",
+                 "holding", "active", "local")
+
+    def __init__(self):
+        self.bytes = 0
+        self.items = 0
+        self.skipped = 0
+        self.errors = 0
+        self.deduplicated = 0         # Files made as links/clones of an identical copy
+        self.deduplicated_bytes = 0   # Bytes those files did not have to write
+        self.holding = 0      # Units taken (or being moved) and not yet completed
+        self.active = {}      # fp -> task currently processed by this thread
+        self.local = deque()  # Units taken from the scheduler ahead of time
+
+
+class QueueManager:
+    """
+    Manages the operational state (IDLE, PAUSED, RUNNING) and the thread-safe task queue.
+    Implements operation fingerprinting for idempotency checks.
+    Queued work is served fairly across jobs by priority, and each job can be
+    paused and resumed on its own (see scheduler.FairScheduler).
+
+    Locking is split so that workers rarely contend:
+      - each worker keeps a small local queue, refilled from the scheduler
+        LOCAL_BATCH units at a time and stolen from by idle workers;
+      - counters are sharded per thread and only summed when read;
+      - `_lock` guards the scheduler, job table and fingerprints (enqueue, refill,
+        job start/finish), each job's rollup has its own small lock;
+      - state transitions and worker wake-ups use `_state_lock`, and state/status
+        reads take no lock at all.
+    Lock order is _state_lock -> _lock -> job lock.
+    """
+    STATE_IDLE = "IDLE"
+    STATE_PAUSED = "PAUSED"
+    STATE_RUNNING = "RUNNING"
+
+    def __init__(self, journal=None, fingerprints=None):
+        # State management
+        self.state = self.STATE_IDLE
+        self._state_lock = threading.Lock()
+        # Workers block on this until there is work they may take (or shutdown)
+        self._work_available = threading.Condition(self._state_lock)
+        self._shutdown = False
+        # Workers with an id >= worker_limit stay parked (adaptive concurrency); None = no limit
+        self.worker_limit = None
+
+        # Data structures
+        self._lock = threading.Lock()
+        self.task_queue = FairScheduler()  # Per-job FIFOs served in weighted fair order
+        # Compact store of fingerprints of queued/processed tasks; a job's entries
+        # expire per its retention policy once the job finishes
+        self.fingerprints = fingerprints if fingerprints is not None else FingerprintStore()
+        # Per-thread shards (replaced, never mutated, so readers can iterate without a lock)
+        self._local = threading.local()
+        self._shards = []
+        self._worker_shards = []
+
+        # Communication channel for workers to report back to the main thread/GUI
+        # (bounded and coalescing, so a slow consumer can't stall or bloat the workers)
+        self.progress_channel = EventBus()
+        # Per-job rollup of file-level subtasks: progress, pending count, completion
+        self.jobs = {}
+        # Optional journal.JobJournal: makes queued work survive restarts
+        self.journal = journal
+
+    # --- SRE Metrics (aggregated from the per-thread shards on read) ---
+
+    @property
+    def total_bytes_processed(self) -> int:
+        return sum(shard.bytes for shard in self._shards)
+
+    @property
+    def total_items_completed(self) -> int:
+        return sum(shard.items for shard in self._shards)
+
+    @property
+    def total_errors(self) -> int:
+        return sum(shard.errors for shard in self._shards)
+
+    @property
+    def total_items_skipped(self) -> int:
+        """Files left untouched by incremental sync."""
+        return sum(shard.skipped for shard in self._shards)
+
+    @property
+    def total_items_deduplicated(self) -> int:
+        """Files materialized as hard links or reflinks of an identical file."""
+        return sum(shard.deduplicated for shard in self._shards)
+
+    @property
+    def total_bytes_deduplicated(self) -> int:
+        return sum(shard.deduplicated_bytes for shard in self._shards)
+
+    def _shard(self, worker: bool = False) -> _Shard:
+        """The calling thread's shard, registered on first use."""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards = self._shards + [shard]
+        if worker and not getattr(self._local, "worker", False):
+            self._local.worker = True
+            with self._lock:
+                self._worker_shards = self._worker_shards + [shard]
+        return shard
+
+    def queue_depth(self) -> int:
+        """Units queued in the scheduler or in workers' local queues (paused jobs included)."""
+        return len(self.task_queue) + sum(len(shard.local) for shard in self._worker_shards)
+
+    def _generate_fingerprint(self, source: str, destination: str, op_type: str) -> str:
+        """Generates a deterministic hash (hex) for an operation."""
+        return fingerprint(source, destination, op_type).hex()
+
+    def _remember(self, fp: str, job_fp: str) -> bool:
+        """Records fp as owned by job_fp; returns False if it is already known."""
+        # Journals written before the compact store hold longer (SHA-256) fingerprints
+        return self.fingerprints.add(bytes.fromhex(fp[:2 * DIGEST_SIZE]), job_fp)
+
+    def add_task(self, source: str, destination, op_type: str = "COPY",
+                 priority: str = DEFAULT_PRIORITY) -> tuple[bool, str]:
+        """
+        Adds a task if it's not a duplicate. `priority` is a scheduler.PRIORITY_WEIGHTS key.
+        `destination` may be a list of folders: the source is then read once and
+        written to all of them (the first one is the job's main destination).
+        """
+        if isinstance(destination, str):
+            mirrors = []
+        else:
+            destination, *mirrors = destination
+        fp = self._generate_fingerprint(source, "|".join([destination] + mirrors), op_type)
+
+        with self._lock:
+            self.fingerprints.expire_due()
+            if not self._remember(fp, fp):
+                # Idempotency check successful: Task already queued or processed
+                msg = f"Idempotent task skipped: {source} -> {destination}"
+                self.progress_channel.put(("LOG", msg))
+                return False, msg
+
+            task_data = {"fp": fp, "source": source, "destination": destination, "type": op_type,
+                         "priority": priority}
+            if mirrors:
+                task_data["mirrors"] = mirrors
+            self.task_queue.add_job(fp, priority)
+            self.task_queue.put(task_data)
+            self.jobs[fp] = self._new_job(source, destination, mirrors)
+            if self.journal:
+                self.journal.job_added(task_data)
+
+        with self._work_available:
+            self._wake(1)
+        self.progress_channel.put(("QUEUE_UPDATE", self.queue_depth()))
+        msg = f"Task added: {source}"
+        self.progress_channel.put(("LOG", msg))
+
+        # If currently IDLE and a task is added, we remain IDLE as per design (no auto-start)
+        return True, msg
+
+    @staticmethod
+    def _new_job(source: str, destination: str, mirrors=()) -> dict:
+        job = {
+            "source": source,
+            "destination": destination,
+            "planned": False,     # True once the planner finished expanding the folder
+            "pending": 0,         # Subtasks queued or in flight
+            "total_bytes": 0,
+            "done_bytes": 0,
+            "items": 0,
+            "skipped": 0,
+            "verified": 0,        # Units copied with a recorded BLAKE3 digest
+            "lock": threading.Lock(),  # Guards the counters above once the job is queued
+        }
+        if mirrors:
+            # Fan-out job: bytes written and failed files per destination (main one first)
+            job["destinations"] = [{"destination": d, "done_bytes": 0, "errors": 0}
+                                   for d in [destination, *mirrors]]
+        return job
+
+    def add_subtasks(self, parent_fp: str, units: list) -> int:
+        """
+        Queues file-level subtasks of a job. Each unit is a dict with "type" (FILE, RANGE, BATCH or DEDUP),
+        "source", "destination", "size", "offset" for RANGE units and "files" for BATCH and DEDUP units.
+        Subtasks roll up into the parent job for progress and completion.
+        Returns the number of subtasks actually queued.
+        """
+        for unit in units:
+            op = unit["type"] if "offset" not in unit else f"{unit['type']}:{unit['offset']}"
+            unit["fp"] = self._generate_fingerprint(unit["source"], unit["destination"], op)
+            unit["parent"] = parent_fp
+
+        with self._lock:
+            job = self.jobs[parent_fp]
+            queued = []
+            for unit in units:
+                if not self._remember(unit["fp"], parent_fp):
+                    # Same file already covered by another job (e.g. overlapping source folders)
+                    continue
+                queued.append(unit)
+            with job["lock"]:
+                job["pending"] += len(queued)
+                job["total_bytes"] += sum(unit["size"] for unit in queued)
+            for unit in queued:
+                self.task_queue.put(unit)
+            if self.journal and queued:
+                self.journal.units_added(queued)
+
+        if queued:
+            with self._work_available:
+                self._wake(len(queued))
+        self.progress_channel.put(("QUEUE_UPDATE", self.queue_depth()))
+        return len(queued)
+
+    def restore_from_journal(self) -> list:
+        """
+        Rebuilds jobs and the task queue from the journal after a restart.
+        Fully planned jobs resume with exactly their unfinished units (byte ranges
+        continue from their last checkpoint); jobs interrupted while planning are
+        planned again with incremental-sync semantics. Returns the restored units.
+        """
+        restored = []
+        with self._lock:
+            for job_task, units in self.journal.load_unfinished():
+                fp = job_task["fp"]
+                if not self._remember(fp, fp):
+                    continue
+                mirrors = job_task.get("mirrors", [])
+                job = self._new_job(job_task["source"], job_task["destination"], mirrors)
+                self.task_queue.add_job(fp, job_task["priority"])
+
+                if not job_task["planned"]:
+                    self.journal.job_replan(fp)
+                    self.jobs[fp] = job
+                    task = {"fp": fp, "source": job_task["source"], "destination": job_task["destination"],
+                            "type": job_task["type"], "resume": True}
+                    if mirrors:
+                        task["mirrors"] = mirrors
+                    self.task_queue.put(task)
+                    continue
+
+                if not units:
+                    # Crashed between the last unit and the job's own completion record
+                    self.task_queue.remove_job(fp)
+                    self.fingerprints.release_job(fp)
+                    self.journal.job_done(fp)
+                    continue
+
+                job["planned"] = True
+                job["done_bytes"] = job["total_bytes"] = job_task["done_bytes"]
+                job["items"] = job_task["items_done"]
+                fanout = {}
+                if mirrors:
+                    fanout = {"root": CopyEngine.target_root(job_task["source"], job_task["destination"]),
+                              "mirrors": [CopyEngine.target_root(job_task["source"], m) for m in mirrors]}
+                for unit in units:
+                    unit.update(fanout)
+                    checkpoint = unit.pop("done_bytes")
+                    job["total_bytes"] += unit["size"]
+                    if checkpoint and unit["type"] == "RANGE":
+                        # Skip the part of the range already durable at the destination
+                        unit["checkpoint"] = checkpoint
+                        unit["offset"] += checkpoint
+                        unit["size"] -= checkpoint
+                        job["done_bytes"] += checkpoint
+                    self.task_queue.put(unit)
+                    self._remember(unit["fp"], fp)
+                    job["pending"] += 1
+                    restored.append(unit)
+                self.jobs[fp] = job
+
+            if self.jobs:
+                self.progress_channel.put(("LOG", f"Restored {len(self.jobs)} unfinished task(s) from journal."))
+        self.progress_channel.put(("QUEUE_UPDATE", self.queue_depth()))
+        return restored
+
+    def get_job_progress(self, fp: str) -> tuple[int, int]:
+        """Returns (done_bytes, total_bytes) of a job, or (0, 0) once it has finished."""
+        job = self.jobs.get(fp)
+        if job is None:
+            return 0, 0
+        with job["lock"]:
+            return job["done_bytes"], job["total_bytes"]
+
+    def _has_outstanding_work(self) -> bool:
+        """
+        Work exists while runnable units are queued or a worker may still produce more (planning / copying).
+        Lock-free: units only move scheduler -> local queue -> worker, and a worker counts itself in
+        `holding` before moving any, so reading in that same order never misses a unit in transit.
+        """
+        if self.task_queue.runnable() > 0:
+            return True
+        shards = self._shards
+        return any(shard.local for shard in shards) or any(shard.holding for shard in shards)
+
+    def _enter_idle(self):
+        """RUNNING -> IDLE once nothing is left to run (units of paused jobs stay queued)."""
+        self.state = self.STATE_IDLE
+        self.progress_channel.put(("STATE_CHANGE", self.STATE_IDLE))
+        depth = self.queue_depth()
+        if not depth:
+            self.progress_channel.put(("LOG", "Queue empty. Operation complete."))
+        else:
+            self.progress_channel.put(("LOG", f"Nothing left to run: {depth} unit(s) of paused jobs wait."))
+
+    def _check_idle(self):
+        """Enters IDLE if RUNNING with nothing left to do (cheap unlocked pre-check first)."""
+        if self.state != self.STATE_RUNNING or self._has_outstanding_work():
+            return
+        with self._work_available:
+            if self.state == self.STATE_RUNNING and not self._has_outstanding_work():
+                self._enter_idle()
+
+    def pause(self) -> bool:
+        """Transitions state to PAUSED, respecting transition rules."""
+        with self._state_lock:
+            if self.state == self.STATE_RUNNING:
+                self.state = self.STATE_PAUSED
+                self.progress_channel.put(("STATE_CHANGE", self.STATE_PAUSED))
+                self.progress_channel.put(("LOG", "Operation Paused."))
+                return True
+            return False
+
+    def resume(self) -> bool:
+        """Transitions state to RUNNING, respecting transition rules."""
+        with self._state_lock:
+            if self.state == self.STATE_PAUSED:
+                self.state = self.STATE_RUNNING
+                self.progress_channel.put(("STATE_CHANGE", self.STATE_RUNNING))
+                self.progress_channel.put(("LOG", "Operation Resumed."))
+                self._work_available.notify_all()
+                return True
+            elif self.state == self.STATE_IDLE:
+                # Per design: no auto-start. Transition to RUNNING only if the queue has runnable items.
+                if self.task_queue.runnable():
+                    self.state = self.STATE_RUNNING
+                    self.progress_channel.put(("STATE_CHANGE", self.STATE_RUNNING))
+                    self.progress_channel.put(("LOG", "Operation Started (from IDLE state)."))
+                    self._work_available.notify_all()
+                    return True
+            return False
+
+    def _wake(self, n: int):
+        """
+        Wakes workers for n new units (the caller holds _work_available). Parked
+        workers wait on the same condition and would swallow a plain notify(n),
+        so every worker is woken while a worker_limit is set.
+        """
+        if self.worker_limit is None:
+            self._work_available.notify(n)
+        else:
+            self._work_available.notify_all()
+
+    def _may_run(self, worker_id) -> bool:
+        parked = worker_id is not None and self.worker_limit is not None and worker_id >= self.worker_limit
+        return self.state == self.STATE_RUNNING and not parked and not self._shutdown
+
+    def _pop_local(self, shard: _Shard):
+        """Next unit of the worker's local queue, handing units of paused jobs back to the scheduler."""
+        shard.holding += 1
+        held = []
+        task = None
+        while True:
+            try:
+                task = shard.local.popleft()
+            except IndexError:
+                task = None
+                break
+            parent = task.get("parent")
+            if parent is None or not self.task_queue.is_paused(parent):
+                break
+            held.append(task)
+        if held:
+            with self._lock:
+                self.task_queue.put_back(held)
+        if task is None:
+            shard.holding -= 1
+            return None
+        shard.active[task["fp"]] = task
+        return task
+
+    def _refill(self, shard: _Shard) -> int:
+        """Moves this worker's share of the runnable units (up to LOCAL_BATCH) into its local queue."""
+        shard.holding += 1
+        moved = 0
+        with self._lock:
+            runnable = self.task_queue.runnable()
+            share = max(1, min(LOCAL_BATCH, runnable // max(1, len(self._worker_shards))))
+            while moved < share:
+                unit = self.task_queue.get()
+                if unit is None:
+                    break
+                shard.local.append(unit)
+                moved += 1
+        shard.holding -= 1
+        return moved
+
+    def _steal(self, shard: _Shard) -> int:
+        """
+        Takes the newer half of the longest local queue of another worker: its
+        owner works from the left (oldest) end, thieves pop from the right.
+        """
+        shard.holding += 1
+        victim = max(self._worker_shards, key=lambda other: len(other.local) if other is not shard else -1)
+        stolen = []
+        for _ in range((len(victim.local) + 1) // 2 if victim is not shard else 0):
+            try:
+                stolen.append(victim.local.pop())
+            except IndexError:
+                break
+        stolen.reverse()
+        shard.local.extend(stolen)
+        shard.holding -= 1
+        return len(stolen)
+
+    def _return_local(self, shard: _Shard):
+        """Hands a parked worker's local queue back to the scheduler so active workers get it in fair order."""
+        shard.holding += 1
+        units = []
+        while True:
+            try:
+                units.append(shard.local.popleft())
+            except IndexError:
+                break
+        if units:
+            with self._lock:
+                self.task_queue.put_back(units)
+            self._wake(len(units))
+        shard.holding -= 1
+
+    def get_next_task(self, worker_id: int = None):
+        """
+        Blocks until a task may be processed and returns it.
+        Takes no lock while the worker's local queue has units. Otherwise the
+        worker refills it from the scheduler or steals from another worker,
+        and sleeps on a condition variable while IDLE, PAUSED, while there is
+        momentarily nothing to take or while its id is above worker_limit;
+        add_task/add_subtasks, resume, set_worker_limit and shutdown wake it.
+        Returns None only once shutdown() was called.
+        """
+        shard = self._shard(worker=True)
+        if self._may_run(worker_id):
+            task = self._pop_local(shard)
+            if task is not None:
+                return task
+
+        with self._work_available:
+            while True:
+                if self._shutdown:
+                    return None
+
+                if self._may_run(worker_id):
+                    task = self._pop_local(shard)
+                    if task is None and (self._refill(shard) or self._steal(shard)):
+                        task = self._pop_local(shard)
+                    if task is not None:
+                        return task
+                    if self.state == self.STATE_RUNNING and not self._has_outstanding_work():
+                        self._enter_idle()
+                    # Otherwise other workers may still enqueue subtasks (planner) - keep RUNNING
+                elif shard.local and self.state == self.STATE_RUNNING:
+                    # Parked by worker_limit
+                    self._return_local(shard)
+
+                self._work_available.wait()
+
+    def pause_job(self, fp: str) -> bool:
+        """Holds back the queued units of one job; units already running finish normally."""
+        with self._lock:
+            if not self.task_queue.pause(fp):
+                return False
+            source = self.jobs[fp]["source"]
+        self.progress_channel.put(("JOB_STATE", (fp, self.STATE_PAUSED)))
+        self.progress_channel.put(("LOG", f"Task paused: {source}"))
+        self._check_idle()
+        return True
+
+    def resume_job(self, fp: str) -> bool:
+        """Lets a paused job run again (and restarts processing if only paused jobs were left)."""
+        with self._lock:
+            if not self.task_queue.resume(fp):
+                return False
+            source = self.jobs[fp]["source"]
+        self.progress_channel.put(("JOB_STATE", (fp, self.STATE_RUNNING)))
+        self.progress_channel.put(("LOG", f"Task resumed: {source}"))
+        with self._work_available:
+            if self.state == self.STATE_IDLE and self.task_queue.runnable():
+                self.state = self.STATE_RUNNING
+                self.progress_channel.put(("STATE_CHANGE", self.STATE_RUNNING))
+            self._work_available.notify_all()
+        return True
+
+    def set_job_priority(self, fp: str, priority: str) -> bool:
+        """
+        Changes a queued job's share of the workers (a scheduler.PRIORITY_WEIGHTS key).
+        Units already in workers' local queues keep their place.
+        """
+        with self._lock:
+            if fp not in self.jobs or not self.task_queue.set_priority(fp, priority):
+                return False
+            if self.journal:
+                self.journal.job_priority(fp, priority)
+            return True
+
+    def get_jobs(self) -> list:
+        """
+        Summary of every unfinished job: fp, source, priority, state, pending units and byte progress
+        (plus per-destination bytes written and errors for fan-out jobs).
+        """
+        with self._lock:
+            jobs = []
+            for fp, job in self.jobs.items():
+                summary = {"fp": fp, "source": job["source"], "destination": job["destination"],
+                           "priority": self.task_queue.priority(fp),
+                           "state": self.STATE_PAUSED if self.task_queue.is_paused(fp) else self.STATE_RUNNING,
+                           "pending": job["pending"], "done_bytes": job["done_bytes"], "total_bytes": job["total_bytes"]}
+                if "destinations" in job:
+                    with job["lock"]:
+                        summary["destinations"] = [dict(d) for d in job["destinations"]]
+                jobs.append(summary)
+            return jobs
+
+    def set_worker_limit(self, limit: int):
+        """Changes how many workers may take tasks; parked workers finish their current task first."""
+        with self._work_available:
+            if limit != self.worker_limit:
+                self.worker_limit = limit
+                self._work_available.notify_all()
+
+    def get_active_endpoints(self) -> list:
+        """(source, destination) of every unfinished job, one pair per destination of fan-out jobs."""
+        with self._lock:
+            return [(job["source"], d["destination"]) for job in self.jobs.values()
+                    for d in job.get("destinations", [job])]
+
+    def shutdown(self):
+        """Releases every worker blocked in get_next_task so it can exit."""
+        with self._work_available:
+            self._shutdown = True
+            self._work_available.notify_all()
+
+    def _finish_job(self, job_fp: str, job: dict):
+        with self._lock:
+            del self.jobs[job_fp]
+            self.task_queue.remove_job(job_fp)
+            self.fingerprints.release_job(job_fp)
+        if self.journal:
+            self.journal.job_done(job_fp)
+        self.progress_channel.put(("TASK_DONE", job_fp))
+        self.progress_channel.put(("LOG", f"Task finished: {job['source']} ({job['items']} files, {job['skipped']} unchanged)"))
+
+    def task_complete(self, fp: str, bytes_count: int = 0, items: int = 1, digest: str = None, skipped: int = 0):
+        """
+        Called by worker after successful processing, from the thread that took the task.
+        `items` is the number of files finished by this unit (0 for all but the last range of a split file,
+        N for a batch). `skipped` is how many of them incremental sync found already up to date.
+        `digest` is the BLAKE3 digest of the unit's source data when the copy was verified;
+        it is published as a TASK_RESULT event and kept in the journal (see JobJournal.load_digests).
+        """
+        shard = self._shard()
+        task = shard.active.pop(fp, None)
+        if task is None:
+            return
+        shard.bytes += bytes_count
+
+        parent = task.get("parent")
+        if parent is None:
+            # Folder task: the planner has finished expanding it
+            job_fp = fp
+            job = self.jobs[fp]
+            if self.journal:
+                self.journal.job_planned(fp)
+            with job["lock"]:
+                job["planned"] = True
+                finished = job["pending"] == 0
+        else:
+            job_fp = parent
+            job = self.jobs[parent]
+            shard.items += items
+            shard.skipped += skipped
+            if self.journal:
+                # Recorded before the job can be seen as finished, so it precedes job_done in the journal
+                if digest is not None:
+                    self.journal.unit_verified(task, digest)
+                self.journal.unit_done(fp)
+            with job["lock"]:
+                job["pending"] -= 1
+                job["done_bytes"] += task["size"]
+                job["items"] += items
+                job["skipped"] += skipped
+                if digest is not None:
+                    job["verified"] += 1
+                finished = job["planned"] and job["pending"] == 0
+                progress = (job_fp, job["done_bytes"], job["total_bytes"])
+            if digest is not None:
+                task["digest"] = digest
+                self.progress_channel.put(("TASK_RESULT", task))
+            self.progress_channel.put(("OP_PROGRESS", progress))
+
+        if finished:
+            self._finish_job(job_fp, job)
+
+        shard.holding -= 1
+        self.progress_channel.put(("QUEUE_UPDATE", self.queue_depth()))
+
+        # Important: Re-check state after completion (might revert to IDLE/PAUSED)
+        self._check_idle()
+
+    def task_skipped(self, fp: str):
+        """Called by worker when incremental sync found the destination already up to date."""
+        self.task_complete(fp, bytes_count=0, skipped=1)
+
+    def report_error(self, message: str):
+        """Called by workers for per-file failures that don't abort the whole task."""
+        self._shard().errors += 1
+        self.progress_channel.put(("LOG", f"ERROR: {message}"))
+
+    def report_deduplicated(self, files: int, nbytes: int):
+        """Called by workers for files linked to an identical copy instead of being written."""
+        shard = self._shard()
+        shard.deduplicated += files
+        shard.deduplicated_bytes += nbytes
+
+    def report_fanout(self, job_fp: str, written: list, failed: list):
+        """Called by workers of fan-out jobs: bytes written and files failed per destination."""
+        job = self.jobs.get(job_fp)
+        if job is None or "destinations" not in job:
+            return
+        with job["lock"]:
+            for dest, nbytes, errors in zip(job["destinations"], written, failed):
+                dest["done_bytes"] += nbytes
+                dest["errors"] += errors
+
+    def get_status(self):
+        """(state, queue depth) without taking any lock: the values may be a moment old."""
+        return self.state, self.queue_depth()
+
+    def get_state(self):
+        return self.state
+
+    def set_state(self, new_state):
+        """Allows GUI to force state transitions."""
+        if new_state == self.STATE_PAUSED:
+            self.pause()
+        elif new_state == self.STATE_RUNNING:
+            self.resume()
+        elif new_state == self.STATE_IDLE:
+            with self._state_lock:
+                self.state = self.STATE_IDLE
+                self.progress_channel.put(("STATE_CHANGE", self.STATE_IDLE))
+
+# --- Worker Function ---
+
+logger = logging.getLogger("FolderCopier.worker")
+
+PROGRESS_INTERVAL = 0.1  # Minimum seconds between OP_PROGRESS events per worker
+
+def _run_plan(manager: QueueManager, engine: CopyEngine, task: dict):
+    """Expands a queued folder task into file-level subtasks."""
+    logger.debug(f"[Worker] Planning {task['source']}...")
+    manager.progress_channel.put(("OP_START", (task['fp'], 1, 0))) # Notify start: current item, total progress=0/1 (placeholder)
+
+    def report_error(exc):
+        manager.report_error(f"{getattr(exc, 'filename', None) or task['source']}: {exc}")
+
+    try:
+        count = plan_job(manager, engine, task, on_error=report_error)
+        logger.debug(f"[Worker] Planned {count} work units from {task['source']}")
+    except OSError as e:
+        # The task root itself is unusable (missing source, unwritable destination...)
+        report_error(e)
+
+    manager.task_complete(task['fp'])
+
+def _destinations(engine: CopyEngine, task: dict, dst: str) -> list:
+    """Every path a file goes to: dst itself plus its place in each mirror of a fan-out job."""
+    return [dst] + [engine.mirror_path(dst, task['root'], mirror) for mirror in task.get('mirrors', ())]
+
+def _limits_for(engine: CopyEngine, pairs) -> list:
+    """Every distinct rate limit covering one of the (source, destination) pairs a unit writes, or None."""
+    if not engine.throttle:
+        return None
+    limits = {}
+    for src, dst in pairs:
+        for limit in engine.throttle.limits_for(src, dst):
+            limits[id(limit)] = limit
+    return list(limits.values())
+
+def _run_fanout(manager: QueueManager, engine: CopyEngine, task: dict):
+    """Copies a FILE or BATCH unit of a job with several destinations, reading each source file once."""
+    files = task['files'] if task['type'] == "BATCH" else [(task['source'], task['destination'], task['size'])]
+    count = 1 + len(task['mirrors'])
+    written, failed = [0] * count, [0] * count
+    bytes_count = skipped = 0
+    digest = None
+    # Each chunk read is written to every destination: it counts against the limits of all of them
+    limits = _limits_for(engine, [(src, target) for src, dst, _ in files
+                                  for target in _destinations(engine, task, dst)])
+    progress = partial(engine.throttle.consume, limits) if limits else None
+
+    for src, dst, _ in files:
+        targets = _destinations(engine, task, dst)
+        if limits:
+            engine.throttle.consume(limits, nfiles=1)
+        try:
+            results, digest = engine.copy_fanout(src, targets, sync=task.get('sync', False), progress=progress)
+        except OSError as e:
+            # The source itself failed: every destination misses this file
+            manager.report_error(f"{src}: {e}")
+            failed = [n + 1 for n in failed]
+            continue
+        if all(result is None for result in results):
+            skipped += 1
+        for i, result in enumerate(results):
+            if isinstance(result, OSError):
+                manager.report_error(f"{targets[i]}: {result}")
+                failed[i] += 1
+            elif result:
+                written[i] += result
+                bytes_count += result
+
+    manager.report_fanout(task['parent'], written, failed)
+    manager.task_complete(task['fp'], bytes_count=bytes_count, items=len(files),
+                          digest=digest if task['type'] == "FILE" else None, skipped=skipped)
+
+def _checkpoint(journal, fp: str, base: int, done: int):
+    """Journals the bytes of a range unit made durable so far (`base` carried over from a restored checkpoint)."""
+    journal.checkpoint(fp, base + done)
+
+def _run_file(manager: QueueManager, engine: CopyEngine, task: dict):
+    """Copies a file-level subtask (a whole file or one byte range of it), reporting progress against its parent job."""
+    parent = task['parent']
+    file_done = 0
+    last_report = 0.0
+    # Rate limits covering this source / destination (shared with every other worker)
+    limits = engine.throttle.limits_for(task['source'], task['destination']) if engine.throttle else None
+
+    def report_progress(n):
+        nonlocal file_done, last_report
+        file_done += n
+        if limits:
+            engine.throttle.consume(limits, nbytes=n)
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            done, total = manager.get_job_progress(parent)
+            manager.progress_channel.put(("OP_PROGRESS", (parent, done + file_done, total)))
+
+    checkpoint = None
+    if manager.journal and task['type'] == "RANGE":
+        checkpoint = partial(_checkpoint, manager.journal, task['fp'], task.get('checkpoint', 0))
+
+    is_range = task['type'] == "RANGE"
+    failed = False
+    digest = None
+    try:
+        if task.get('sync') and engine.is_unchanged(task['source'], task['destination']):
+            manager.task_skipped(task['fp'])
+            return
+
+        if limits and task.get('offset', 0) == 0:
+            # A split file counts once, against its first range
+            engine.throttle.consume(limits, nfiles=1)
+        if engine.verify:
+            bytes_count, digest = engine.copy_verified(task['source'], task['destination'], progress=report_progress,
+                                                       offset=task.get('offset'), length=task['size'])
+        elif is_range:
+            bytes_count = engine.copy_range(task['source'], task['destination'], task['offset'], task['size'],
+                                            progress=report_progress, checkpoint=checkpoint)
+        else:
+            bytes_count = engine.copy_file(task['source'], task['destination'], progress=report_progress)
+    except OSError as e:
+        manager.report_error(f"{task['source']}: {e}")
+        bytes_count = file_done
+        failed = True
+
+    items = 1
+    if is_range:
+        # Only the worker finishing the last range finalizes the file and counts it
+        try:
+            items = 1 if engine.finish_range(task['source'], task['destination'], failed) else 0
+        except OSError as e:
+            manager.report_error(f"{task['destination']}: {e}")
+
+    manager.task_complete(task['fp'], bytes_count=bytes_count, items=items, digest=digest)
+
+def _run_batch(manager: QueueManager, engine: CopyEngine, task: dict):
+    """Copies a BATCH of small files as one unit: one dequeue, one completion, one progress event."""
+    def report_error(exc):
+        manager.report_error(f"{getattr(exc, 'filename', None) or task['source']}: {exc}")
+
+    limits = _limits_for(engine, [(src, dst) for src, dst, _ in task['files']])
+    progress = partial(engine.throttle.consume, limits, nfiles=1) if limits else None  # Called once per file
+
+    bytes_count, copied, skipped = engine.copy_batch(task['files'], sync=task.get('sync', False),
+                                                     on_error=report_error, progress=progress)
+    manager.task_complete(task['fp'], bytes_count=bytes_count, items=len(task['files']), skipped=skipped)
+
+def _run_dedup(manager: QueueManager, engine: CopyEngine, task: dict):
+    """Copies one file of a DEDUP group of identical files and links the others to that copy."""
+    def report_error(exc):
+        manager.report_error(f"{getattr(exc, 'filename', None) or task['source']}: {exc}")
+
+    # A fan-out job repeats the group for every destination (only the group's first file is read again)
+    roots = [None] + list(task.get('mirrors', ()))
+    written, failed = [], []
+    skipped_everywhere = len(task['files'])
+    for mirror in roots:
+        files = task['files'] if mirror is None else \
+            [(src, engine.mirror_path(dst, task['root'], mirror), size) for src, dst, size in task['files']]
+        failures = []
+        # Members may sit under different destination limits; each pass only charges its own destination's
+        limits = _limits_for(engine, [(src, dst) for src, dst, _ in files])
+        progress = partial(engine.throttle.consume, limits, nfiles=1) if limits else None  # Called once per file
+
+        def on_error(exc):
+            failures.append(exc)
+            report_error(exc)
+
+        bytes_count, copied, linked, linked_bytes, skipped = engine.copy_deduplicated(
+            files, digest=task.get('digest'), sync=task.get('sync', False), on_error=on_error, progress=progress,
+            mtimes=task.get('mtimes'))
+        if linked:
+            manager.report_deduplicated(linked, linked_bytes)
+        written.append(bytes_count)
+        failed.append(len(failures))
+        skipped_everywhere = min(skipped_everywhere, skipped)
+    if len(roots) > 1:
+        manager.report_fanout(task['parent'], written, failed)
+    manager.task_complete(task['fp'], bytes_count=sum(written), items=len(task['files']), skipped=skipped_everywhere)
+
+def worker_thread_task(manager: QueueManager, engine: CopyEngine = None, worker_id: int = None):
+    """The main loop executed by each long-lived worker thread."""
+    engine = engine or CopyEngine()
+    instruments = engine.instruments
+    stats = instruments.worker(worker_id) if instruments is not None else None
+
+    while True:
+        # Blocks (without polling) until there is work, or returns None on shutdown
+        wait_start = time.perf_counter_ns()
+        task = manager.get_next_task(worker_id)
+        if stats is not None:
+            instruments.worker_idle(stats, time.perf_counter_ns() - wait_start)
+        if task is None:
+            break
+        cpu_start = instruments.worker_start(stats) if stats is not None else None
+
+        # --- Actual Work Execution ---
+
+        try:
+            if task.get('parent') is None:
+                # Folder task: expand into file-level subtasks for the whole pool
+                _run_plan(manager, engine, task)
+            elif task.get('mirrors') and task['type'] != "DEDUP":
+                _run_fanout(manager, engine, task)
+            elif task['type'] == "BATCH":
+                _run_batch(manager, engine, task)
+            elif task['type'] == "DEDUP":
+                _run_dedup(manager, engine, task)
+            else:
+                _run_file(manager, engine, task)
+        except Exception as e:
+            # Long-lived worker: never die on an unexpected error, and never strand the task
+            logger.exception(f"[Worker] Unexpected error on {task['source']}")
+            manager.report_error(f"{task['source']}: {e}")
+            manager.task_complete(task['fp'])
+
+        if stats is not None:
+            instruments.worker_done(stats, cpu_start)
+
+        # After completion, the loop immediately checks for the next task/state
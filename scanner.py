@@ -0,0 +1,172 @@
+import os
+import stat
+import time
+import queue
+import threading
+from collections import namedtuple
+
+from instrumentation import STAGE_SCAN
+
+# kind is one of KIND_FILE, KIND_DIR, KIND_LINK (symlinks are never followed), KIND_SPECIAL
+ScanEntry = namedtuple("ScanEntry", ["path", "size", "mtime_ns", "inode", "kind"])
+
+KIND_FILE = "file"
+KIND_DIR = "dir"
+KIND_LINK = "link"
+KIND_SPECIAL = "special"  # FIFO, socket or device node: never opened (a FIFO would block the reader)
+
+
+def _kind(is_link: bool, st) -> str:
+    if is_link:
+        return KIND_LINK
+    return KIND_FILE if stat.S_ISREG(st.st_mode) else KIND_SPECIAL
+
+DEFAULT_SCAN_WORKERS = 8
+OUTPUT_BUFFER = 4096  # Entries buffered ahead of the consumer before scanner threads block
+
+_DONE = object()
+
+
+class TreeScanner:
+    """
+    Parallel directory scanner built on os.scandir.
+    Subdirectories are fanned out to a small thread pool and entries are
+    streamed to the caller through a bounded queue, so consumers can start
+    work before the scan finishes. Running totals are kept in files/bytes/dirs.
+    A directory's own entry is always yielded before any of its children.
+    """
+
+    def __init__(self, root: str, max_workers=DEFAULT_SCAN_WORKERS, on_error=None, instruments=None):
+        self.root = root
+        self.max_workers = max_workers
+        self.on_error = on_error
+        # Optional instrumentation.Instruments: time spent listing each directory
+        self.instruments = instruments
+
+        # Running totals (updated while scanning)
+        self.files = 0
+        self.bytes = 0
+        self.dirs = 0
+        self.finished = False
+
+        self._lock = threading.Lock()
+        self._dir_queue = queue.Queue()
+        self._out = queue.Queue(maxsize=OUTPUT_BUFFER)
+        self._pending_dirs = 0
+        self._stop = threading.Event()
+
+    def _report_error(self, exc):
+        if self.on_error:
+            self.on_error(exc)
+
+    def _emit(self, entry) -> bool:
+        """Hands an entry to the consumer; returns False once the consumer went away."""
+        while not self._stop.is_set():
+            try:
+                self._out.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _scan_dir(self, path: str):
+        start = time.perf_counter_ns()
+        try:
+            st = os.lstat(path)
+            it = os.scandir(path)
+        except OSError as e:
+            self._report_error(e)
+            return
+
+        with self._lock:
+            self.dirs += 1
+        if not self._emit(ScanEntry(path, 0, st.st_mtime_ns, st.st_ino, KIND_DIR)):
+            it.close()
+            return
+
+        files = 0
+        size_total = 0
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        with self._lock:
+                            self._pending_dirs += 1
+                        self._dir_queue.put(entry.path)
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError as e:
+                    self._report_error(e)
+                    continue
+
+                kind = _kind(entry.is_symlink(), st)
+                size = st.st_size if kind == KIND_FILE else 0
+                if kind != KIND_SPECIAL:
+                    files += 1
+                size_total += size
+                if not self._emit(ScanEntry(entry.path, size, st.st_mtime_ns, st.st_ino, kind)):
+                    return
+
+        with self._lock:
+            self.files += files
+            self.bytes += size_total
+        if self.instruments is not None:
+            # Includes time blocked on a slow consumer (the bounded output queue)
+            self.instruments.record(STAGE_SCAN, time.perf_counter_ns() - start)
+
+    def _worker(self):
+        while True:
+            path = self._dir_queue.get()
+            if path is _DONE:
+                return
+            if not self._stop.is_set():
+                self._scan_dir(path)
+            with self._lock:
+                self._pending_dirs -= 1
+                last = self._pending_dirs == 0
+            if last:
+                # Tree exhausted: release the other workers and the consumer
+                for _ in range(self.max_workers):
+                    self._dir_queue.put(_DONE)
+                self._emit(_DONE)
+
+    def scan(self):
+        """Generator of ScanEntry for the whole tree (the root itself included)."""
+        try:
+            st = os.lstat(self.root)
+        except OSError as e:
+            self._report_error(e)
+            self.finished = True
+            return
+
+        if not os.path.isdir(self.root) or os.path.islink(self.root):
+            kind = _kind(os.path.islink(self.root), st)
+            size = st.st_size if kind == KIND_FILE else 0
+            self.files, self.bytes = int(kind != KIND_SPECIAL), size
+            self.finished = True
+            yield ScanEntry(self.root, size, st.st_mtime_ns, st.st_ino, kind)
+            return
+
+        self._pending_dirs = 1
+        self._dir_queue.put(self.root)
+        threads = [threading.Thread(target=self._worker, name=f"scanner-{i}", daemon=True)
+                   for i in range(self.max_workers)]
+        for t in threads:
+            t.start()
+
+        try:
+            while True:
+                entry = self._out.get()
+                if entry is _DONE:
+                    self.finished = True
+                    return
+                yield entry
+        finally:
+            # Consumer stopped early (or finished): let the scanner threads drain out
+            self._stop.set()
+
+    def totals(self) -> tuple[int, int]:
+        """Runs the scan to completion and returns (files, bytes)."""
+        for _ in self.scan():
+            pass
+        return self.files, self.bytes
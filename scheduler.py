@@ -0,0 +1,162 @@
+import heapq
+from collections import deque
+
+# Share of the copy bandwidth a job gets relative to other runnable jobs
+PRIORITY_WEIGHTS = {
+    "low": 1,
+    "normal": 4,
+    "high": 16,
+    "urgent": 64,
+}
+DEFAULT_PRIORITY = "normal"
+
+MIN_COST = 64 * 1024  # Smallest cost charged per unit, so tiny files still account for their overhead
+
+
+class _Job:
+    __slots__ = ("units", "weight", "priority", "tag", "paused", "in_heap")
+
+    def __init__(self, priority: str):
+        self.units = deque()
+        self.priority = priority
+        self.weight = PRIORITY_WEIGHTS[priority]
+        self.tag = 0.0          # Virtual time at which the job is next due
+        self.paused = False
+        self.in_heap = False
+
+
+class FairScheduler:
+    """
+    Weighted fair queue of work units, one FIFO per job.
+    Each job advances a virtual clock by unit_bytes / weight whenever one of
+    its units is dequeued, and the job with the smallest virtual time is
+    served next. Jobs therefore get bandwidth in proportion to their
+    priority weight (deficit round robin over bytes, without a quantum),
+    and a job that was idle or paused rejoins at the current virtual time
+    instead of catching up. Dequeue is O(log jobs) through a heap of
+    runnable jobs; units within a job stay in FIFO order.
+    Not thread-safe: QueueManager calls it under its own lock.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._heap = []           # (tag, seq, job_fp) of runnable jobs; stale entries are skipped
+        self._seq = 0
+        self._vtime = 0.0
+        self._size = 0            # Units held, paused jobs included
+        self._runnable = 0        # Units held by jobs that are not paused
+
+    def add_job(self, fp: str, priority: str = DEFAULT_PRIORITY):
+        if priority not in PRIORITY_WEIGHTS:
+            raise ValueError(f"Unknown priority {priority!r} (expected one of {', '.join(PRIORITY_WEIGHTS)})")
+        if fp not in self._jobs:
+            self._jobs[fp] = _Job(priority)
+
+    def remove_job(self, fp: str):
+        """Forgets a finished job (its heap entry, if any, is dropped lazily)."""
+        job = self._jobs.pop(fp, None)
+        if job is not None and job.units:
+            self._size -= len(job.units)
+            if not job.paused:
+                self._runnable -= len(job.units)
+
+    def _schedule(self, fp: str, job: _Job):
+        if not job.in_heap and not job.paused and job.units:
+            job.tag = max(job.tag, self._vtime)
+            self._seq += 1
+            heapq.heappush(self._heap, (job.tag, self._seq, fp))
+            job.in_heap = True
+
+    def put(self, unit: dict):
+        """Queues a unit behind the other units of its job (a folder task is its own job)."""
+        fp = unit.get("parent") or unit["fp"]
+        job = self._jobs.get(fp)
+        if job is None:
+            self._jobs[fp] = job = _Job(DEFAULT_PRIORITY)
+        job.units.append(unit)
+        self._size += 1
+        if not job.paused:
+            self._runnable += 1
+        self._schedule(fp, job)
+
+    def put_back(self, units: list):
+        """
+        Returns dequeued units (in their original order) to the front of their jobs,
+        e.g. from a worker's local queue. Their cost is charged again when re-dequeued.
+        """
+        for unit in reversed(units):
+            fp = unit.get("parent") or unit["fp"]
+            job = self._jobs.get(fp)
+            if job is None:
+                self._jobs[fp] = job = _Job(DEFAULT_PRIORITY)
+            job.units.appendleft(unit)
+            self._size += 1
+            if not job.paused:
+                self._runnable += 1
+            self._schedule(fp, job)
+
+    def get(self):
+        """Returns the next unit in fair order, or None when no unpaused job has work."""
+        while self._heap:
+            _, _, fp = heapq.heappop(self._heap)
+            job = self._jobs.get(fp)
+            if job is None:
+                continue
+            job.in_heap = False
+            if job.paused or not job.units:
+                continue
+
+            unit = job.units.popleft()
+            self._size -= 1
+            self._runnable -= 1
+            self._vtime = job.tag
+            job.tag += max(unit.get("size", 0), MIN_COST) / job.weight
+            self._schedule(fp, job)
+            return unit
+        return None
+
+    def pause(self, fp: str) -> bool:
+        job = self._jobs.get(fp)
+        if job is None or job.paused:
+            return False
+        job.paused = True
+        self._runnable -= len(job.units)
+        return True
+
+    def resume(self, fp: str) -> bool:
+        job = self._jobs.get(fp)
+        if job is None or not job.paused:
+            return False
+        job.paused = False
+        self._runnable += len(job.units)
+        self._schedule(fp, job)
+        return True
+
+    def is_paused(self, fp: str) -> bool:
+        job = self._jobs.get(fp)
+        return job is not None and job.paused
+
+    def set_priority(self, fp: str, priority: str) -> bool:
+        """Changes a job's weight; applies from its next dequeued unit."""
+        if priority not in PRIORITY_WEIGHTS:
+            raise ValueError(f"Unknown priority {priority!r} (expected one of {', '.join(PRIORITY_WEIGHTS)})")
+        job = self._jobs.get(fp)
+        if job is None:
+            return False
+        job.priority = priority
+        job.weight = PRIORITY_WEIGHTS[priority]
+        return True
+
+    def priority(self, fp: str) -> str:
+        job = self._jobs.get(fp)
+        return job.priority if job is not None else DEFAULT_PRIORITY
+
+    def runnable(self) -> int:
+        """Units that a worker could take right now."""
+        return self._runnable
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def __len__(self):
+        return self._size
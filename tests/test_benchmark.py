@@ -0,0 +1,43 @@
+import os
+import random
+
+import benchmark
+from queue_manager import QueueManager
+
+
+def test_sizes_scale_counts_or_sizes():
+    rng = random.Random(0)
+    many = {"files": 1000, "min_size": 10, "max_size": 1000, "depth": 0, "fanout": 1}
+    sizes = benchmark._sizes(many, 0.1, rng)
+    assert len(sizes) == 100 and all(10 <= size <= 1000 for size in sizes)
+    few = {"files": 3, "min_size": 1000, "max_size": 1000, "depth": 0, "fanout": 1}
+    assert benchmark._sizes(few, 0.5, rng) == [500, 500, 500]
+
+
+def test_generate_tree_and_percentiles(tmp_path):
+    spec = {"files": 12, "min_size": 0, "max_size": 100, "depth": 2, "fanout": 2}
+    files, size = benchmark.generate_tree(str(tmp_path), spec, 1.0)
+    found = [os.path.join(d, f) for d, _, names in os.walk(tmp_path) for f in names]
+    assert files == len(found) == 12
+    assert size == sum(os.path.getsize(path) for path in found)
+    assert benchmark._percentile([], 0.5) is None
+    assert benchmark._percentile([3, 1, 2], 0.5) == 2
+    assert benchmark._percentile(list(range(101)), 0.99) == 99
+
+
+def test_every_unit_is_timed(tmp_path):
+    big = {"files": 3, "min_size": 200 * 1024, "max_size": 200 * 1024, "depth": 0, "fanout": 1}
+    small = {"files": 20, "min_size": 0, "max_size": 1024, "depth": 1, "fanout": 2}
+    benchmark.generate_tree(str(tmp_path / "big"), big, 1.0)
+    benchmark.generate_tree(str(tmp_path / "small"), small, 1.0)
+    get_next_task = QueueManager.get_next_task
+
+    result = benchmark.run_case(str(tmp_path / "big"), 2, "copy")
+    assert result["files"] == 3 and result["errors"] == 0
+    assert result["latency_ms"]["count"] == 3   # The first unit of each worker included
+    assert result["batch_latency_ms"]["count"] == 0
+
+    result = benchmark.run_case(str(tmp_path / "small"), 2, "copy")
+    assert result["files"] == 20
+    assert result["latency_ms"]["count"] == 0 and result["batch_latency_ms"]["count"] >= 1
+    assert QueueManager.get_next_task is get_next_task
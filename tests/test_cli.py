@@ -0,0 +1,48 @@
+import json
+import os
+import time
+from functools import partial
+
+import cli
+import queue_manager
+from event_bus import EventBus
+from queue_manager import QueueManager
+
+
+def test_events_posted_before_the_idle_check_are_reported(tmp_path, monkeypatch, capsys):
+    src = tmp_path / "src"
+    src.mkdir()
+    for i in range(3):
+        (src / f"f{i}").write_bytes(os.urandom(1000))
+    get_status = QueueManager.get_status
+
+    def idle_late(manager):
+        # Reports IDLE only once the workers are done, long after the loop's last drain
+        deadline = time.time() + 30
+        while manager.state != manager.STATE_IDLE and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        return get_status(manager)
+
+    monkeypatch.setattr(QueueManager, "get_status", idle_late)
+    assert cli.main([str(src), str(tmp_path / "dst"), "--verify", "source", "--jsonl", "--interval", "0"]) == 0
+
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    kinds = [event["event"] for event in events]
+    assert kinds.count("verified") == 3
+    assert kinds.count("task_done") == 1
+    assert kinds[-1] == "summary"
+
+
+def test_folded_results_are_reported_as_counts(tmp_path, monkeypatch, capsys):
+    src = tmp_path / "src"
+    src.mkdir()
+    for i in range(5):
+        (src / f"f{i}").write_bytes(os.urandom(1000))
+    monkeypatch.setattr(queue_manager, "EventBus", partial(EventBus, ordered_capacity=1))
+    assert cli.main([str(src), str(tmp_path / "dst"), "--verify", "source", "--jsonl", "--interval", "0"]) == 0
+
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    folded = [event["count"] for event in events if event["event"] == "verified_folded"]
+    assert folded
+    assert sum(folded) + sum(event["event"] == "verified" for event in events) == 5
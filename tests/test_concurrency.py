@@ -0,0 +1,63 @@
+import os
+
+import concurrency
+from concurrency import SETTLE_TICKS, AdaptiveConcurrency, bounds_for, classify_device
+
+
+def _settled(tuner, rate):
+    """Feeds one judged sample: the settle ticks before it are ignored."""
+    for _ in range(SETTLE_TICKS - tuner.ticks_since_change - 1):
+        tuner.update(rate)
+    return tuner.update(rate)
+
+
+def test_probes_then_climbs_while_throughput_improves():
+    tuner = AdaptiveConcurrency(4, lo=1, hi=16)
+    assert tuner.update(100) == 4          # Still settling
+    assert _settled(tuner, 100) == 5 and tuner.reason == "probing"
+    assert _settled(tuner, 150) == 6 and tuner.reason == "throughput improved"
+    assert _settled(tuner, 152) == 6 and tuner.reason == "plateau"
+
+
+def test_reverses_on_a_drop_and_halves_on_a_collapse():
+    tuner = AdaptiveConcurrency(8, lo=1, hi=16)
+    _settled(tuner, 100)                   # Probe up to 9
+    assert _settled(tuner, 80) == 8 and tuner.direction == -1
+    assert _settled(tuner, 100) == 7       # Improvement keeps going down
+    assert _settled(tuner, 40) == 3 and tuner.reason.startswith("throughput collapsed")
+    assert tuner.direction == -1
+
+
+def test_turns_around_at_a_bound_and_clamps_to_new_bounds():
+    tuner = AdaptiveConcurrency(40, lo=1, hi=4)
+    assert tuner.workers == 4
+    assert _settled(tuner, 100) == 4 and tuner.direction == -1
+    assert tuner.reason == "at device bound [1, 4]"
+    assert _settled(tuner, 200) == 3
+
+    assert tuner.set_bounds(1, 2) == 2 and tuner.reason == "clamped to device bounds [1, 2]"
+    assert tuner.set_bounds(2, 8) == 2
+    assert tuner.snapshot() == {"workers": 2, "min": 2, "max": 8, "direction": -1,
+                                "reason": "clamped to device bounds [1, 2]"}
+
+
+def test_zero_rate_samples_are_ignored():
+    tuner = AdaptiveConcurrency(4)
+    for _ in range(10):
+        assert tuner.update(0) == 4
+    assert tuner.last_rate is None
+
+
+def test_bounds_take_the_tightest_device(monkeypatch):
+    kinds = {"/a": "ssd", "/b": "hdd"}
+    monkeypatch.setattr(concurrency, "classify_device", kinds.get)
+    assert bounds_for(["/a"]) == (2, 32, {"/a": "ssd"})
+    assert bounds_for(["/a", "/b"]) == (2, 2, kinds)   # Highest minimum, lowest maximum
+    assert bounds_for([]) == (1, 16, {})
+
+
+def test_device_without_device_numbers_is_unknown(tmp_path, monkeypatch):
+    monkeypatch.setattr(concurrency, "_device_cache", {})
+    monkeypatch.setattr(concurrency, "_mount_fs_type", lambda path: None)
+    monkeypatch.delattr(os, "major")   # As on Windows
+    assert classify_device(str(tmp_path / "not" / "yet")) == "unknown"
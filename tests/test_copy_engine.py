@@ -0,0 +1,477 @@
+import errno
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import copy_engine
+import cli
+from copy_engine import (CopyEngine, DEDUP_HARDLINK, DEDUP_REFLINK, DIRECT_IO_ALIGN, FANOUT_CHUNK, FSYNC_END,
+                         FSYNC_FILE, VERIFY_READBACK)
+
+
+def _write(path, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _read(path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _run(*args) -> int:
+    return cli.main([str(a) for a in args] + ["--jsonl", "--interval", "0"])
+
+
+@pytest.fixture
+def fsynced(monkeypatch):
+    """Records the path of every descriptor passed to os.fsync."""
+    if not os.path.isdir("/proc/self/fd"):
+        pytest.skip("needs /proc to map descriptors to paths")
+    paths = []
+    real_fsync = os.fsync
+
+    def fsync(fd):
+        paths.append(os.readlink(f"/proc/self/fd/{fd}"))
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", fsync)
+    return paths
+
+
+def test_copy_file_replaces_destination_symlink(tmp_path):
+    victim = tmp_path / "victim"
+    victim.write_bytes(b"outside the destination")
+    src = tmp_path / "src"
+    src.write_bytes(b"new content")
+    dst = tmp_path / "dst"
+    os.symlink(victim, dst)
+
+    assert CopyEngine().copy_file(str(src), str(dst)) == len(b"new content")
+    assert not os.path.islink(dst)
+    assert _read(dst) == b"new content"
+    assert _read(victim) == b"outside the destination"
+
+
+def test_sync_does_not_write_through_symlink_left_in_destination(tmp_path):
+    victim = tmp_path / "victim"
+    victim.write_bytes(b"keep me")
+    src = tmp_path / "src"
+    src.mkdir()
+    os.symlink(victim, src / "x")
+    (src / "other").write_bytes(b"o")
+    dst = tmp_path / "dst"
+    dst.mkdir()
+
+    assert _run(src, dst) == 0
+    assert os.path.islink(dst / "src" / "x")
+
+    os.unlink(src / "x")
+    (src / "x").write_bytes(b"a regular file now")
+    assert _run(src, dst, "--sync") == 0
+
+    assert _read(victim) == b"keep me"
+    assert not os.path.islink(dst / "src" / "x")
+    assert _read(dst / "src" / "x") == b"a regular file now"
+
+
+def test_batch_and_split_paths_replace_symlinks(tmp_path):
+    victim = tmp_path / "victim"
+    victim.write_bytes(b"v")
+    engine = CopyEngine(split_threshold=1, split_chunk_size=4096)
+    small, big = tmp_path / "small", tmp_path / "big"
+    small.write_bytes(b"s" * 10)
+    big.write_bytes(os.urandom(10000))
+    small_dst, big_dst = tmp_path / "small_dst", tmp_path / "big_dst"
+    os.symlink(victim, small_dst)
+    os.symlink(victim, big_dst)
+
+    assert engine.copy_batch([(str(small), str(small_dst), 10)]) == (10, 1, 0)
+    for offset, length in engine.prepare_split(str(big), str(big_dst), 10000):
+        engine.copy_range(str(big), str(big_dst), offset, length)
+        engine.finish_range(str(big), str(big_dst))
+
+    assert _read(victim) == b"v"
+    assert _read(small_dst) == b"s" * 10
+    assert _read(big_dst) == _read(big)
+
+
+def test_failed_copy_leaves_no_temporary_file(tmp_path):
+    src = tmp_path / "src"
+    src.write_bytes(b"data")
+    dst = tmp_path / "out" / "dst"
+    os.makedirs(dst)  # A directory where the file should go: the rename fails
+
+    try:
+        CopyEngine().copy_file(str(src), str(dst))
+    except OSError:
+        pass
+    else:
+        raise AssertionError("copying over a directory should fail")
+    assert os.listdir(tmp_path / "out") == ["dst"]
+
+
+def test_resync_after_hardlink_dedup_leaves_siblings_intact(tmp_path):
+    src = tmp_path / "hl"
+    _write(src / "a", b"same content" * 100)
+    _write(src / "b", b"same content" * 100)
+    dst = tmp_path / "dst"
+    dst.mkdir()
+
+    assert _run(src, dst, "--dedup", "hardlink") == 0
+    assert os.stat(dst / "hl" / "a").st_ino == os.stat(dst / "hl" / "b").st_ino
+
+    _write(src / "b", b"changed b!!!" * 100)  # Same size, different content
+    assert _run(src, dst, "--sync", "--dedup", "hardlink") == 0
+
+    assert _read(dst / "hl" / "a") == b"same content" * 100
+    assert _read(dst / "hl" / "b") == b"changed b!!!" * 100
+
+
+def test_fifo_in_source_is_skipped_and_reported(tmp_path):
+    src = tmp_path / "fifosrc"
+    src.mkdir()
+    (src / "file").write_bytes(b"data")
+    os.mkfifo(src / "pipe")
+    dst = tmp_path / "dst"
+    dst.mkdir()
+
+    out = subprocess.run([sys.executable, cli.__file__, str(src), str(dst), "--jsonl"],
+                         capture_output=True, text=True, timeout=60)
+
+    assert out.returncode == 1  # One error: the FIFO
+    assert "named pipe" in out.stdout
+    assert _read(dst / "fifosrc" / "file") == b"data"
+    assert not os.path.lexists(dst / "fifosrc" / "pipe")
+
+
+def test_copy_file_refuses_special_files(tmp_path):
+    os.mkfifo(tmp_path / "pipe")
+    try:
+        CopyEngine().copy_file(str(tmp_path / "pipe"), str(tmp_path / "out"))
+    except shutil.SpecialFileError:
+        pass
+    else:
+        raise AssertionError("a FIFO must not be copied")
+    assert os.listdir(tmp_path) == ["pipe"]
+
+
+def test_fsync_file_syncs_new_directory_chain(tmp_path, fsynced):
+    src = tmp_path / "src"
+    _write(str(src / "sub" / "f"), b"data")
+    os.symlink("f", src / "sub" / "link")
+    dst = tmp_path / "out" / "deep"
+
+    engine = CopyEngine(fsync=FSYNC_FILE)
+    for s, d, _ in engine.iter_tree(str(src), str(dst)):
+        engine.copy_file(s, d)
+
+    root = dst / "src"
+    for path in (tmp_path, tmp_path / "out", dst, root, root / "sub"):
+        assert str(path) in fsynced
+    # The data is synced in its temporary file, then the directory it is renamed into
+    data = [i for i, path in enumerate(fsynced) if path.startswith(str(root / "sub" / ".f."))]
+    assert data and fsynced[data[0] + 1] == str(root / "sub")
+
+
+def test_background_syncer_covers_links_and_new_directories(tmp_path, fsynced):
+    src = tmp_path / "src"
+    for name in ("a", "b"):
+        _write(str(src / name), b"same content")
+    os.symlink("a", src / "link")
+    dst = tmp_path / "out"
+
+    engine = CopyEngine(fsync=FSYNC_END, dedup=DEDUP_HARDLINK)
+    files = []
+    for s, d, size in engine.iter_tree(str(src), str(dst)):
+        if os.path.islink(s):
+            engine.copy_file(s, d)
+        else:
+            files.append((s, d, size))
+    assert engine.copy_deduplicated(sorted(files))[2] == 1
+    engine.flush(wait=True)
+    engine.close()
+
+    root = dst / "src"
+    assert os.path.samefile(root / "a", root / "b")
+    assert str(root / "a") in fsynced
+    for path in (tmp_path, dst, root):
+        assert str(path) in fsynced
+
+
+def _same_metadata(a, b):
+    a, b = os.stat(a), os.stat(b)
+    return a.st_mtime_ns == b.st_mtime_ns and a.st_mode == b.st_mode
+
+
+def test_stream_paths_copy_content_and_metadata(tmp_path):
+    data = os.urandom(300 * 1024)
+    src = tmp_path / "src"
+    _write(str(src), data)
+    os.chmod(src, 0o640)
+    os.utime(src, ns=(1, 1_000_000_000))
+
+    kernel = CopyEngine(reflink=False)
+    userspace = CopyEngine(reflink=False, buffer_size=64 * 1024)
+    userspace.use_copy_file_range = userspace.use_sendfile = False
+    for name, engine in (("kernel", kernel), ("userspace", userspace)):
+        dst = tmp_path / name
+        assert engine.copy_file(str(src), str(dst)) == len(data)
+        assert _read(dst) == data and _same_metadata(src, dst)
+        assert engine.byte_counts() == (0, len(data))
+
+
+def test_clone_refusal_falls_back_to_streaming_once_per_device_pair(tmp_path, monkeypatch):
+    calls = []
+
+    def ioctl(*args):
+        calls.append(args[1])
+        raise OSError(errno.EOPNOTSUPP, "not supported")
+
+    monkeypatch.setattr(copy_engine.fcntl, "ioctl", ioctl)
+    _write(str(tmp_path / "src"), b"x" * 5000)
+    engine = CopyEngine(reflink=True)
+    for name in ("a", "b"):
+        assert engine.copy_file(str(tmp_path / "src"), str(tmp_path / name)) == 5000
+        assert _read(tmp_path / name) == b"x" * 5000
+    assert len(calls) == 1
+    assert engine.byte_counts() == (0, 10000)
+
+
+def test_split_ranges_rebuild_the_file(tmp_path):
+    data = os.urandom(10 * 1024 + 7)
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    _write(str(src), data)
+    engine = CopyEngine(split_threshold=1, split_chunk_size=4096, reflink=False)
+    assert engine.should_split(str(src), len(data))
+
+    ranges = engine.prepare_split(str(src), str(dst), len(data))
+    assert ranges == [(0, 4096), (4096, 4096), (8192, 2055)]
+    assert engine.prepare_split(str(src), str(dst), len(data)) == []  # Already being copied
+    for offset, length in reversed(ranges):
+        assert engine.copy_range(str(src), str(dst), offset, length) == length
+    assert [engine.finish_range(str(src), str(dst)) for _ in ranges] == [False, False, True]
+    assert _read(dst) == data and _same_metadata(src, dst)
+
+
+def test_failed_range_fails_the_split_file(tmp_path):
+    _write(str(tmp_path / "src"), b"y" * 8192)
+    engine = CopyEngine(split_threshold=1, split_chunk_size=4096)
+    src, dst = str(tmp_path / "src"), str(tmp_path / "dst")
+    engine.prepare_split(src, dst, 8192)
+    assert not engine.finish_range(src, dst)
+    with pytest.raises(OSError):
+        engine.finish_range(src, dst, failed=True)
+
+
+def test_no_split_or_positional_reads_without_positional_io(tmp_path, monkeypatch):
+    monkeypatch.setattr(copy_engine, "_POSITIONAL_IO", False)
+    data = os.urandom(20000)
+    _write(str(tmp_path / "src"), data)
+    engine = CopyEngine(split_threshold=1, split_chunk_size=4096, verify=VERIFY_READBACK)
+    assert not engine.should_split(str(tmp_path / "src"), len(data))
+
+    monkeypatch.delattr(os, "preadv")   # As on Windows
+    written, digest = engine.copy_verified(str(tmp_path / "src"), str(tmp_path / "dst"))
+    assert written == len(data) and digest == engine.file_digest(str(tmp_path / "src"))
+    expected = copy_engine.blake3.blake3(data[5000:8000]).hexdigest()
+    assert engine._digest_range(str(tmp_path / "dst"), 5000, 3000) == expected
+
+
+@pytest.mark.skipif(not hasattr(os, "O_DIRECT"), reason="needs O_DIRECT")
+def test_direct_io_copies_the_unaligned_tail(tmp_path):
+    data = os.urandom(3 * DIRECT_IO_ALIGN + 123)
+    _write(str(tmp_path / "src"), data)
+    try:
+        os.close(os.open(str(tmp_path / "src"), os.O_RDONLY | os.O_DIRECT))
+    except OSError:
+        pytest.skip("filesystem refuses O_DIRECT")
+    engine = CopyEngine(direct_io_threshold=1, reflink=False)
+
+    assert engine.copy_file(str(tmp_path / "src"), str(tmp_path / "dst")) == len(data)
+    assert _read(tmp_path / "dst") == data
+    assert engine.io_stats()["bytes_direct"] == len(data)
+
+
+def test_batch_copies_skips_unchanged_and_reports_errors(tmp_path):
+    files = []
+    for i in range(4):
+        _write(str(tmp_path / "src" / f"f{i}"), b"%d" % i * (i + 1))
+        files.append((str(tmp_path / "src" / f"f{i}"), str(tmp_path / "dst" / f"f{i}"), i + 1))
+    os.makedirs(tmp_path / "dst")
+    engine = CopyEngine(reflink=False)
+    assert engine.copy_batch(files) == (10, 4, 0)
+    for src, dst, _ in files:
+        assert _read(dst) == _read(src) and _same_metadata(src, dst)
+
+    errors = []
+    files.append((str(tmp_path / "src" / "missing"), str(tmp_path / "dst" / "missing"), 1))
+    assert engine.copy_batch(files, sync=True, on_error=errors.append) == (0, 0, 4)
+    assert len(errors) == 1 and isinstance(errors[0], FileNotFoundError)
+
+
+def test_batch_without_descriptor_metadata_falls_back_to_copystat(tmp_path, monkeypatch):
+    monkeypatch.setattr(copy_engine, "_FD_METADATA", False)
+    monkeypatch.delattr(os, "fchmod")   # As on Windows
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    _write(str(src), b"small")
+    os.chmod(src, 0o600)
+    os.utime(src, ns=(1, 2_000_000_000))
+
+    assert CopyEngine(reflink=False).copy_batch([(str(src), str(dst), 5)]) == (5, 1, 0)
+    assert _read(dst) == b"small" and _same_metadata(src, dst)
+
+
+def test_batch_reads_each_small_file_once(tmp_path, monkeypatch):
+    files = []
+    for i in range(3):
+        _write(str(tmp_path / f"s{i}"), b"x" * (100 * i))
+        files.append((str(tmp_path / f"s{i}"), str(tmp_path / f"d{i}"), 100 * i))
+    reads = []
+    read = os.read
+
+    def counted(fd, n):
+        reads.append(n)
+        return read(fd, n)
+
+    monkeypatch.setattr(os, "read", counted)
+    assert CopyEngine(reflink=False).copy_batch(files) == (300, 3, 0)
+    assert len(reads) == 3
+    for i in range(3):
+        assert _read(tmp_path / f"d{i}") == b"x" * (100 * i)
+
+
+@pytest.mark.parametrize("dedup", [DEDUP_HARDLINK, DEDUP_REFLINK])
+def test_duplicates_are_linked_or_copied_in_full(tmp_path, dedup):
+    for name in ("a", "b", "c"):
+        _write(str(tmp_path / "src" / name), b"same content")
+    _write(str(tmp_path / "src" / "d"), b"something else")
+    os.makedirs(tmp_path / "dst")
+    files = [(str(tmp_path / "src" / n), str(tmp_path / "dst" / n), len(_read(tmp_path / "src" / n)))
+             for n in ("a", "b", "c", "d")]
+    engine = CopyEngine(dedup=dedup)
+
+    groups, singles = engine.find_duplicates(files)
+    assert [len(entries) for _, entries, _ in groups] == [3]
+    assert [entry[0] for entry in singles] == [files[3][0]]
+    [(digest, entries, mtimes)] = groups
+    assert mtimes == [os.stat(entry[0]).st_mtime_ns for entry in entries]
+    written, copied, linked, linked_bytes, skipped = engine.copy_deduplicated(entries, digest, mtimes=mtimes)
+    assert copied + linked == 3 and skipped == 0
+    assert linked_bytes == 12 * linked and written == 12 * copied
+    if dedup == DEDUP_HARDLINK:
+        assert linked == 2 and os.path.samefile(tmp_path / "dst" / "a", tmp_path / "dst" / "c")
+    for name in ("a", "b", "c"):
+        assert _read(tmp_path / "dst" / name) == b"same content"
+
+    assert engine.copy_deduplicated(entries, digest, sync=True)[4] == 3
+
+
+def test_members_changed_since_planning_are_copied_not_linked(tmp_path):
+    for name in ("a", "b", "c"):
+        _write(str(tmp_path / "src" / name), b"same content")
+    os.makedirs(tmp_path / "dst")
+    files = [(str(tmp_path / "src" / n), str(tmp_path / "dst" / n), 12) for n in ("a", "b", "c")]
+    engine = CopyEngine(dedup=DEDUP_HARDLINK)
+    [(digest, entries, mtimes)] = engine.find_duplicates(files)[0]
+
+    _write(str(tmp_path / "src" / "b"), b"SAME CONTENT")   # Same size, new mtime
+    os.utime(tmp_path / "src" / "b", ns=(mtimes[1] + 10 ** 9, mtimes[1] + 10 ** 9))
+    _write(str(tmp_path / "src" / "c"), b"longer content")
+    written, copied, linked, _, _ = engine.copy_deduplicated(entries, digest, mtimes=mtimes)
+    assert (copied, linked) == (3, 0)
+    assert _read(tmp_path / "dst" / "b") == b"SAME CONTENT"
+    assert _read(tmp_path / "dst" / "c") == b"longer content"
+    assert not os.path.samefile(tmp_path / "dst" / "a", tmp_path / "dst" / "b")
+
+
+def test_a_changed_first_member_is_not_linked_to(tmp_path):
+    for name in ("a", "b"):
+        _write(str(tmp_path / "src" / name), b"same content")
+    os.makedirs(tmp_path / "dst")
+    files = [(str(tmp_path / "src" / n), str(tmp_path / "dst" / n), 12) for n in ("a", "b")]
+    engine = CopyEngine(dedup=DEDUP_HARDLINK)
+    [(digest, entries, mtimes)] = engine.find_duplicates(files)[0]
+
+    _write(str(tmp_path / "src" / "a"), b"SAME CONTENT")
+    os.utime(tmp_path / "src" / "a", ns=(mtimes[0] + 10 ** 9, mtimes[0] + 10 ** 9))
+    assert engine.copy_deduplicated(entries, digest, mtimes=mtimes)[1:3] == (2, 0)
+    assert _read(tmp_path / "dst" / "b") == b"same content"
+
+
+def test_fanout_reads_once_and_isolates_a_failing_destination(tmp_path):
+    data = os.urandom(2 * FANOUT_CHUNK + 17)  # Several chunks: one writer thread per destination
+    src = tmp_path / "src"
+    _write(str(src), data)
+    dsts = [str(tmp_path / "one"), str(tmp_path / "missing" / "two"), str(tmp_path / "three")]
+    engine = CopyEngine(verify=VERIFY_READBACK)
+
+    results, digest = engine.copy_fanout(str(src), dsts)
+    assert results[0] == results[2] == len(data)
+    assert isinstance(results[1], FileNotFoundError)
+    assert digest == engine.file_digest(str(src))
+    for dst in (dsts[0], dsts[2]):
+        assert _read(dst) == data and _same_metadata(src, dst)
+    assert sorted(os.listdir(tmp_path)) == ["one", "src", "three"]  # No temporary file left
+
+    results, _ = engine.copy_fanout(str(src), [dsts[0], dsts[2]], sync=True)
+    assert results == [None, None]
+
+
+def test_fanout_has_no_digest_when_no_destination_was_written(tmp_path):
+    data = os.urandom(1000)
+    src = tmp_path / "src"
+    _write(str(src), data)
+    dsts = [str(tmp_path / "one"), str(tmp_path / "two")]
+    engine = CopyEngine(verify=VERIFY_READBACK)
+    assert engine.copy_fanout(str(src), dsts)[1] is not None
+
+    results, digest = engine.copy_fanout(str(src), dsts, sync=True)
+    assert results == [None, None] and digest is None
+
+
+def test_fanout_has_no_digest_when_every_writer_failed(tmp_path, monkeypatch):
+    write = copy_engine._FanoutWriter._write
+
+    def fail_after_first_chunk(writer, chunk):
+        if writer.written:
+            writer.error = OSError(errno.ENOSPC, "No space left on device")
+        write(writer, chunk)
+
+    monkeypatch.setattr(copy_engine._FanoutWriter, "_write", fail_after_first_chunk)
+    _write(str(tmp_path / "src"), os.urandom(3 * FANOUT_CHUNK))
+    engine = CopyEngine(verify=VERIFY_READBACK)
+
+    results, digest = engine.copy_fanout(str(tmp_path / "src"), [str(tmp_path / "one"), str(tmp_path / "two")])
+    assert all(isinstance(result, OSError) for result in results)
+    assert digest is None
+    assert sorted(os.listdir(tmp_path)) == ["src"]
+
+
+def test_sync_skip_rules(tmp_path):
+    src, dst = str(tmp_path / "src"), str(tmp_path / "dst")
+    _write(src, b"content")
+    engine = CopyEngine()
+    assert not engine.is_unchanged(src, dst)   # Missing destination
+
+    engine.copy_file(src, dst)
+    assert engine.is_unchanged(src, dst)
+
+    os.utime(dst, ns=(1, 1))                   # Same size, other mtime
+    assert not engine.is_unchanged(src, dst)
+    assert engine.is_unchanged(src, dst, use_hash=True)
+    assert os.stat(dst).st_mtime_ns == os.stat(src).st_mtime_ns  # Repaired for the cheap check
+    _write(dst, b"CONTENT")
+    assert not engine.is_unchanged(src, dst, use_hash=True)
+    _write(dst, b"longer content")
+    assert not engine.is_unchanged(src, dst, use_hash=True)
+
+    os.symlink("target", tmp_path / "link")
+    os.symlink("target", tmp_path / "same")
+    os.symlink("other", tmp_path / "other")
+    assert engine.is_unchanged(str(tmp_path / "link"), str(tmp_path / "same"))
+    assert not engine.is_unchanged(str(tmp_path / "link"), str(tmp_path / "other"))
@@ -0,0 +1,104 @@
+import queue
+import threading
+
+import pytest
+
+from event_bus import EventBus
+
+
+def test_progress_is_coalesced_per_job():
+    bus = EventBus()
+    for done in range(5):
+        bus.put(("OP_PROGRESS", ("job-a", done, 10)))
+        bus.put(("OP_PROGRESS", ("job-b", done * 2, 20)))
+
+    events = bus.drain()
+    assert sorted(events) == [("OP_PROGRESS", ("job-a", 4, 10)), ("OP_PROGRESS", ("job-b", 8, 20))]
+    assert bus.drain() == []
+
+
+def test_metrics_keep_only_the_latest_value():
+    bus = EventBus()
+    bus.put(("METRICS_UPDATE", {"n": 1}))
+    bus.put(("METRICS_UPDATE", {"n": 2}))
+    assert bus.drain() == [("METRICS_UPDATE", {"n": 2})]
+
+
+def test_control_and_result_events_are_never_dropped():
+    bus = EventBus(capacity=2)
+    for i in range(5):
+        bus.put(("LOG", f"line {i}"))
+        bus.put(("TASK_RESULT", {"fp": i, "digest": "d"}))
+    bus.put(("TASK_DONE", "job"))
+
+    events = bus.drain()
+    assert [d["fp"] for t, d in events if t == "TASK_RESULT"] == [0, 1, 2, 3, 4]
+    assert [d for t, d in events if t == "LOG"][:2] == ["line 0", "line 1"]
+    assert events[-2] == ("TASK_DONE", "job")
+    assert events[-1] == ("LOG", "3 events dropped (consumer too slow)")
+
+
+def test_drain_max_items_leaves_the_rest_in_order():
+    bus = EventBus()
+    for i in range(5):
+        bus.put(("STATE_CHANGE", i))
+    bus.put(("OP_PROGRESS", ("job", 1, 2)))
+
+    assert bus.drain(max_items=2) == [("STATE_CHANGE", 0), ("STATE_CHANGE", 1), ("OP_PROGRESS", ("job", 1, 2))]
+    assert bus.drain() == [("STATE_CHANGE", 2), ("STATE_CHANGE", 3), ("STATE_CHANGE", 4)]
+
+
+def test_lossy_capacity_is_freed_by_partial_drains():
+    bus = EventBus(capacity=3)
+    for i in range(3):
+        bus.put(("LOG", i))
+    bus.drain(max_items=2)
+    bus.put(("LOG", 3))
+    bus.put(("LOG", 4))
+    assert bus.drain() == [("LOG", 2), ("LOG", 3), ("LOG", 4)]
+
+
+def test_queue_compatible_get():
+    bus = EventBus()
+    with pytest.raises(queue.Empty):
+        bus.get_nowait()
+    bus.put(("OP_PROGRESS", ("job", 1, 2)))
+    bus.put(("STATE_CHANGE", "RUNNING"))
+    assert bus.get() == ("STATE_CHANGE", "RUNNING")
+    assert bus.get() == ("OP_PROGRESS", ("job", 1, 2))
+    assert bus.empty()
+
+
+def test_wait_wakes_on_put():
+    bus = EventBus()
+    threading.Timer(0.05, bus.put, args=(("STATE_CHANGE", "IDLE"),)).start()
+    assert bus.wait(timeout=5)
+    assert not EventBus().wait(timeout=0.01)
+
+
+def test_results_are_folded_per_job_above_the_high_water_mark():
+    bus = EventBus(ordered_capacity=10)
+    for i in range(10000):
+        bus.put(("TASK_RESULT", {"fp": i, "parent": f"job-{i % 2}", "digest": "d"}))
+        assert bus.qsize() <= 12   # The high-water mark plus one folded count per job
+    bus.put(("TASK_DONE", "job-0"))
+
+    events = bus.drain()
+    assert [d["fp"] for t, d in events if t == "TASK_RESULT"] == list(range(10))
+    assert events[10:] == [("TASK_RESULTS_FOLDED", {"job": "job-0", "count": 4995}),
+                           ("TASK_RESULTS_FOLDED", {"job": "job-1", "count": 4995}),
+                           ("TASK_DONE", "job-0")]
+
+    bus.put(("TASK_RESULT", {"fp": "next", "parent": "job-1", "digest": "d"}))
+    assert bus.drain() == [("TASK_RESULT", {"fp": "next", "parent": "job-1", "digest": "d"})]
+
+
+def test_a_taken_fold_is_not_updated_again():
+    bus = EventBus(ordered_capacity=1)
+    bus.put(("STATE_CHANGE", "RUNNING"))
+    bus.put(("TASK_RESULT", {"fp": 1, "parent": "job", "digest": "d"}))
+    assert bus.drain(max_items=2) == [("STATE_CHANGE", "RUNNING"), ("TASK_RESULTS_FOLDED", {"job": "job", "count": 1})]
+    bus.put(("STATE_CHANGE", "PAUSED"))
+    bus.put(("TASK_RESULT", {"fp": 2, "parent": "job", "digest": "d"}))
+    assert bus.get() == ("STATE_CHANGE", "PAUSED")
+    assert bus.get() == ("TASK_RESULTS_FOLDED", {"job": "job", "count": 1})
@@ -0,0 +1,111 @@
+import time
+
+from copy_manager import CopyExecutorController
+from fingerprints import (RETAIN_FOREVER, BloomFilter, DIGEST_SIZE, FingerprintStore, INITIAL_SLOTS, MAX_LOAD,
+                          fingerprint)
+
+
+def _digests(n, tag="f"):
+    return [fingerprint(f"/src/{tag}{i}", "/dst", "COPY") for i in range(n)]
+
+
+def test_duplicates_are_rejected_until_the_job_is_released():
+    store = FingerprintStore()
+    a, b = _digests(2)
+    assert store.add(a, "job") and store.add(b, "other")
+    assert not store.add(a, "other")
+    assert len(store) == 2
+
+    store.release_job("job")
+    assert a not in store and b in store
+    assert store.add(a, "again")  # The dead slot is reused
+
+
+def test_timed_retention_and_retain_forever():
+    store = FingerprintStore(retention=10)
+    [a] = _digests(1)
+    store.add(a, "job")
+    store.release_job("job", now=100)
+    store.expire_due(now=109)
+    assert a in store
+    store.expire_due(now=110)
+    assert a not in store and len(store) == 0
+
+    store = FingerprintStore(retention=RETAIN_FOREVER)
+    store.add(a, "job")
+    store.release_job("job")
+    store.expire_due(now=10 ** 9)
+    assert a in store
+
+
+def test_rebuild_keeps_live_entries_and_reclaims_dead_ones():
+    store = FingerprintStore()
+    dead = _digests(1000, "dead")
+    for digest in dead:
+        store.add(digest, "dead")
+    store.release_job("dead")
+    live = _digests(int(INITIAL_SLOTS * MAX_LOAD), "live")
+    for digest in live:
+        store.add(digest, "live")
+
+    assert store._slots > INITIAL_SLOTS
+    assert len(store) == len(live)
+    assert all(digest in store for digest in live)
+    assert not any(digest in store for digest in dead)
+
+
+def test_spill_holds_entries_beyond_the_memory_limit(tmp_path):
+    store = FingerprintStore(max_memory_entries=100, spill_path=str(tmp_path / "spill.db"))
+    first, second = _digests(150, "a"), _digests(50, "b")
+    for digest in first:
+        store.add(digest, "a")
+    for digest in second:
+        store.add(digest, "b")
+
+    assert store._spilled == 101 and len(store) == 200
+    assert all(digest in store for digest in first + second)
+    assert not store.add(first[0], "b")   # Found in the spill file
+
+    store.release_job("a")
+    assert len(store) == 50 and store._spilled == 0
+    assert first[0] not in store and all(digest in store for digest in second)
+    store.close()
+
+
+def test_fingerprint_is_fixed_width_and_deterministic():
+    digest = fingerprint("/src/a", "/dst", "COPY")
+    assert len(digest) == DIGEST_SIZE
+    assert digest == fingerprint("/src/a", "/dst", "COPY")
+    assert digest != fingerprint("/src/a", "/dst", "MOVE")
+
+
+def test_bloom_filter_has_no_false_negatives():
+    digests = _digests(5000)
+    bloom = BloomFilter(len(digests))
+    for digest in digests:
+        bloom.add(digest)
+    assert all(digest in bloom for digest in digests)
+    others = _digests(5000, "other")
+    assert sum(digest in bloom for digest in others) < len(others) * 0.05
+
+
+def test_finished_job_can_be_queued_again(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.txt").write_bytes(b"data")
+    dst = tmp_path / "dst"
+    dst.mkdir()
+    controller = CopyExecutorController(max_workers=2)
+    manager = controller.manager
+    try:
+        assert manager.add_task(str(src), str(dst))[0]
+        assert not manager.add_task(str(src), str(dst))[0]   # Still queued
+        controller.start()
+        deadline = time.time() + 30
+        while manager.get_status() != (manager.STATE_IDLE, 0):
+            manager.progress_channel.drain()
+            assert time.time() < deadline, "copy did not finish"
+            time.sleep(0.01)
+        assert manager.add_task(str(src), str(dst))[0]   # RETAIN_UNTIL_DONE released the job's entries
+    finally:
+        controller.stop()
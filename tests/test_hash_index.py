@@ -0,0 +1,63 @@
+import os
+import time
+
+from hash_index import HashIndex
+
+
+def _stat(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return os.stat(path)
+
+
+def test_hit_miss_and_stale_entries(tmp_path):
+    index = HashIndex(str(tmp_path / "index.db"))
+    st = _stat(tmp_path / "a", b"one")
+    assert index.lookup(st) is None
+    index.store(st, "d1")
+    assert index.lookup(st) == "d1"
+    assert (index.hits, index.misses) == (1, 1)
+
+    os.utime(tmp_path / "a", ns=(1, st.st_mtime_ns + 1))
+    changed = os.stat(tmp_path / "a")
+    assert index.lookup(changed) is None
+    index.store(changed, "d2")      # Replaces the entry of the same inode
+    assert len(index) == 1 and index.lookup(st) is None
+    index.close()
+
+
+def test_get_digest_hashes_only_on_a_miss_and_persists(tmp_path):
+    path = str(tmp_path / "index.db")
+    calls = []
+
+    def hasher(p):
+        calls.append(p)
+        return "digest"
+
+    _stat(tmp_path / "f", b"data")
+    index = HashIndex(path)
+    assert index.get_digest(str(tmp_path / "f"), hasher) == "digest"
+    assert index.get_digest(str(tmp_path / "f"), hasher) == "digest"
+    assert len(calls) == 1
+    index.close()
+
+    index = HashIndex(path)
+    assert len(index) == 1
+    assert index.get_digest(str(tmp_path / "f"), hasher) == "digest" and len(calls) == 1
+    index.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    index = HashIndex(":memory:", max_entries=10)
+    stats = [_stat(tmp_path / f"f{i}", b"%d" % i) for i in range(10)]
+    for i, st in enumerate(stats):
+        index.store(st, f"d{i}")
+        time.sleep(0.001)
+    index.lookup(stats[0])          # Recently used: survives
+    index.store(_stat(tmp_path / "new", b"new"), "new")
+
+    assert len(index) == 9          # Evicted down to 90% of max_entries
+    assert index.lookup(stats[0]) == "d0"
+    assert index.lookup(stats[1]) is None and index.lookup(stats[2]) is None
+    assert index.lookup(stats[3]) == "d3"
+    index.close()
@@ -0,0 +1,51 @@
+import os
+
+import blake3
+import pytest
+
+import hashing
+from hashing import (BACKEND_BUFFERED, BACKEND_MMAP, BACKEND_SMALL, BACKEND_THREADED, hash_many, hash_path,
+                     select_backend)
+from utils import hash_file
+
+BACKENDS = (BACKEND_SMALL, BACKEND_BUFFERED, BACKEND_MMAP, BACKEND_THREADED)
+
+
+@pytest.mark.parametrize("size", [0, 1, hashing.BUFFER_SIZE - 1, hashing.BUFFER_SIZE * 3 + 5])
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_every_backend_matches_a_one_shot_digest(tmp_path, backend, size):
+    data = os.urandom(size)
+    path = tmp_path / "f"
+    path.write_bytes(data)
+    assert hash_path(str(path), backend) == blake3.blake3(data).hexdigest()
+
+
+def test_mmap_fallback_handles_empty_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(hashing, "_HAS_UPDATE_MMAP", False)
+    (tmp_path / "empty").write_bytes(b"")
+    (tmp_path / "data").write_bytes(b"abc")
+    assert hash_path(str(tmp_path / "empty"), BACKEND_MMAP) == blake3.blake3(b"").hexdigest()
+    assert hash_path(str(tmp_path / "data"), BACKEND_MMAP) == blake3.blake3(b"abc").hexdigest()
+
+
+def test_backend_selection_by_size():
+    assert select_backend(0) == BACKEND_SMALL
+    assert select_backend(hashing.SMALL_FILE_LIMIT) == BACKEND_SMALL
+    assert select_backend(hashing.SMALL_FILE_LIMIT + 1) == BACKEND_BUFFERED
+    assert select_backend(hashing.MMAP_THRESHOLD) == BACKEND_MMAP
+    assert select_backend(hashing.THREADED_THRESHOLD) == BACKEND_THREADED
+
+
+def test_hash_many_reports_unreadable_files_as_none(tmp_path):
+    paths = []
+    for i in range(50):
+        path = tmp_path / f"f{i}"
+        path.write_bytes(b"%d" % i)
+        paths.append(str(path))
+    paths.append(str(tmp_path / "missing"))
+
+    results = dict(hash_many(iter(paths), max_workers=2))
+    assert set(results) == set(paths)
+    assert results[str(tmp_path / "missing")] is None
+    assert results[paths[7]] == blake3.blake3(b"7").hexdigest()
+    assert hash_file(str(tmp_path / "missing")) is None
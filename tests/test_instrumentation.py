@@ -0,0 +1,72 @@
+import threading
+
+from instrumentation import Histogram, Instruments, _bucket, _bucket_high, BUCKETS, SUB_COUNT
+
+
+def test_buckets_are_monotonic_and_bound_their_values():
+    previous = -1
+    for value in list(range(200)) + [10 ** k for k in range(3, 19)] + [2 ** 63 - 1]:
+        index = _bucket(value)
+        assert 0 <= index < BUCKETS
+        assert index >= previous
+        previous = index
+        assert value <= _bucket_high(index)
+        if index:
+            assert value > _bucket_high(index - 1)
+
+
+def test_small_values_are_exact():
+    for value in range(SUB_COUNT):
+        assert _bucket_high(_bucket(value)) == value
+
+
+def test_percentiles_within_relative_error():
+    hist = Histogram()
+    for value in range(1, 100001):
+        hist.record(value * 1000)
+    assert hist.count == 100000 and hist.max == 100000000
+    for fraction in (0.5, 0.9, 0.99):
+        exact = fraction * 100000 * 1000
+        assert abs(hist.percentile(fraction) - exact) / exact <= 0.0625
+    assert hist.percentile(1.0) == hist.max
+
+
+def test_merge_and_cumulative():
+    a, b = Histogram(), Histogram()
+    for v in (1, 5, 100):
+        a.record(v)
+    b.record(1000)
+    a.merge(b)
+    assert (a.count, a.total, a.max) == (4, 1106, 1000)
+    # A bucket is counted under a bound once its whole range is: 100 shares a bucket with 101..103
+    assert a.cumulative([0, 5, 100, 103, 10 ** 9]) == [0, 2, 2, 3, 4]
+
+
+def test_exited_threads_are_folded_into_one_aggregate():
+    instruments = Instruments()
+
+    def record():
+        for _ in range(10):
+            instruments.record("scan", 1000)
+
+    for _ in range(30):
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    assert instruments.recording_threads() == 0
+    assert instruments.stage_histograms()["scan"].count == 30 * 4 * 10
+
+
+def test_worker_accounting():
+    instruments = Instruments()
+    stats = instruments.worker(0)
+    instruments.worker_idle(stats, 5000)
+    cpu = instruments.worker_start(stats)
+    assert instruments.busy_workers() == 1
+    instruments.worker_done(stats, cpu)
+    snapshot = instruments.snapshot()
+    assert snapshot["workers"][0]["tasks"] == 1 and snapshot["workers"][0]["state"] == "idle"
+    assert snapshot["stages"]["queue_wait"]["count"] == 1
@@ -0,0 +1,150 @@
+import os
+import time
+
+import blake3
+
+from copy_manager import CopyExecutorController
+from copy_engine import DEDUP_HARDLINK, VERIFY_SOURCE
+from journal import JobJournal
+from queue_manager import QueueManager
+
+
+def _wait_idle(controller, timeout=30):
+    manager = controller.manager
+    deadline = time.time() + timeout
+    while manager.get_status() != (manager.STATE_IDLE, 0):
+        manager.progress_channel.drain()
+        assert time.time() < deadline, "copy did not finish"
+        time.sleep(0.01)
+
+
+def test_unfinished_units_and_checkpoints_are_restored(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = JobJournal(path)
+    journal.job_added({"fp": "job", "source": "/s", "destination": "/d", "type": "COPY", "priority": "high"})
+    journal.units_added([
+        {"fp": "u1", "parent": "job", "type": "FILE", "source": "/s/a", "destination": "/d/s/a", "size": 10},
+        {"fp": "u2", "parent": "job", "type": "RANGE", "source": "/s/big", "destination": "/d/s/big",
+         "size": 100, "offset": 100},
+        {"fp": "u3", "parent": "job", "type": "BATCH", "source": "/s/x", "destination": "/d/s/x", "size": 3,
+         "files": [("/s/x", "/d/s/x", 1), ("/s/y", "/d/s/y", 2)]},
+        {"fp": "u4", "parent": "job", "type": "DEDUP", "source": "/s/p", "destination": "/d/s/p", "size": 8,
+         "files": [("/s/p", "/d/s/p", 4), ("/s/q", "/d/s/q", 4)], "digest": "abcd", "mtimes": [5, 6]},
+    ])
+    journal.job_planned("job")
+    journal.unit_done("u1")
+    journal.checkpoint("u2", 64)
+    journal.close()
+
+    [(job, units)] = JobJournal(path).load_unfinished()
+    assert job["planned"] and job["priority"] == "high"
+    assert (job["done_bytes"], job["items_done"]) == (10, 1)
+    units = {u["fp"]: u for u in units}
+    assert set(units) == {"u2", "u3", "u4"}
+    assert units["u2"]["offset"] == 100 and units["u2"]["done_bytes"] == 64
+    assert units["u3"]["files"] == [("/s/x", "/d/s/x", 1), ("/s/y", "/d/s/y", 2)]
+    assert "digest" not in units["u3"]
+    assert (units["u4"]["digest"], units["u4"]["mtimes"]) == ("abcd", [5, 6])
+
+
+def test_finished_jobs_are_compacted_but_keep_their_digests(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = JobJournal(path)
+    journal.job_added({"fp": "job", "source": "/s", "destination": "/d", "type": "COPY"})
+    unit = {"fp": "u1", "parent": "job", "type": "FILE", "source": "/s/a", "destination": "/d/s/a", "size": 10}
+    journal.units_added([unit])
+    journal.job_planned("job")
+    journal.unit_verified(unit, "abc")
+    journal.unit_done("u1")
+    journal.job_done("job")
+    journal.close()
+
+    journal = JobJournal(path)
+    assert journal.load_unfinished() == []
+    assert journal.load_digests("job") == [{"job": "job", "source": "/s/a", "destination": "/d/s/a",
+                                            "offset": None, "size": 10, "digest": "abc"}]
+
+
+def test_interrupted_planning_comes_back_without_units(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = JobJournal(path)
+    journal.job_added({"fp": "job", "source": "/s", "destination": "/d", "type": "SYNC"})
+    journal.units_added([{"fp": "u1", "parent": "job", "type": "FILE", "source": "/s/a",
+                          "destination": "/d/s/a", "size": 1}])
+    journal.close()
+
+    [(job, units)] = JobJournal(path).load_unfinished()
+    assert not job["planned"] and units == []
+
+
+def test_restored_range_continues_from_its_checkpoint(tmp_path):
+    path = str(tmp_path / "journal.db")
+    job = "00" * 16  # Fingerprints are hex digests
+    journal = JobJournal(path)
+    journal.job_added({"fp": job, "source": "/s", "destination": "/d", "type": "COPY"})
+    journal.units_added([
+        {"fp": "11" * 16, "parent": job, "type": "FILE", "source": "/s/a", "destination": "/d/s/a", "size": 10},
+        {"fp": "22" * 16, "parent": job, "type": "RANGE", "source": "/s/big", "destination": "/d/s/big",
+         "size": 100, "offset": 200},
+    ])
+    journal.job_planned(job)
+    journal.unit_done("11" * 16)
+    journal.checkpoint("22" * 16, 64)
+    journal.close()
+
+    manager = QueueManager(journal=JobJournal(path))
+    [unit] = manager.restore_from_journal()
+    assert (unit["offset"], unit["size"], unit["checkpoint"]) == (264, 36, 64)
+    assert manager.get_job_progress(job) == (10 + 64, 10 + 100)
+    assert manager.queue_depth() == 1
+    manager.journal.close()
+
+
+def test_verified_copy_records_digests_in_the_journal(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    data = os.urandom(300000)
+    (src / "file").write_bytes(data)
+    dst = tmp_path / "dst"
+    dst.mkdir()
+    path = str(tmp_path / "journal.db")
+
+    controller = CopyExecutorController(max_workers=2, journal_path=path, verify=VERIFY_SOURCE,
+                                        split_threshold=200000, split_chunk_size=128 * 1024)
+    controller.submit_task(str(src), str(dst))
+    controller.start()
+    _wait_idle(controller)
+    controller.stop()
+
+    digests = sorted(JobJournal(path).load_digests(), key=lambda d: d["offset"])
+    assert [(d["offset"], d["size"]) for d in digests] == [(0, 131072), (131072, 131072), (262144, 37856)]
+    for d in digests:
+        assert d["digest"] == blake3.blake3(data[d["offset"]:d["offset"] + d["size"]]).hexdigest()
+
+
+def test_restored_dedup_unit_checks_its_journaled_digest(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    for name in ("a", "b"):
+        (src / name).write_bytes(b"same content")
+    dst = tmp_path / "dst" / "src"
+    dst.mkdir(parents=True)   # Made while the job was planned
+    path = str(tmp_path / "journal.db")
+    job = "00" * 16
+    journal = JobJournal(path)
+    journal.job_added({"fp": job, "source": str(src), "destination": str(tmp_path / "dst"), "type": "COPY"})
+    journal.units_added([{"fp": "11" * 16, "parent": job, "type": "DEDUP", "source": str(src / "a"),
+                          "destination": str(dst / "a"), "size": 24,
+                          "files": [(str(src / n), str(dst / n), 12) for n in ("a", "b")],
+                          "digest": blake3.blake3(b"same content").hexdigest()}])
+    journal.job_planned(job)
+    journal.close()
+    (src / "a").write_bytes(b"SAME CONTENT")   # Changed while the copier was down
+
+    controller = CopyExecutorController(max_workers=1, journal_path=path, verify=VERIFY_SOURCE, dedup=DEDUP_HARDLINK)
+    controller.start()
+    _wait_idle(controller)
+    controller.stop()
+
+    assert (dst / "a").read_bytes() == b"SAME CONTENT"
+    assert (dst / "b").read_bytes() == b"same content"
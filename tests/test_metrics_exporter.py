@@ -0,0 +1,74 @@
+import re
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from copy_manager import CopyExecutorController
+from metrics_exporter import CONTENT_TYPE, PREFIX
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="[^"]*",?)*\})? (\S+)$')
+SUFFIXES = {"counter": ("_total",), "gauge": ("",), "stateset": ("",), "histogram": ("_bucket", "_count", "_sum")}
+
+
+def parse_openmetrics(text: str) -> dict:
+    """family -> (type, [(sample name, labels, value)]); asserts the exposition format rules used here."""
+    assert text.endswith("# EOF\n") and text.count("# EOF") == 1
+    families = {}
+    current = None
+    for line in text.splitlines()[:-1]:
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert name not in families, f"family {name} declared twice"
+            families[name] = (kind, [])
+            current = name
+        elif line.startswith("# HELP "):
+            assert line.split(" ")[2] == current
+        else:
+            match = SAMPLE.match(line)
+            assert match, f"bad sample line {line!r}"
+            name, labels, value = match.group(1), match.group(2) or "", float(match.group(3))
+            kind, samples = families[current]
+            assert name[len(current):] in SUFFIXES[kind] and name.startswith(current), line
+            samples.append((name, dict(re.findall(r'(\w+)="([^"]*)"', labels)), value))
+    return families
+
+
+def test_scrape_is_valid_openmetrics(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    for i in range(5):
+        (src / f"f{i}").write_bytes(b"x" * 1000)
+    controller = CopyExecutorController(max_workers=2, metrics_port=0)
+    try:
+        controller.submit_task(str(src), str(tmp_path / "dst"))
+        controller.start()
+        manager = controller.manager
+        deadline = time.time() + 30
+        while manager.get_status() != (manager.STATE_IDLE, 0):
+            manager.progress_channel.drain()
+            assert time.time() < deadline
+            time.sleep(0.01)
+        controller._update_metrics()
+
+        url = f"http://127.0.0.1:{controller.exporter.port}"
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.headers["Content-Type"] == CONTENT_TYPE
+            families = parse_openmetrics(response.read().decode("utf-8"))
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/other")
+    finally:
+        controller.stop()
+
+    assert families[f"{PREFIX}_bytes"] == ("counter", [(f"{PREFIX}_bytes_total", {}, 5000)])
+    assert families[f"{PREFIX}_files"][1][0][2] == 5
+    states = {labels[f"{PREFIX}_state"]: value for _, labels, value in families[f"{PREFIX}_state"][1]}
+    assert states["IDLE"] == 1 and sum(states.values()) == 1
+
+    kind, samples = families[f"{PREFIX}_stage_latency_seconds"]
+    assert kind == "histogram" and samples
+    for stage in {labels["stage"] for _, labels, _ in samples}:
+        buckets = [value for name, labels, value in samples if name.endswith("_bucket") and labels["stage"] == stage]
+        count = [value for name, labels, value in samples if name.endswith("_count") and labels["stage"] == stage]
+        assert buckets == sorted(buckets) and buckets[-1] == count[0]
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+
+import pytest
+
+from copy_manager import CopyExecutorController
+from queue_manager import QueueManager
+
+
+def _take(manager, worker_id, taken):
+    taken[worker_id] = manager.get_next_task(worker_id)
+
+
+def test_parked_workers_do_not_swallow_wakeups(tmp_path):
+    manager = QueueManager()
+    manager.set_worker_limit(2)
+    manager.add_task(str(tmp_path / "src"), str(tmp_path / "dst"))
+    assert manager.resume()
+    plan = manager.get_next_task(0)  # Held, as by a worker planning the job
+
+    taken = {}
+    threads = []
+    for worker_id in (2, 3, 1):  # Parked workers wait first and would be notified first
+        thread = threading.Thread(target=_take, args=(manager, worker_id, taken), daemon=True)
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.1)
+
+    manager.add_subtasks(plan["fp"], [{"type": "FILE", "source": str(tmp_path / "src" / "a"),
+                                       "destination": str(tmp_path / "dst" / "src" / "a"), "size": 1}])
+    threads[-1].join(5)
+    try:
+        assert taken.get(1) is not None and taken[1]["type"] == "FILE"
+        assert 2 not in taken and 3 not in taken
+    finally:
+        manager.shutdown()
+        for thread in threads:
+            thread.join(5)
+    assert taken[2] is None and taken[3] is None
+
+
+def _wait_idle(controller, timeout=30):
+    manager = controller.manager
+    deadline = time.time() + timeout
+    while manager.get_status() != (manager.STATE_IDLE, 0):
+        manager.progress_channel.drain()
+        assert time.time() < deadline, "copy did not finish"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("options", [{}, {"small_file_threshold": None}, {"dedup": "hardlink"}],
+                         ids=["batch", "file", "dedup"])
+def test_mirror_limits_are_charged(tmp_path, options):
+    src = tmp_path / "src"
+    src.mkdir()
+    for i in range(3):
+        (src / f"f{i}").write_bytes(b"same content" * 100)
+    main, mirror = tmp_path / "main", tmp_path / "mirror"
+    main.mkdir()
+    mirror.mkdir()
+
+    controller = CopyExecutorController(max_workers=1, **options)
+    controller.set_limit(destination=str(mirror), bytes_per_sec=10 ** 12, files_per_sec=10 ** 9)
+    charged = {"bytes": 0, "files": 0}
+    consume = controller.throttle.consume
+
+    def record(limits, nbytes=0, nfiles=0):
+        if any(limit.target == str(mirror) for limit in limits):
+            charged["bytes"] += nbytes
+            charged["files"] += nfiles
+        consume(limits, nbytes, nfiles)
+
+    controller.throttle.consume = record
+    controller.submit_task(str(src), [str(main), str(mirror)])
+    controller.start()
+    _wait_idle(controller)
+    controller.stop()
+
+    assert sorted(os.listdir(mirror / "src")) == ["f0", "f1", "f2"]
+    assert charged["files"] >= 3 and charged["bytes"] >= 1200
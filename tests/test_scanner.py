@@ -0,0 +1,61 @@
+import os
+import socket
+
+from scanner import TreeScanner, KIND_DIR, KIND_FILE, KIND_LINK, KIND_SPECIAL
+
+
+def _tree(tmp_path):
+    root = tmp_path / "root"
+    (root / "a" / "b").mkdir(parents=True)
+    (root / "top.txt").write_bytes(b"12345")
+    (root / "a" / "mid.txt").write_bytes(b"1")
+    (root / "a" / "b" / "deep.txt").write_bytes(b"1234567890")
+    os.symlink("top.txt", root / "link")
+    return root
+
+
+def test_scan_yields_every_entry_with_its_kind(tmp_path):
+    root = _tree(tmp_path)
+    entries = {os.path.relpath(e.path, root): e for e in TreeScanner(str(root), max_workers=3).scan()}
+
+    assert entries["."].kind == KIND_DIR
+    assert {k for k, e in entries.items() if e.kind == KIND_DIR} == {".", "a", os.path.join("a", "b")}
+    assert entries["top.txt"].kind == KIND_FILE and entries["top.txt"].size == 5
+    assert entries["link"].kind == KIND_LINK and entries["link"].size == 0
+
+
+def test_directory_is_yielded_before_its_children(tmp_path):
+    root = _tree(tmp_path)
+    seen = set()
+    for entry in TreeScanner(str(root), max_workers=4).scan():
+        parent = os.path.dirname(entry.path)
+        if entry.path != str(root):
+            assert parent in seen
+        if entry.kind == KIND_DIR:
+            seen.add(entry.path)
+
+
+def test_totals_count_files_and_bytes(tmp_path):
+    assert TreeScanner(str(_tree(tmp_path))).totals() == (4, 16)
+
+
+def test_special_files_are_classified_and_not_counted(tmp_path):
+    root = _tree(tmp_path)
+    os.mkfifo(root / "pipe")
+    sock = socket.socket(socket.AF_UNIX)
+    try:
+        sock.bind(str(root / "sock"))
+        scanner = TreeScanner(str(root))
+        kinds = {os.path.basename(e.path): e.kind for e in scanner.scan()}
+    finally:
+        sock.close()
+
+    assert kinds["pipe"] == KIND_SPECIAL and kinds["sock"] == KIND_SPECIAL
+    assert (scanner.files, scanner.bytes) == (4, 16)
+
+
+def test_unreadable_entries_are_reported_not_raised(tmp_path):
+    errors = []
+    missing = tmp_path / "missing"
+    assert list(TreeScanner(str(missing), on_error=errors.append).scan()) == []
+    assert len(errors) == 1 and isinstance(errors[0], FileNotFoundError)
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+from queue_manager import QueueManager
+from scheduler import FairScheduler, MIN_COST
+
+
+def _unit(job, i, size=MIN_COST):
+    return {"fp": f"{job}-{i}", "parent": job, "size": size}
+
+
+def _drain(scheduler, n):
+    return [scheduler.get()["parent"] for _ in range(n)]
+
+
+def test_jobs_share_in_proportion_to_their_weight():
+    scheduler = FairScheduler()
+    scheduler.add_job("low", "low")
+    scheduler.add_job("high", "high")
+    for i in range(200):
+        scheduler.put(_unit("low", i))
+        scheduler.put(_unit("high", i))
+
+    served = _drain(scheduler, 170)
+    assert served.count("high") == 16 * served.count("low")
+
+
+def test_units_of_a_job_stay_in_order_and_bytes_are_charged():
+    scheduler = FairScheduler()
+    scheduler.put(_unit("big", 0, 64 * MIN_COST))
+    scheduler.put(_unit("big", 1, 64 * MIN_COST))
+    for i in range(5):
+        scheduler.put(_unit("small", i))
+
+    order = [scheduler.get()["fp"] for _ in range(7)]
+    assert order[0] == "big-0"
+    assert order[1:6] == [f"small-{i}" for i in range(5)]  # big-0 cost as much as 64 small units
+    assert order[6] == "big-1"
+    assert scheduler.get() is None and scheduler.empty()
+
+
+def test_paused_job_is_held_and_rejoins_without_catching_up():
+    scheduler = FairScheduler()
+    for i in range(4):
+        scheduler.put(_unit("a", i))
+        scheduler.put(_unit("b", i))
+    assert scheduler.pause("a") and not scheduler.pause("a")
+    assert scheduler.is_paused("a")
+    assert (len(scheduler), scheduler.runnable()) == (8, 4)
+
+    assert _drain(scheduler, 3) == ["b", "b", "b"]
+    assert scheduler.resume("a") and not scheduler.resume("a")
+    assert scheduler.runnable() == 5
+    # "a" rejoins at the current virtual time: it alternates instead of taking the next four
+    assert _drain(scheduler, 3) == ["a", "b", "a"]
+
+
+def test_put_back_returns_units_to_the_front():
+    scheduler = FairScheduler()
+    for i in range(3):
+        scheduler.put(_unit("a", i))
+    taken = [scheduler.get(), scheduler.get()]
+    scheduler.put_back(taken)
+    assert [scheduler.get()["fp"] for _ in range(3)] == ["a-0", "a-1", "a-2"]
+
+
+def test_unknown_priority_is_rejected():
+    scheduler = FairScheduler()
+    with pytest.raises(ValueError):
+        scheduler.add_job("a", "whenever")
+    scheduler.add_job("a")
+    with pytest.raises(ValueError):
+        scheduler.set_priority("a", "whenever")
+    assert scheduler.set_priority("a", "urgent") and scheduler.priority("a") == "urgent"
+
+
+def test_priority_change_applies_from_the_next_unit():
+    scheduler = FairScheduler()
+    for i in range(40):
+        scheduler.put(_unit("a", i))
+        scheduler.put(_unit("b", i))
+    assert _drain(scheduler, 4) == ["a", "b", "a", "b"]
+    scheduler.set_priority("b", "urgent")   # 64 vs 4: b now gets 16 units per unit of a
+    served = _drain(scheduler, 34)
+    assert served.count("b") == 32 and served.count("a") == 2
+
+
+def test_removed_job_releases_its_units():
+    scheduler = FairScheduler()
+    for i in range(3):
+        scheduler.put(_unit("a", i))
+        scheduler.put(_unit("b", i))
+    scheduler.pause("b")
+    scheduler.remove_job("a")
+    scheduler.remove_job("b")
+    assert (len(scheduler), scheduler.runnable()) == (0, 0)
+    assert scheduler.get() is None
+
+
+def test_paused_job_is_held_back_by_the_queue_manager(tmp_path):
+    manager = QueueManager()
+    jobs = {}
+    for name in ("a", "b"):
+        manager.add_task(str(tmp_path / name), str(tmp_path / "dst"))
+    assert manager.resume()
+    for _ in range(2):
+        plan = manager.get_next_task()
+        name = os.path.basename(plan["source"])
+        jobs[name] = plan["fp"]
+        manager.add_subtasks(plan["fp"], [{"type": "FILE", "source": str(tmp_path / name / f"f{i}"),
+                                           "destination": str(tmp_path / "dst" / name / f"f{i}"), "size": 1}
+                                          for i in range(2)])
+    assert manager.pause_job(jobs["a"]) and not manager.pause_job(jobs["a"])
+
+    taken = [manager.get_next_task(), manager.get_next_task()]
+    assert {task["parent"] for task in taken} == {jobs["b"]}
+    assert manager.queue_depth() == 2   # a's units wait
+
+    assert manager.resume_job(jobs["a"])
+    assert manager.get_next_task()["parent"] == jobs["a"]
+    manager.shutdown()
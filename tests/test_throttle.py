@@ -0,0 +1,124 @@
+import datetime
+
+import pytest
+
+import throttle
+from throttle import MIN_CHUNK, Throttle, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(throttle.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_paces_consumers_at_the_rate(clock):
+    bucket = TokenBucket(100, burst_seconds=0.5)
+    assert bucket.reserve(10) == pytest.approx(0.1)
+    assert bucket.reserve(10) == pytest.approx(0.2)  # Debt accumulates
+    clock[0] += 0.2
+    assert bucket.reserve(10) == pytest.approx(0.1)
+
+
+def test_idle_bucket_banks_at_most_one_burst(clock):
+    bucket = TokenBucket(100, burst_seconds=0.5)
+    clock[0] += 60
+    assert bucket.reserve(50) == 0.0   # 0.5s of credit covers 50 tokens
+    assert bucket.reserve(10) == pytest.approx(0.1)
+
+
+def test_unlimited_bucket_and_rate_change(clock):
+    bucket = TokenBucket()
+    assert bucket.reserve(10 ** 9) == 0.0
+    bucket = TokenBucket(10)
+    assert bucket.reserve(100) == pytest.approx(10)
+    bucket.set_rate(1000)   # Debt taken at the old rate is forgiven
+    assert bucket.reserve(100) == pytest.approx(0.1)
+    bucket.set_rate(0)
+    assert bucket.reserve(100) == 0.0
+
+
+def test_deepest_destination_limit_applies(tmp_path):
+    limiter = Throttle()
+    limiter.set_limit(destination=str(tmp_path), bytes_per_sec=1000)
+    limiter.set_limit(destination=str(tmp_path / "inner"), files_per_sec=5)
+
+    [limit] = limiter.limits_for(__file__, str(tmp_path / "inner" / "f"))
+    assert limit.files.rate == 5 and limit.bytes.rate is None
+    [limit] = limiter.limits_for(__file__, str(tmp_path / "other"))
+    assert limit.bytes.rate == 1000
+    assert limiter.limits_for(__file__, str(tmp_path) + "-sibling") == []
+
+    limiter.set_limit(destination=str(tmp_path / "inner"))
+    [limit] = limiter.limits_for(__file__, str(tmp_path / "inner" / "f"))
+    assert limit.bytes.rate == 1000
+
+
+def test_schedule_window_overrides_and_wraps_midnight(tmp_path):
+    limiter = Throttle()
+    limiter.set_limit(destination=str(tmp_path), bytes_per_sec=1000, files_per_sec=10)
+    limiter.set_schedule([{"start": "22:00", "end": "06:00", "destination": str(tmp_path), "bytes_per_sec": 0}])
+
+    [limit] = limiter.limits_for(__file__, str(tmp_path / "f"))
+    limiter.tick(datetime.datetime(2024, 1, 1, 23, 30))
+    assert (limit.bytes.rate, limit.files.rate) == (None, 10)   # 0 lifts the byte limit, files keep their base
+    assert limit.origin == "schedule 22:00"
+    limiter.tick(datetime.datetime(2024, 1, 2, 5, 59))
+    assert limit.bytes.rate is None
+    limiter.tick(datetime.datetime(2024, 1, 2, 6, 0))
+    assert (limit.bytes.rate, limit.origin) == (1000, "base")
+
+
+def test_chunk_size_follows_slowest_byte_limit(tmp_path):
+    limiter = Throttle()
+    assert limiter.chunk_size(4 << 20) == 4 << 20
+    limiter.set_limit(destination=str(tmp_path), bytes_per_sec=20 << 20)
+    assert limiter.chunk_size(4 << 20) == int((20 << 20) * throttle.BURST_SECONDS)
+    limiter.set_limit(destination=str(tmp_path / "slow"), bytes_per_sec=1)
+    assert limiter.chunk_size(4 << 20) == MIN_CHUNK
+
+
+def test_consume_sleeps_for_the_most_constrained_limit(tmp_path, monkeypatch):
+    slept = []
+    monkeypatch.setattr(throttle.time, "sleep", slept.append)
+    limiter = Throttle()
+    limiter.set_limit(destination=str(tmp_path), bytes_per_sec=1000, files_per_sec=1)
+    limits = limiter.limits_for(__file__, str(tmp_path / "f"))
+
+    limiter.consume(limits, nbytes=100, nfiles=2)
+    assert len(slept) == 1
+    assert slept[0] == pytest.approx(2, abs=0.01)  # A new bucket has banked no credit yet
+    assert limiter.waited == pytest.approx(slept[0])
+
+
+def test_source_limit_matches_by_device(tmp_path):
+    limiter = Throttle()
+    limiter.set_limit(source=str(tmp_path), files_per_sec=3)
+    (tmp_path / "a").write_bytes(b"x")
+
+    [limit] = limiter.limits_for(str(tmp_path / "a"), "/elsewhere/a")
+    assert limit.scope == "source" and limit.files.rate == 3
+    assert limiter.limits_for(str(tmp_path / "missing"), "/elsewhere/a") == []
+
+
+def test_passing_no_rates_removes_a_limit(tmp_path):
+    limiter = Throttle()
+    limiter.set_limit(destination=str(tmp_path), bytes_per_sec=1000)
+    limiter.set_limit(destination=str(tmp_path))
+    assert limiter.limits_for(__file__, str(tmp_path / "f")) == []
+    assert limiter.snapshot()["limits"] == []
+
+
+def test_files_only_limit_keeps_full_chunks(tmp_path, monkeypatch):
+    slept = []
+    monkeypatch.setattr(throttle.time, "sleep", slept.append)
+    limiter = Throttle()
+    limiter.set_limit(destination=str(tmp_path), files_per_sec=10)
+    assert limiter.chunk_size(4 << 20) == 4 << 20
+    limits = limiter.limits_for(__file__, str(tmp_path / "f"))
+
+    limiter.consume(limits, nbytes=1 << 30)   # Bytes are free under a files-only limit
+    assert slept == []
+    limiter.consume(limits, nfiles=1)
+    assert slept and slept[0] == pytest.approx(0.1, abs=0.01)
@@ -0,0 +1,203 @@
+import os
+import time
+import datetime
+import threading
+
+BURST_SECONDS = 0.05     # Credit a bucket may bank while idle; keeps the rate steady instead of bursty
+MIN_CHUNK = 64 * 1024    # Smallest data chunk moved between two throttle checks
+
+SCOPE_DESTINATION = "destination"
+SCOPE_SOURCE = "source"
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every worker writing through it.
+    Consumers take tokens after moving data and are told how long to sleep,
+    so the tokens owed are paid back smoothly instead of in bursts.
+    A rate of None or 0 means unlimited.
+    """
+
+    def __init__(self, rate=None, burst_seconds=BURST_SECONDS):
+        self.rate = rate or None
+        self.burst_seconds = burst_seconds
+        self._lock = threading.Lock()
+        self._ready_at = time.monotonic()  # When the bucket is back to zero debt
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate or None
+            # Debt accrued at the old rate no longer applies
+            self._ready_at = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        """Takes `amount` tokens; returns the seconds the caller should wait to stay under the rate."""
+        with self._lock:
+            if not self.rate or amount <= 0:
+                return 0.0
+            now = time.monotonic()
+            self._ready_at = max(self._ready_at, now - self.burst_seconds) + amount / self.rate
+            return max(0.0, self._ready_at - now)
+
+
+class Limit:
+    """Bytes/sec and files/sec buckets for one destination path or source device."""
+
+    def __init__(self, scope: str, target: str, bytes_per_sec=None, files_per_sec=None):
+        self.scope = scope
+        self.target = target
+        self.bytes = TokenBucket(bytes_per_sec)
+        self.files = TokenBucket(files_per_sec)
+        self.base = (bytes_per_sec, files_per_sec)  # Applies outside every schedule window
+        self.origin = "base"
+
+    def apply(self, bytes_per_sec, files_per_sec, origin: str):
+        if (bytes_per_sec, files_per_sec) != (self.bytes.rate, self.files.rate):
+            self.bytes.set_rate(bytes_per_sec)
+            self.files.set_rate(files_per_sec)
+        self.origin = origin
+
+    def snapshot(self) -> dict:
+        return {"scope": self.scope, "target": self.target, "bytes_per_sec": self.bytes.rate,
+                "files_per_sec": self.files.rate, "origin": self.origin}
+
+
+def _parse_clock(value: str) -> int:
+    """'HH:MM' -> minutes since midnight."""
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class Throttle:
+    """
+    Rate limits per destination path and, optionally, per source device,
+    shared across all workers. Limits can be changed at any time with
+    set_limit(), or by a time-of-day schedule that tick() applies.
+    Schedule rules are dicts: {"start": "08:00", "end": "18:00",
+    "destination": path or "source": path, "bytes_per_sec": ..., "files_per_sec": ...};
+    a window whose end is before its start wraps past midnight. A rate left
+    out of a rule keeps its base value (0 lifts it for the window). Outside
+    every window a limit falls back to the rates given to set_limit().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits = {}       # (scope, key) -> Limit; key is an absolute path or a st_dev
+        self._schedule = []
+        self.waited = 0.0       # Total seconds workers slept because of a limit
+
+    @staticmethod
+    def _key(scope: str, path: str):
+        if scope == SCOPE_SOURCE:
+            return scope, os.stat(path).st_dev
+        return scope, os.path.abspath(path)
+
+    def set_limit(self, destination=None, source=None, bytes_per_sec=None, files_per_sec=None):
+        """
+        Sets the base limits for a destination folder (matches everything
+        written below it) or for the device holding `source`.
+        Passing no rates removes the limit.
+        """
+        scope, path = (SCOPE_SOURCE, source) if source is not None else (SCOPE_DESTINATION, destination)
+        key = self._key(scope, path)
+        with self._lock:
+            if not bytes_per_sec and not files_per_sec \
+                    and all(self._key(scope, path) != key for _, _, scope, path, _, _ in self._schedule):
+                self._limits.pop(key, None)
+                return
+            limit = self._limits.get(key)
+            if limit is None:
+                self._limits[key] = limit = Limit(scope, path)
+            limit.base = (bytes_per_sec or None, files_per_sec or None)
+            limit.apply(*limit.base, "base")
+        self.tick()
+
+    def set_schedule(self, rules: list):
+        """Replaces the time-of-day schedule (see the class docstring) and applies it immediately."""
+        parsed = []
+        for rule in rules:
+            scope, path = (SCOPE_SOURCE, rule["source"]) if "source" in rule else (SCOPE_DESTINATION, rule["destination"])
+            parsed.append((_parse_clock(rule["start"]), _parse_clock(rule["end"]), scope, path,
+                           rule.get("bytes_per_sec"), rule.get("files_per_sec")))
+        with self._lock:
+            self._schedule = parsed
+            for _, _, scope, path, _, _ in parsed:
+                key = self._key(scope, path)
+                if key not in self._limits:
+                    self._limits[key] = Limit(scope, path)
+        self.tick()
+
+    def tick(self, now=None):
+        """Applies whichever schedule window is active at `now` (a datetime; defaults to local time)."""
+        now = now or datetime.datetime.now()
+        minute = now.hour * 60 + now.minute
+        with self._lock:
+            active = {}
+            for start, end, scope, path, bytes_rate, files_rate in self._schedule:
+                inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+                if inside:
+                    active[self._key(scope, path)] = (bytes_rate, files_rate, f"schedule {start // 60:02d}:{start % 60:02d}")
+            for key, limit in self._limits.items():
+                if key in active:
+                    bytes_rate, files_rate, origin = active[key]
+                    limit.apply(limit.base[0] if bytes_rate is None else bytes_rate or None,
+                                limit.base[1] if files_rate is None else files_rate or None, origin)
+                else:
+                    limit.apply(*limit.base, "base")
+
+    def limits_for(self, source: str, destination: str) -> list:
+        """Limits that apply to a copy from source to destination (empty when unthrottled)."""
+        if not self._limits:
+            return []
+        matched = []
+        destination = os.path.abspath(destination)
+        src_dev = None
+        best = None
+        with self._lock:
+            limits = list(self._limits.items())
+        for (scope, key), limit in limits:
+            if scope == SCOPE_DESTINATION:
+                # The deepest configured folder containing the destination wins
+                if (destination == key or destination.startswith(key.rstrip(os.sep) + os.sep)) \
+                        and (best is None or len(key) > len(best[0])):
+                    best = (key, limit)
+            else:
+                if src_dev is None:
+                    try:
+                        src_dev = os.lstat(source).st_dev
+                    except OSError:
+                        src_dev = -1
+                if key == src_dev:
+                    matched.append(limit)
+        if best is not None:
+            matched.append(best[1])
+        return matched
+
+    def consume(self, limits: list, nbytes: int = 0, nfiles: int = 0):
+        """Charges moved data against each limit and sleeps as long as the most constrained one requires."""
+        wait = 0.0
+        for limit in limits:
+            if nbytes:
+                wait = max(wait, limit.bytes.reserve(nbytes))
+            if nfiles:
+                wait = max(wait, limit.files.reserve(nfiles))
+        if wait > 0:
+            with self._lock:
+                self.waited += wait
+            time.sleep(wait)
+
+    def chunk_size(self, default: int) -> int:
+        """
+        Largest chunk to move between throttle checks: about one burst window
+        of the slowest byte limit, so throttled copies advance in small steady steps.
+        """
+        with self._lock:
+            rates = [limit.bytes.rate for limit in self._limits.values() if limit.bytes.rate]
+        if not rates:
+            return default
+        return max(MIN_CHUNK, min(default, int(min(rates) * BURST_SECONDS)))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            limits = [limit.snapshot() for limit in self._limits.values()]
+        return {"limits": limits, "waited": round(self.waited, 3)}
@@ -1,24 +1,27 @@
 import os
 import unicodedata
-import blake3
 
-def hash_file(path):
+from hashing import hash_path, hash_many
+from scanner import TreeScanner
+
+def hash_file(path, backend=None):
     """
     Calculates the BLAKE3 hash of a file.
+    The hashing backend (single read, buffered, mmap, multithreaded) is picked
+    from the file size unless given explicitly; see hashing.select_backend.
     """
-    hasher = blake3.blake3()
     try:
-        with open(path, 'rb') as file:
-            while True:
-                chunk = file.read(8192)
-                if not chunk:
-                    break
-                hasher.update(chunk)
-        return hasher.hexdigest()
+        return hash_path(path, backend)
     except Exception as e:
         print(f"Error hashing file {path}: {e}")
         return None
 
+def hash_files(paths, max_workers=None):
+    """
+    Hashes many files concurrently. Returns a dict of path -> digest (None on error).
+    """
+    return dict(hash_many(paths, max_workers=max_workers))
+
 def normalize_path(file_path):
     """
     Normalizes a file path to handle unicode characters consistently.
@@ -32,7 +35,13 @@ def count_files(directory):
     """
     Counts the total number of files in a directory recursively.
     """
-    return sum([len(files) for r, d, files in os.walk(directory)])
+    return TreeScanner(directory).totals()[0]
+
+def scan_totals(directory):
+    """
+    Returns (file_count, total_bytes) of a directory tree using the parallel scanner.
+    """
+    return TreeScanner(directory).totals()
 
 def format_bytes(size):
     power = 2**10
@@ -43,6 +52,16 @@ def format_bytes(size):
         n += 1
     return f"{size:.2f} {power_labels[n]}"
 
+def parse_bytes(text):
+    """
+    Parses a size such as "512", "64K", "50MB" or "1.5G" (powers of 1024, like format_bytes).
+    """
+    text = str(text).strip().upper().rstrip("B")
+    units = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
 def format_time(seconds):
     if seconds is None or seconds < 0:
         return "--"